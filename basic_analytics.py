@@ -10,22 +10,47 @@ Basic functions to analyze market data
 # Imports
 import numpy as np
 import pandas as pd
-import importlib
 import datetime
 from datetime import timedelta
 
-import strack_utils as u
-importlib.reload(u)
-import strack_env as env
-importlib.reload(env)
-import stock_collector as collector
-importlib.reload(collector)
-import strack_risk_model as risk_mod
-importlib.reload(risk_mod)
-import strack_delivery as sms
-importlib.reload(sms)
+import sql_utils as stkl
+import parquet_store as pqs
+import storage_backend
+from minute_grid import MinuteGrid, OPEN, HIGH, LOW, CLOSE, VOLUME
+from lazy_import import lazy_module
+u = lazy_module("strack_utils")
+env = lazy_module("strack_env")
+collector = lazy_module("stock_collector")
+risk_mod = lazy_module("strack_risk_model")
+sms = lazy_module("strack_delivery")
 
 
+def _ticker_frames(master_df):
+    '''
+        yields (ticker, ticker dataframe) pairs
+        takes:
+            - master_df - dataframe with intraday data of all tickers or
+                iterable of per ticker dataframes
+                (e.g. sql_utils.iter_db_intraday(db, by='ticker'))
+    '''
+    if isinstance(master_df, pd.DataFrame):
+        master_df = [master_df]
+    for df in master_df:
+        for s, d in df.groupby('ticker', sort=False, observed=True):
+            yield s, d
+
+def _summary_store(data):
+    '''returns storage module with daily summaries of data (database path
+    or store directory of current backend, Database handle of either
+    backend) or None if data is not storage'''
+    if isinstance(data, stkl.Database):
+        return stkl
+    if isinstance(data, pqs.Database):
+        return pqs
+    if isinstance(data, str):
+        return storage_backend.storage()
+    return None
+
 def get_performers(m_start, m_end, master_df):
     '''
         Calculating return within period of trading hours
@@ -35,6 +60,8 @@ def get_performers(m_start, m_end, master_df):
             - m_end (int): minute to end (eg. 5 will end at X5 minute inclusive - 9:35)
             - master_df (DataFrame): intraday minute data for all tickers; columns:
             ['open', 'high', 'low', 'close', 'volume', 'ticker']
+            or iterable of per ticker DataFrames (full history in bounded memory),
+            e.g. sql_utils.iter_db_intraday(db, by='ticker')
                 
         Examples:
         [-1:0] - returns previous day close (15:59) and 9:30 data close minute calculated
@@ -53,9 +80,8 @@ def get_performers(m_start, m_end, master_df):
     cmp_m = pd.DataFrame(index = [tm_index_end])
 
     # iterating through tickers and making statistical dataframe
-    for s in master_df.ticker.unique():
+    for s, d in _ticker_frames(master_df): # GETTING stock data
         try:
-            d = master_df.loc[master_df['ticker'] == s] # GETTING stock data from db
             returns = []
             # appending returns for each date and calculating mean (incluides previous day closing price)
             p_dy = None
@@ -118,6 +144,8 @@ def get_volumers(m_start, m_end, master_df):
             - m_end (int): minute to end (eg. 5 will end at X5 minute inclusive - 9:35)
             - master_df (DataFrame): intraday minute data for all tickers; columns:
             ['open', 'high', 'low', 'close', 'volume', 'ticker']
+            or iterable of per ticker DataFrames (full history in bounded memory),
+            e.g. sql_utils.iter_db_intraday(db, by='ticker')
                 
         Examples:
         [-1:0] - returns previous day close (15:59) and 9:30 data close minute calculated
@@ -136,9 +164,8 @@ def get_volumers(m_start, m_end, master_df):
     cmp_m = pd.DataFrame(index = [tm_index_end])
     
     # iterating through tickers and making statistical dataframe
-    for s in master_df.ticker.unique():
+    for s, d in _ticker_frames(master_df): # GETTING stock data
         try:
-            d = master_df.loc[master_df['ticker'] == s] # GETTING stock data from db
             volumes = pd.Series(np.nan)
             # appending volumes for each date and calculating mean (incluides previous day closing volume)
             p_dy = None
@@ -436,10 +463,34 @@ def ohcl_day(data, ticker, day):
     '''
         returns ohcl data for ticker at given day
         takes:
-            data - master dataframe pandas
+            data - master dataframe pandas, MinuteGrid (array lookups) or
+                database path / store directory of current storage backend
+                or its Database handle (daily summary lookup)
             ticker - ticker
             day - datetime.date (pd.Timestamp(xxxx, x, x, x, x).date())
     '''
+    store = _summary_store(data)
+    if store != None:
+        try:
+            sm = store.get_db_daily_summary(data, ticker, day)
+            if sm == None or sm['open'] == None or sm['close'] == None:
+                raise IndexError("no 9:30 or 15:59 minute data")
+            return sm['open'], sm['high'], sm['close'], sm['low']
+        except Exception as ex:
+            print("Error: ohcl_day - Failed to fetch OHCL data for "+\
+                  "{} at {}: {}".format(ticker, day, ex))
+            return None
+    if isinstance(data, MinuteGrid):
+        try:
+            g = data.day(ticker, day)
+            opn, cle = g[0, OPEN], g[-1, CLOSE] # 9:30 open, 15:59 close
+            if np.isnan(opn) or np.isnan(cle):
+                raise IndexError("no 9:30 or 15:59 minute data")
+            return opn, np.nanmax(g[:, HIGH]), cle, np.nanmin(g[:, LOW])
+        except Exception as ex:
+            print("Error: ohcl_day - Failed to fetch OHCL data for "+\
+                  "{} at {}: {}".format(ticker, day, ex))
+            return None
     # taking specific date
     try:
         ind_df = data.loc[(data.index.date == day) & (data.ticker == ticker)].copy()
@@ -473,10 +524,25 @@ def avg_vol_day(data, ticker, day):
     '''
         returns volume average data for ticker at given day
         takes:
-            data - master dataframe pandas
+            data - master dataframe pandas, MinuteGrid (array lookups) or
+                database path / store directory of current storage backend
+                or its Database handle (daily summary lookup)
             ticker - ticker
             day - datetime.date (pd.Timestamp(xxxx, x, x, x, x).date())
     '''
+    store = _summary_store(data)
+    if store != None:
+        try:
+            return int(store.get_db_daily_summary(data, ticker, day)['avg_volume'])
+        except Exception as ex:
+            print("Error: avg_vol_day - Failed to get data for {} at {}: {}".format(ticker, day, ex))
+            return None
+    if isinstance(data, MinuteGrid):
+        try:
+            return int(np.nanmean(data.day(ticker, day)[:, VOLUME]))
+        except Exception as ex:
+            print("Error: avg_vol_day - Failed to get data for {} at {}: {}".format(ticker, day, ex))
+            return None
     # taking specific date
     try:
         ind_df = data.loc[(data.index.date == day) & (data.ticker == ticker)].copy()
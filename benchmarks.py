@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17, 2026
+
+Benchmarks for data collection functions
+
+Usage:
+    python benchmarks.py decode [--sizes 10000 100000 1000000] [--legacy-max 100000]
+    python benchmarks.py collect [--tickers 20] [--days 5] [--latency 0.01] [--p-429 0.01]
+    python benchmarks.py write [--tickers 200] [--days 10]
+
+@author: vyachez
+"""
+# Imports
+import numpy as np
+import pandas as pd
+import argparse
+import datetime
+import multiprocessing
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+
+import data_loader as dl
+import polygon_standin as standin
+import sql_utils as stkl
+
+
+def synthetic_polygon_bars(n, start=datetime.datetime(2020, 1, 2, 9, 30), seed=0):
+    '''
+        Generates 'n' synthetic Polygon minute aggregates ('results' list format)
+        takes:
+            - n - int - number of bars
+            - start - datetime.datetime() - first bar time
+            - seed - int - random seed for deterministic output
+    '''
+    rng = np.random.default_rng(seed)
+    t0 = int(start.timestamp() * 1000)
+    close = 100 + np.cumsum(rng.normal(0, 0.05, n))
+    opn = close + rng.normal(0, 0.02, n)
+    high = np.maximum(opn, close) + rng.random(n) * 0.05
+    low = np.minimum(opn, close) - rng.random(n) * 0.05
+    vol = rng.integers(100, 50000, n)
+    return [{'v': int(vol[i]), 'o': float(opn[i]), 'c': float(close[i]),
+             'h': float(high[i]), 'l': float(low[i]), 't': t0 + i * 60000,
+             'n': 1} for i in range(n)]
+
+def legacy_decode_polygon_aggs(results, ticker):
+    '''
+        Row by row decoding as used by get_ticker_polygon() before
+        decode_polygon_aggs() (kept here for comparison only)
+    '''
+    cols = ['open', 'high', 'low', 'close', 'volume']
+    tck_d = pd.DataFrame(columns = cols)
+    for row in results:
+        tmp = pd.DataFrame([row])
+        tmp_r = tmp[['o','h','l','c','v']].copy()
+        tmp_r.columns = cols
+        tmp_r['time'] = pd.Timestamp(datetime.datetime.fromtimestamp(int(tmp['t'][0]) / 1000))
+        if hasattr(tck_d, 'append'):
+            tck_d = tck_d.append(tmp_r, sort=False)
+        else:
+            # pandas >= 2.0 dropped DataFrame.append
+            tck_d = pd.concat([tck_d, tmp_r], sort=False)
+    tck_d.index = tck_d['time']
+    tck_d.drop(labels=['time'], axis=1, inplace=True)
+    tck_d['ticker'] = ticker
+    return tck_d
+
+def bench_decode(sizes=(10000, 100000, 1000000), legacy_max=100000):
+    '''
+        Compares legacy and columnar decoding of Polygon aggregates
+        takes:
+            - sizes - list of int - number of synthetic bars per run
+            - legacy_max - int - largest size to run legacy decoder on
+                                (about 2 ms per bar - 100k bars take minutes,
+                                 1M bars take most of an hour; skipped sizes
+                                 have NaN legacy timings)
+        returns:
+            Pandas Dataframe with timings in seconds
+    '''
+    rows = []
+    for n in sizes:
+        bars = synthetic_polygon_bars(n)
+        st = time.perf_counter()
+        new_df = dl.decode_polygon_aggs(bars, 'TEST')
+        new_t = time.perf_counter() - st
+        old_t = np.nan
+        if n <= legacy_max:
+            st = time.perf_counter()
+            old_df = legacy_decode_polygon_aggs(bars, 'TEST')
+            old_t = time.perf_counter() - st
+            # verifying output contract is unchanged
+            pd.testing.assert_frame_equal(new_df, old_df.astype(new_df.dtypes),
+                                          check_index_type=False,
+                                          check_freq=False)
+        rows.append([n, old_t, new_t, old_t/new_t, n/new_t])
+    res = pd.DataFrame(rows, columns=['bars', 'legacy_s', 'columnar_s',
+                                      'speedup', 'columnar_rows_per_s'])
+    return res
+
+def _weekdays(end, n):
+    '''returns last 'n' weekdays up to 'end' (datetime.date()) ascending'''
+    days = []
+    day = end
+    while len(days) < n:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= datetime.timedelta(days=1)
+    return days[::-1]
+
+def _db_rows(db_path):
+    '''returns number of rows in intraday table'''
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM intraday').fetchone()[0]
+    finally:
+        conn.close()
+
+def _run_collector_case(case, base_url, tickers, days, work_dir, queue):
+    '''runs single collection case in child process and reports to queue'''
+    import sql_utils as stkl
+    import stock_collector as collector
+    dl.POLYGON_BASE_URL = base_url
+    dl.POLYGON_API_KEY = "standin"
+    db_path = os.path.join(work_dir, "{}.db".format(case))
+    stkl.create_intraday_table(db_path)
+    st = time.perf_counter()
+    rows = None
+    if case == "get_stock_async":
+        for day in days:
+            collector.get_stock(tickers, day, db_path=db_path, acc_type="paper",
+                                engine="async")
+    elif case == "get_stock_sync":
+        rows = 0
+        for day in days:
+            df = collector.get_stock(tickers, day, wait=0, acc_type="paper")
+            rows += 0 if df is None else df.shape[0]
+    elif case == "get_stock_bulk":
+        for tk in tickers:
+            collector.get_stock_bulk(tk, days[0], days[-1], acc_type="paper",
+                                     db_path=db_path)
+    elif case == "batch_tickers_collector":
+        os.makedirs(os.path.join(work_dir, "strack_data"), exist_ok=True)
+        collector.batch_tickers_collector(tickers, days[0], days[-1], "paper",
+                                          work_dir, db_path, trade_days=days,
+                                          pause=False)
+    elapsed = time.perf_counter() - st
+    if rows is None:
+        rows = _db_rows(db_path)
+    queue.put({'elapsed_s': elapsed, 'rows': rows,
+               'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+def bench_collectors(n_tickers=20, n_days=5, config=None,
+                     cases=("get_stock_async", "get_stock_sync",
+                            "get_stock_bulk", "batch_tickers_collector")):
+    '''
+        Collection throughput against offline Polygon stand-in server
+        (read polygon_standin.py). Each case runs in own process so peak
+        RSS is reported per case.
+        takes:
+            - n_tickers - int - synthetic tickers to collect
+            - n_days - int - weekdays to collect (ending yesterday)
+            - config - polygon_standin.StandinConfig - injected latency/faults
+            - cases - list of str - collectors to run
+        returns:
+            Pandas Dataframe - tickers/s, rows/s, peak RSS, requests and
+                               injected failures (429, 500, ...) per case
+    '''
+    server = standin.start_standin(config or standin.StandinConfig(latency=0.01))
+    tickers = standin.universe_tickers(n_tickers)
+    days = _weekdays(datetime.datetime.now().date() - datetime.timedelta(days=1), n_days)
+    work_dir = tempfile.mkdtemp(prefix="strack_bench_")
+    res = []
+    try:
+        for case in cases:
+            server.reset_stats()
+            queue = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=_run_collector_case,
+                                           args=(case, server.url, tickers, days,
+                                                 work_dir, queue))
+            proc.start()
+            out = queue.get()
+            proc.join()
+            stats = dict(server.stats)
+            res.append({'case': case,
+                        'tickers_per_s': n_tickers / out['elapsed_s'],
+                        'rows_per_s': out['rows'] / out['elapsed_s'],
+                        'rows': out['rows'],
+                        'elapsed_s': out['elapsed_s'],
+                        'peak_rss_mb': out['peak_rss_mb'],
+                        'requests': stats.get('requests', 0),
+                        'http_429': stats.get(429, 0),
+                        'http_500': stats.get(500, 0),
+                        'retries': stats.get('requests', 0) - stats.get(200, 0)})
+    finally:
+        server.shutdown()
+    return pd.DataFrame(res)
+
+def synthetic_intraday_df(n_tickers, n_days, seed=0):
+    '''returns session minute bars of 'n_tickers' tickers over 'n_days'
+    weekdays in common dataframe format'''
+    rng = np.random.default_rng(seed)
+    frames = []
+    for day in _weekdays(datetime.date(2020, 3, 31), n_days):
+        idx = pd.date_range(datetime.datetime(day.year, day.month, day.day, 9, 30),
+                            periods=standin.SESSION_MINUTES, freq='min', name='time')
+        for i in range(n_tickers):
+            df = pd.DataFrame(rng.random((len(idx), 5)) * 100, index=idx,
+                              columns=['open', 'high', 'low', 'close', 'volume'])
+            df['ticker'] = "T{:04d}".format(i)
+            frames.append(df)
+    return pd.concat(frames)
+
+def bench_write(n_tickers=200, n_days=10):
+    '''
+        Times intraday upsert writer on fresh database: first write,
+        rewrite of the same rows and write with 1% of rows changed
+        takes:
+            - n_tickers - int - tickers per day
+            - n_days - int - weekdays of session bars
+        returns:
+            Pandas Dataframe with timings and upsert counts
+    '''
+    df = synthetic_intraday_df(n_tickers, n_days)
+    changed = df.copy()
+    changed.iloc[::100, 0] += 1
+    res = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, "bench.db")
+        stkl.create_intraday_table(db_path)
+        for case, data in [("insert", df), ("rewrite", df), ("1% changed", changed)]:
+            st = time.perf_counter()
+            counts = stkl.rec_db_intraday_df(db_path, data)
+            t = time.perf_counter() - st
+            res.append(dict(case=case, rows=len(data), seconds=t,
+                            rows_per_s=len(data)/t, db_rows=_db_rows(db_path),
+                            **counts))
+    return pd.DataFrame(res)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stock collection benchmarks")
+    sub = parser.add_subparsers(dest="bench")
+    dec = sub.add_parser("decode", help="legacy vs columnar Polygon decoding")
+    dec.add_argument("--sizes", type=int, nargs="+",
+                     default=[10000, 100000, 1000000])
+    dec.add_argument("--legacy-max", type=int, default=100000)
+    col = sub.add_parser("collect", help="collectors against Polygon stand-in server")
+    col.add_argument("--tickers", type=int, default=20)
+    col.add_argument("--days", type=int, default=5)
+    col.add_argument("--latency", type=float, default=0.01)
+    col.add_argument("--p-429", type=float, default=0.0)
+    col.add_argument("--p-empty", type=float, default=0.0)
+    col.add_argument("--p-error", type=float, default=0.0)
+    col.add_argument("--cases", nargs="+", default=["get_stock_async", "get_stock_sync",
+                                                    "get_stock_bulk",
+                                                    "batch_tickers_collector"])
+    wrt = sub.add_parser("write", help="intraday upsert writer on fresh database")
+    wrt.add_argument("--tickers", type=int, default=200)
+    wrt.add_argument("--days", type=int, default=10)
+    args = parser.parse_args()
+    if args.bench == "decode":
+        print(bench_decode(args.sizes, args.legacy_max).to_string(index=False))
+        skipped = [n for n in args.sizes if n > args.legacy_max]
+        if len(skipped) > 0:
+            print("legacy decoder skipped for {} bars (--legacy-max {})".format(
+                ", ".join(str(n) for n in skipped), args.legacy_max))
+    elif args.bench == "collect":
+        config = standin.StandinConfig(latency=args.latency, p_429=args.p_429,
+                                       p_empty=args.p_empty, p_error=args.p_error)
+        print(bench_collectors(args.tickers, args.days, config,
+                               args.cases).to_string(index=False))
+    elif args.bench == "write":
+        print(bench_write(args.tickers, args.days).to_string(index=False))
+    else:
+        parser.print_help()
@@ -12,10 +12,142 @@ import pandas as pd
 import requests as r
 import json
 import datetime
+import operator
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import importlib
-import strack_trader_pl as apis
-importlib.reload(apis)
+import response_cache as rc
+import retry_scheduler as rs
+import sql_utils as stkl
+from lazy_import import lazy_module
+apis = lazy_module("strack_trader_pl")
+
+# Polygon API host and key may be overridden (e.g. polygon_standin.py server)
+POLYGON_BASE_URL = os.environ.get("POLYGON_BASE_URL", "https://api.polygon.io")
+POLYGON_API_KEY = os.environ.get("POLYGON_API_KEY")
+POLYGON_AGGS_MAX_LIMIT = 50000 # max bars Polygon returns per aggregates request
+POLYGON_TICKERS_PER_PAGE = 50 # max tickers Polygon returns per reference page
+SNAPSHOT_BATCH = 250 # tickers per snapshot request (url length bound)
+# requests per second Polygon tolerates: default suits unlimited plans,
+# plans with limits (free - 5 requests per minute) set it per account type
+# in POLYGON_RATE_LIMITS or POLYGON_RATE_LIMIT_<ACC_TYPE> environment variable
+POLYGON_RATE_LIMIT = float(os.environ.get("POLYGON_RATE_LIMIT", 100))
+POLYGON_RATE_LIMITS = {} # {acc_type: requests per second}
+POLYGON_OK_STATUSES = ('OK', 'DELAYED') # aggregates response statuses with data
+HTTP_TIMEOUT = 30 # seconds
+HTTP_POOL_SIZE = 32 # keep-alive connections kept per host
+
+def _api_key(acc_type):
+    '''returns Polygon API key for account type
+    (POLYGON_API_KEY overrides account credentials)'''
+    if POLYGON_API_KEY != None:
+        return POLYGON_API_KEY
+    return apis.get_api(acc_type, credentials=True)
+
+def polygon_rate_limit(acc_type=None):
+    '''returns max Polygon requests per second of account type:
+    POLYGON_RATE_LIMITS entry, POLYGON_RATE_LIMIT_<ACC_TYPE> environment
+    variable or POLYGON_RATE_LIMIT (read at call time)'''
+    if acc_type in POLYGON_RATE_LIMITS:
+        return float(POLYGON_RATE_LIMITS[acc_type])
+    if acc_type != None:
+        env = os.environ.get("POLYGON_RATE_LIMIT_{}".format(str(acc_type).upper()))
+        if env != None:
+            return float(env)
+    return POLYGON_RATE_LIMIT
+
+# shared keep-alive session (created on first request)
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    '''returns shared requests.Session with keep-alive connection pool
+    used by all Polygon requests (thread safe)'''
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = r.Session()
+                adapter = r.adapters.HTTPAdapter(pool_connections=4,
+                                                 pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+# optional on-disk cache of aggregates responses (read enable_response_cache())
+_cache = None
+
+def enable_response_cache(cache_dir, max_bytes=2*1024**3, today_ttl=300):
+    '''
+        Puts on-disk cache in front of Polygon aggregates requests
+        (get_ticker_polygon(), iter_ticker_polygon()), so reruns read
+        local disk instead of network.
+        takes:
+            - cache_dir - str - directory for cached responses
+            - max_bytes - int - cache size limit, least recently used evicted
+            - today_ttl - int - seconds before responses stored before session
+                                close of range end expire (responses stored
+                                after it never expire)
+        returns:
+            response_cache.ResponseCache
+    '''
+    global _cache
+    _cache = rc.ResponseCache(cache_dir, max_bytes=max_bytes, today_ttl=today_ttl)
+    return _cache
+
+def disable_response_cache():
+    '''removes response cache from Polygon aggregates requests'''
+    global _cache
+    _cache = None
+
+def _get_json(url_source):
+    '''GET request via shared session, returns decoded json;
+    raises retry_scheduler.RateLimited on HTTP 429 and ProviderUnavailable
+    on 5xx, timeouts and connection errors (retry later)'''
+    try:
+        obj = get_session().get(url_source, timeout=HTTP_TIMEOUT)
+    except (r.exceptions.ConnectionError, r.exceptions.Timeout) as ex:
+        raise rs.ProviderUnavailable("Polygon request failed: {}".format(ex))
+    if obj.status_code == 429:
+        raise rs.RateLimited("Polygon rate limit (HTTP 429)",
+                             rs.retry_after_seconds(obj.headers))
+    if obj.status_code >= 500:
+        raise rs.ProviderUnavailable("Polygon HTTP {}".format(obj.status_code),
+                                     rs.retry_after_seconds(obj.headers))
+    return json.loads(obj.text)
+
+class RateLimiter():
+    '''
+        Token bucket rate limiter shared between threads.
+        takes:
+            - rate - float - requests per second on average
+            - burst - int - requests allowed at once after idle time
+    '''
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        '''takes token and returns seconds to wait before using it'''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return wait
+
+    def acquire(self):
+        '''blocks until request is allowed'''
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
 
 def get_ticker_polygon(ticker, acc_type, multiplier,
                        start_date, end_date, limit):
@@ -35,34 +167,24 @@ def get_ticker_polygon(ticker, acc_type, multiplier,
                 index.name = "time"
     '''
     # Polygon API
-    api_code = apis.get_api(acc_type, credentials=True)
+    api_code = _api_key(acc_type)
     # unique path to Polygon source 
-    url_source = "https://api.polygon.io/v2/aggs/ticker/"+\
-                "{ticker}/range/".format(ticker=ticker)+\
-                "{multiplier}/".format(multiplier=multiplier)+\
-                "{timespan}/".format(timespan="minute")+\
-                "{}/{}".format(start_date,end_date)+\
-                "?apiKey={}".format(api_code)
-    obj = r.get(url_source)
-    jsn = json.loads(obj.text)
+    url_source = _polygon_aggs_url(ticker, multiplier, start_date, end_date, api_code)
+    jsn = None
+    if _cache != None:
+        jsn = _cache.get(ticker, multiplier, start_date, end_date)
+    if jsn == None:
+        jsn = _get_json(url_source)
+        if _cache != None and jsn.get('results') and not jsn.get('next_url'):
+            _cache.put(ticker, multiplier, start_date, end_date, jsn)
     if len(jsn) == 0:
         tck_d = pd.DataFrame(columns=['empty'])
         print("No Polygon source data for {}".format(ticker))
         return tck_d
     # pipeline
     cols = ['open', 'high', 'low', 'close', 'volume']
-    tck_d = pd.DataFrame(columns = cols)
-    # loop
     try:
-        for row in jsn['results'][-limit:]:
-            tmp = pd.DataFrame([row])
-            tmp_r = tmp[['o','h','l','c','v']].copy()
-            tmp_r.columns = cols
-            tmp_r['time'] = pd.Timestamp(datetime.datetime.fromtimestamp(int(tmp['t'][0]) / 1000))
-            tck_d = tck_d.append(tmp_r, sort=False)
-        tck_d.index = tck_d['time']
-        tck_d.drop(labels=['time'], axis=1, inplace=True)
-        tck_d['ticker'] = ticker
+        tck_d = decode_polygon_aggs(jsn['results'][-limit:], ticker)
     except Exception as ex:
         print("Error getting data from Polygon for {}: {}".format(ticker, ex))
         tck_d = pd.DataFrame(columns=cols)
@@ -70,6 +192,241 @@ def get_ticker_polygon(ticker, acc_type, multiplier,
         print("No Polygon source data for {}: {}".format(ticker, jsn))
     return tck_d
 
+def get_tickers_polygon_many(tickers, acc_type, multiplier,
+                            start_date, end_date, limit=0,
+                            workers=8, rate=None, burst=None, attempts=5):
+    '''
+        Concurrent get_ticker_polygon() for many tickers over shared
+        keep-alive connection pool. Rate limited and failed (HTTP 429, 5xx)
+        requests are retried with backoff after other tickers and count
+        against Polygon circuit breaker (read retry_scheduler).
+        Takes:
+            - tickers - list - equities
+            - acc_type, multiplier, start_date, end_date, limit - same as get_ticker_polygon()
+            - workers - int - requests in flight at once
+            - rate - float - max requests per second (token bucket,
+                             None - polygon_rate_limit(acc_type))
+            - burst - int - max requests at once after idle time (default - workers)
+            - attempts - int - requests per ticker before giving up
+        Returns:
+            dict - {ticker: Pandas Dataframe in get_ticker_polygon() format}
+                   (empty dataframe for tickers without data; tickers
+                   given up on are left out)
+    '''
+    rate = polygon_rate_limit(acc_type) if rate == None else rate
+    limiter = RateLimiter(rate, burst if burst != None else workers)
+    scheduler = rs.RetryScheduler(providers=("polygon",), max_attempts=attempts)
+
+    def fetch(ticker, provider):
+        limiter.acquire()
+        return get_ticker_polygon(ticker, acc_type, multiplier,
+                                  start_date, end_date, limit)
+
+    frames = scheduler.run(tickers, fetch, workers=workers)
+    return {ticker: frames[ticker] for ticker in tickers if ticker in frames}
+
+def _polygon_aggs_url(ticker, multiplier, start_date, end_date, api_code):
+    '''returns Polygon aggregates url for ticker and date range
+    (sorted ascending, max page size)'''
+    url_source = POLYGON_BASE_URL+"/v2/aggs/ticker/"+\
+                "{ticker}/range/".format(ticker=ticker)+\
+                "{multiplier}/".format(multiplier=multiplier)+\
+                "{timespan}/".format(timespan="minute")+\
+                "{}/{}".format(start_date,end_date)+\
+                "?sort=asc&limit={}".format(POLYGON_AGGS_MAX_LIMIT)+\
+                "&apiKey={}".format(api_code)
+    return url_source
+
+def _split_date_range(start_date, end_date, chunk_days):
+    '''splits [start_date, end_date] into consecutive sub-ranges
+    of 'chunk_days' calendar days - list of ("yyyy-mm-dd", "yyyy-mm-dd")'''
+    st = pd.Timestamp(str(start_date)).date()
+    en = pd.Timestamp(str(end_date)).date()
+    ranges = []
+    while st <= en:
+        sub_en = min(st + datetime.timedelta(days=chunk_days-1), en)
+        ranges.append((str(st), str(sub_en)))
+        st = sub_en + datetime.timedelta(days=1)
+    return ranges
+
+def iter_ticker_polygon(ticker, acc_type, multiplier,
+                        start_date, end_date, chunk_days=5):
+    '''
+        Streaming version of get_ticker_polygon() for long date ranges.
+        Splits range into sub-ranges of 'chunk_days' days and follows
+        Polygon 'next_url' cursor inside each of them, so nothing is cut
+        off by Polygon per-request results cap.
+        Takes:
+            - ticker - str - equity
+            - acc_type - str - trading account type ("paper" or "market")
+            - multiplier - int - Size of the timespan multiplier (minutes)
+            - start_date, end_date - str or datetime.date() - range
+            - chunk_days - int - calendar days per request
+        Yields:
+            Pandas Dataframe chunks in get_ticker_polygon() format
+            (each sorted, chunks in ascending time order)
+        Raises:
+            retry_scheduler.ProviderUnavailable - response status is not
+            OK/DELAYED (chunks of earlier sub-ranges are already yielded),
+            RateLimited - read _get_json()
+    '''
+    # Polygon API
+    api_code = _api_key(acc_type)
+    for st, en in _split_date_range(start_date, end_date, chunk_days):
+        if _cache != None:
+            jsn = _cache.get(ticker, multiplier, st, en)
+            if jsn != None:
+                yield decode_polygon_aggs(jsn['results'], ticker)
+                continue
+        pages = [] # raw results of sub-range kept for cache
+        url_source = _polygon_aggs_url(ticker, multiplier, st, en, api_code)
+        while url_source:
+            jsn = _get_json(url_source)
+            if jsn.get('status') not in POLYGON_OK_STATUSES:
+                # failed sub-range is not skipped - caller retries from it
+                raise rs.ProviderUnavailable("Polygon status {} for {} {} - {}: {}".format(
+                    jsn.get('status'), ticker, st, en, jsn.get('error', jsn.get('message'))))
+            results = jsn.get('results') or []
+            if len(results) == 0:
+                print("No Polygon source data for {} {} - {}: {}".format(ticker, st, en,
+                                                                      jsn.get('status')))
+            else:
+                if _cache != None:
+                    pages.extend(results)
+                yield decode_polygon_aggs(results, ticker)
+            # following cursor if page is capped
+            url_source = jsn.get('next_url')
+            if url_source:
+                url_source = url_source+"&apiKey={}".format(api_code)
+            elif len(results) >= POLYGON_AGGS_MAX_LIMIT:
+                print("Warning: Polygon results for {} {} - {} ".format(ticker, st, en)+\
+                      "may be truncated, consider smaller chunk_days")
+        if len(pages) > 0:
+            _cache.put(ticker, multiplier, st, en, {'ticker': ticker,
+                                                    'resultsCount': len(pages),
+                                                    'results': pages})
+
+def _local_offsets_ms(t_ms):
+    '''returns local UTC offsets (ms) for epoch milliseconds array,
+    same as datetime.fromtimestamp() would apply (evaluated once per hour)'''
+    hours, inv = np.unique(t_ms // 3600000, return_inverse=True)
+    utc = datetime.timezone.utc
+    offsets = np.array([datetime.datetime.fromtimestamp(h * 3600, utc).astimezone()
+                        .utcoffset().total_seconds()
+                        for h in hours.tolist()], dtype=np.int64) * 1000
+    return offsets[inv.reshape(-1)]
+
+def decode_polygon_aggs(results, ticker):
+    '''
+        Columnar decoding of Polygon aggregates 'results' list in a single pass.
+        Takes:
+            - results - list - bars as returned by Polygon (dicts with t, o, h, l, c, v keys)
+            - ticker - str - equity
+        Returns:
+            Pandas Dataframe - same format as get_ticker_polygon():
+                columns = ['open', 'high', 'low', 'close', 'volume', 'ticker']
+                index - datetime.datetime() (local time, as datetime.fromtimestamp())
+                index.name = "time"
+    '''
+    cols = ['open', 'high', 'low', 'close', 'volume']
+    if len(results) == 0:
+        return pd.DataFrame(columns=cols)
+    # one pass over raw bars - (n, 6) array of t, o, h, l, c, v
+    getter = operator.itemgetter('t', 'o', 'h', 'l', 'c', 'v')
+    arr = np.array(list(map(getter, results)), dtype=np.float64)
+    # epoch milliseconds to naive local time
+    t_ms = arr[:, 0].astype(np.int64)
+    time_idx = pd.to_datetime(t_ms + _local_offsets_ms(t_ms), unit='ms')
+    tck_d = pd.DataFrame(arr[:, 1:], columns=cols,
+                         index=pd.DatetimeIndex(time_idx, name='time'))
+    tck_d['ticker'] = ticker
+    return tck_d
+
+def _grouped_daily_url(day, api_code, adjusted=True):
+    '''returns Polygon grouped daily aggregates url (all tickers, one day)'''
+    url_source = POLYGON_BASE_URL+"/v2/aggs/grouped/locale/us/market/stocks/"+\
+                "{}".format(day)+\
+                "?adjusted={}".format(str(bool(adjusted)).lower())+\
+                "&apiKey={}".format(api_code)
+    return url_source
+
+def decode_polygon_grouped(results, day):
+    '''
+        Columnar decoding of Polygon grouped daily 'results' list.
+        Takes:
+            - results - list - bars as returned by Polygon (dicts with T, o, h, l, c, v
+                               and optional vw, n keys)
+            - day - datetime.date() / "yyyy-mm-dd" - day of bars
+        Returns:
+            Pandas Dataframe - one row per ticker:
+                columns = ['open', 'high', 'low', 'close', 'volume', 'vwap',
+                           'transactions', 'ticker']
+                index - datetime (day), index.name = "day"
+    '''
+    cols = ['open', 'high', 'low', 'close', 'volume', 'vwap', 'transactions']
+    if len(results) == 0:
+        return pd.DataFrame(columns=cols+['ticker'],
+                            index=pd.DatetimeIndex([], name='day'))
+    getter = operator.itemgetter('o', 'h', 'l', 'c', 'v')
+    arr = np.array(list(map(getter, results)), dtype=np.float64)
+    bars = pd.DataFrame(arr, columns=cols[:5],
+                        index=pd.DatetimeIndex([pd.Timestamp(str(day))]*len(results),
+                                               name='day'))
+    bars['vwap'] = np.array([row.get('vw', np.nan) for row in results], dtype=np.float64)
+    bars['transactions'] = np.array([row.get('n', np.nan) for row in results],
+                                    dtype=np.float64)
+    bars['ticker'] = [row['T'] for row in results]
+    return bars
+
+def get_grouped_daily_polygon(day, acc_type, tickers=None, adjusted=True):
+    '''
+        Getting daily bars of ALL tickers for one day with single Polygon
+        grouped daily request (instead of request per ticker).
+        DOES NOT HAVE Everything: STOCKS only.
+        Takes:
+            - day - datetime.date() / "yyyy-mm-dd"
+            - acc_type - str - trading account type ("paper" or "market")
+            - tickers - list - keep only these tickers (None - all)
+            - adjusted - bool - split adjusted bars
+        Returns:
+            Pandas Dataframe in decode_polygon_grouped() format
+            (empty if Polygon has no bars for the day, e.g. holiday)
+        Raises:
+            retry_scheduler.ProviderUnavailable - response status is not OK/DELAYED
+    '''
+    # Polygon API
+    api_code = _api_key(acc_type)
+    jsn = _get_json(_grouped_daily_url(day, api_code, adjusted))
+    if jsn.get('status') not in POLYGON_OK_STATUSES:
+        raise rs.ProviderUnavailable("Polygon status {} for grouped daily {}: {}".format(
+            jsn.get('status'), day, jsn.get('error', jsn.get('message'))))
+    results = jsn.get('results') or []
+    if len(results) == 0:
+        print("No Polygon grouped daily data for {}: {}".format(day, jsn.get('status')))
+    bars = decode_polygon_grouped(results, day)
+    if tickers != None:
+        bars = bars.loc[bars['ticker'].isin(tickers)]
+    return bars
+
+TICKER_COLS = ['ticker','name','market','locale','currency','active','primaryExch','updated','url']
+
+def _tickers_url(market, page, api_code):
+    '''returns Polygon reference tickers page url'''
+    url_source = POLYGON_BASE_URL+"/v2/reference/tickers"+\
+        "?sort=ticker&type=cs&market={}".format(market)+\
+            "&locale=us"+\
+            "&perpage={}".format(POLYGON_TICKERS_PER_PAGE)+\
+            "&page={}".format(page)+\
+            "&apiKey={}".format(api_code)
+    return url_source
+
+def decode_polygon_tickers(rows):
+    '''columnar decoding of Polygon reference 'tickers' list
+    to dataframe with TICKER_COLS columns'''
+    polygon_tickers = pd.DataFrame.from_records(rows, columns=TICKER_COLS)
+    polygon_tickers.reset_index(inplace=True, drop=True)
+    return polygon_tickers
+
 def get_tradable_tickers_polygon(market='stocks', page=1):
     '''returns df with tickers supported by Polygon
     takes:
@@ -81,47 +438,256 @@ def get_tradable_tickers_polygon(market='stocks', page=1):
         bonds
         mf
         mmf
-    page - int - page to return (API does not support all pages)
+    page - int - page to return (use get_ticker_universe() for all pages)
     '''
     # Polygon API
     acc_type = "paper"
-    api_code = apis.get_api(acc_type, credentials=True)
+    api_code = _api_key(acc_type)
     # unique path to Polygon source 
-    url_source = "https://api.polygon.io/v2/reference/tickers"+\
-        "?sort=ticker&type=cs&market={}".format(market)+\
-            "&locale=us"+\
-            "&perpage=50"+\
-            "&page={}".format(page)+\
-            "&apiKey={}".format(api_code)
-    obj = r.get(url_source)
-    tickers_all_polygon = json.loads(obj.text)
+    url_source = _tickers_url(market, page, api_code)
+    tickers_all_polygon = _get_json(url_source)
     # creating dataframe with all available tickers from Polygon
-    cols = ['ticker','name','market','locale','currency','active','primaryExch','updated','url']
-    polygon_tickers = pd.DataFrame(columns = cols)
-    # loop
-    for row in tickers_all_polygon['tickers']:
-        tmp = pd.DataFrame([row])
-        tmp_r = tmp[['ticker','name','market','locale','currency','active','primaryExch','updated','url']].copy()
-        tmp_r.columns = cols
-        polygon_tickers = polygon_tickers.append(tmp_r, sort=False)
-    polygon_tickers.reset_index(inplace=True, drop=True)
-    return polygon_tickers
+    return decode_polygon_tickers(tickers_all_polygon['tickers'])
 
-def get_last_trade_polygon(ticker, acc_type):
+def get_ticker_universe(db_path, market='stocks', refresh=False,
+                        workers=8, rate=None):
+    '''
+        Returns full universe of tickers supported by Polygon using
+        dated local snapshot (ticker_universe table in database).
+        Snapshot taken today is returned without network requests.
+        Otherwise all pages are fetched concurrently and only tickers
+        which are new or have newer 'updated' date are rewritten.
+        If count of tickers is not received, previous snapshot is returned;
+        failed pages leave snapshot undated, so next call fetches again.
+        takes:
+            - db_path - str - path to database sqlite3
+            - market - str - type of market (read get_tradable_tickers_polygon())
+            - refresh - bool - fetch from Polygon even if snapshot is from today
+            - workers - int - pages requested at once
+            - rate - float - max requests per second
+                             (None - polygon_rate_limit("paper"))
+        returns:
+            Pandas Dataframe with TICKER_COLS columns (sorted by ticker)
+    '''
+    today = str(datetime.datetime.now().date())
+    stkl.create_ticker_universe_table(db_path)
+    if not refresh and stkl.get_db_ticker_universe_date(db_path, market) == today:
+        return stkl.get_db_ticker_universe(db_path, market)
+    # Polygon API
+    acc_type = "paper"
+    api_code = _api_key(acc_type)
+    limiter = RateLimiter(polygon_rate_limit(acc_type) if rate == None else rate, workers)
+
+    def fetch(page):
+        '''returns tickers page json or None if request failed'''
+        limiter.acquire()
+        try:
+            jsn = _get_json(_tickers_url(market, page, api_code))
+        except Exception as ex:
+            print("Error getting tickers page {} from Polygon: {}".format(page, ex))
+            return None
+        if jsn.get('status') != 'OK':
+            print("Error getting tickers page {} from Polygon: status {}".format(
+                page, jsn.get('status')))
+            return None
+        return jsn
+
+    # first page tells total count of tickers
+    first = fetch(1)
+    if first == None or first.get('count') == None:
+        # previous snapshot is kept, next call retries
+        print("Failed to get tickers universe from Polygon - returning previous snapshot")
+        return stkl.get_db_ticker_universe(db_path, market)
+    pages = int(np.ceil(int(first['count']) / POLYGON_TICKERS_PER_PAGE))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rest = list(pool.map(fetch, range(2, pages+1)))
+    failed = sum(1 for page in rest if page is None)
+    rows = list(first.get('tickers', []))
+    for page in rest:
+        rows.extend((page or {}).get('tickers', []))
+    universe = decode_polygon_tickers(rows).drop_duplicates(subset=['ticker'])
+    # failed pages leave snapshot undated so next call retries
+    stkl.rec_db_ticker_universe(db_path, universe, market,
+                                snapshot_date=today if failed == 0 else None)
+    if failed > 0:
+        print("Warning: {} of {} tickers pages failed".format(failed, pages))
+    return stkl.get_db_ticker_universe(db_path, market)
+
+# in-process micro-cache of last traded prices {ticker: (price, time.monotonic())}
+_last_trades = {}
+_last_trades_lock = threading.Lock()
+
+def _cached_last_trades(tickers, max_age):
+    '''returns {ticker: price} for tickers priced within max_age seconds'''
+    now = time.monotonic()
+    prices = {}
+    with _last_trades_lock:
+        for tk in tickers:
+            hit = _last_trades.get(tk)
+            if hit != None and now - hit[1] <= max_age:
+                prices[tk] = hit[0]
+    return prices
+
+def _store_last_trades(prices):
+    '''puts {ticker: price} to micro-cache'''
+    now = time.monotonic()
+    with _last_trades_lock:
+        for tk, price in prices.items():
+            _last_trades[tk] = (price, now)
+
+def get_last_trade_polygon(ticker, acc_type, max_age=0):
     '''
         Getting latest ticker traded price with Polygon
         DOES NOT HAVE Everything: STOCKS only.
+        max_age - float - seconds cached price is good for (0 - always request)
+        For many tickers use get_last_trades_polygon().
     '''
+    cached = _cached_last_trades([ticker], max_age)
+    if ticker in cached:
+        return cached[ticker]
     # Polygon API
-    api_code = apis.get_api(acc_type, credentials=True)
+    api_code = _api_key(acc_type)
     # unique path to Polygon source 
-    url_source = "https://api.polygon.io/v1/last/stocks/"+\
+    url_source = POLYGON_BASE_URL+"/v1/last/stocks/"+\
                 "{}?apiKey={}".format(ticker,api_code)
-    obj = r.get(url_source)
-    jsn = json.loads(obj.text)
+    jsn = _get_json(url_source)
     price = float(jsn['last']['price'])
+    _store_last_trades({ticker: price})
     return price
 
+def get_last_trades_polygon(tickers, acc_type, max_age=1.0):
+    '''
+        Getting latest traded prices for many tickers with Polygon
+        snapshot endpoint - one request per SNAPSHOT_BATCH tickers.
+        Prices seen within 'max_age' seconds are served from in-process
+        micro-cache without any request.
+        DOES NOT HAVE Everything: STOCKS only.
+        takes:
+            - tickers - list - equities
+            - acc_type - str - trading account type ("paper" or "market")
+            - max_age - float - seconds cached price is good for
+        returns:
+            Pandas Series - prices indexed by ticker (NaN if no trade)
+    '''
+    prices = _cached_last_trades(tickers, max_age)
+    stale = [tk for tk in dict.fromkeys(tickers) if tk not in prices]
+    if len(stale) > 0:
+        # Polygon API
+        api_code = _api_key(acc_type)
+        for i in range(0, len(stale), SNAPSHOT_BATCH):
+            url_source = POLYGON_BASE_URL+"/v2/snapshot/locale/us/"+\
+                "markets/stocks/tickers?tickers={}".format(",".join(stale[i:i+SNAPSHOT_BATCH]))+\
+                "&apiKey={}".format(api_code)
+            jsn = _get_json(url_source)
+            fresh = {}
+            for row in jsn.get('tickers') or []:
+                price = (row.get('lastTrade') or {}).get('p')
+                if price:
+                    fresh[row['ticker']] = float(price)
+            _store_last_trades(fresh)
+            prices.update(fresh)
+    return pd.Series([prices.get(tk, np.nan) for tk in tickers], index=tickers,
+                     name='price', dtype=np.float64)
+
+class MinuteBarBuffer():
+    '''
+        In-memory ring buffer of today's minute bars for single ticker.
+        update() requests only bars from the last cached minute onwards
+        (last minute is re-requested as it may still be forming), so
+        monitoring loops cost one small request per tick.
+        Lookbacks use iloc-like positions: get(-1) - latest minute.
+        takes:
+            - ticker - str - equity
+            - acc_type - str - trading account type ("paper" or "market")
+            - capacity - int - minutes kept (960 - whole extended hours day)
+    '''
+    FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, ticker, acc_type, capacity=960):
+        self.ticker = ticker
+        self.acc_type = acc_type
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, day=None):
+        '''empties buffer and binds it to 'day' (datetime.date())'''
+        self.day = day
+        self.t = np.zeros(self.capacity, dtype=np.int64) # epoch ms
+        self.bars = np.full((self.capacity, len(self.FIELDS)), np.nan)
+        self.count = 0 # bars appended since reset
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def _pos(self, i):
+        '''ring position of iloc-like index i'''
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("{} has {} minutes in buffer, ".format(self.ticker, n)+\
+                             "requested position {}".format(i))
+        return (self.count - n + i) % self.capacity
+
+    def append(self, t, row):
+        '''adds bar (epoch ms, [o, h, l, c, v]) - replaces last one if same minute'''
+        if self.count > 0:
+            last = (self.count - 1) % self.capacity
+            if t == self.t[last]:
+                self.bars[last] = row
+                return
+            if t < self.t[last]:
+                return
+        pos = self.count % self.capacity
+        self.t[pos] = t
+        self.bars[pos] = row
+        self.count += 1
+
+    def update(self):
+        '''requests minute bars newer than cached ones from Polygon
+        returns number of bars received'''
+        with self.lock:
+            today = datetime.datetime.now().date()
+            if self.day != today:
+                self.reset(today)
+            start = int(self.t[(self.count - 1) % self.capacity]) if self.count > 0 else str(today)
+            api_code = _api_key(self.acc_type)
+            jsn = _get_json(_polygon_aggs_url(self.ticker, 1, start, str(today), api_code))
+            results = jsn.get('results') or []
+            getter = operator.itemgetter('t', 'o', 'h', 'l', 'c', 'v')
+            for row in map(getter, results):
+                self.append(int(row[0]), row[1:])
+            return len(results)
+
+    def get(self, i, field='close'):
+        '''returns 'field' value of minute at iloc-like position i'''
+        return self.bars[self._pos(i), self.FIELDS.index(field)]
+
+    def time(self, i):
+        '''returns datetime.datetime() (local) of minute at iloc-like position i'''
+        return datetime.datetime.fromtimestamp(self.t[self._pos(i)] / 1000)
+
+    def frame(self):
+        '''returns buffer as dataframe in get_ticker_polygon() format'''
+        n = len(self)
+        order = [(self.count - n + i) % self.capacity for i in range(n)]
+        rows = [dict(zip(['t', 'o', 'h', 'l', 'c', 'v'], [self.t[p]]+list(self.bars[p])))
+                for p in order]
+        return decode_polygon_aggs(rows, self.ticker)
+
+# live buffers of today's minute bars {ticker: MinuteBarBuffer}
+_live_buffers = {}
+_live_buffers_lock = threading.Lock()
+
+def get_live_buffer(ticker, acc_type):
+    '''returns MinuteBarBuffer of ticker kept between calls'''
+    with _live_buffers_lock:
+        if ticker not in _live_buffers:
+            _live_buffers[ticker] = MinuteBarBuffer(ticker, acc_type)
+        return _live_buffers[ticker]
+
 def get_chg_price(ticker, minute, acc_type):
     '''
         Checking on price change using historical data
@@ -129,12 +695,12 @@ def get_chg_price(ticker, minute, acc_type):
         latest closed minute data on provided 'ticker'
         POLYGON based only
         DOES NOT HAVE Everything: STOCKS only.
+        Uses live buffer of today's minutes (read MinuteBarBuffer) -
+        only new minutes are requested on each call.
     '''
-    date = str(datetime.datetime.now().date())
-    d = get_ticker_polygon(ticker=ticker, acc_type=acc_type,
-                           multiplier=1, start_date=date,
-                           end_date=date, limit=minute*2)
-    cur_price = float(d.iloc[-1]['4. close'])
-    prev_price = float(d.iloc[-minute]['4. close'])
+    buf = get_live_buffer(ticker, acc_type)
+    buf.update()
+    cur_price = float(buf.get(-1, 'close'))
+    prev_price = float(buf.get(-minute, 'close'))
     chg = (cur_price-prev_price)/prev_price
-    return prev_price, cur_price, chg
\ No newline at end of file
+    return prev_price, cur_price, chg
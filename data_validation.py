@@ -13,30 +13,41 @@ from tqdm import tqdm
 import datetime
 from datetime import timedelta
 
-import importlib
-import strack_env as env
-importlib.reload(env)
+from lazy_import import lazy_module
+env = lazy_module("strack_env")
 
 
 def missing_minutes(master_df, path):
     '''
         Creates .csv with missing minutes stats to analyze gaps
+        takes:
+            - master_df - dataframe with intraday data or iterable of
+                dataframes (e.g. sql_utils.iter_db_intraday(db, by='day'))
+                to process full history in bounded memory
+            - path - str - working directory path
     '''
-    # uniques values 
-    u_days = np.unique(master_df.index.date).shape[0]
-    u_ticks = len(master_df['ticker'].unique())
+    if isinstance(master_df, pd.DataFrame):
+        master_df = [master_df]
+    # uniques values and records count per minute of day
+    u_days = set()
+    u_ticks = set()
+    minute_counts = np.zeros(24*60, dtype=np.int64)
+    for df in tqdm(master_df):
+        minutes = df.index.hour.values*60 + df.index.minute.values
+        minute_counts += np.bincount(minutes, minlength=24*60)
+        u_days.update(np.unique(df.index.date))
+        u_ticks.update(df['ticker'].unique())
     # ticker-day records
-    recs = u_ticks*u_days
+    recs = len(u_ticks)*len(u_days)
     
     # iterating through all minutes from 8.00 am
     start_t = datetime.datetime(1999,1,1,8,0)
     miss_t_observ = []
-    for m in tqdm(range(1, 8*60+1)):
+    for m in range(1, 8*60+1):
         next_m = start_t + timedelta(minutes=m)
         
         # count of records with specific time
-        time_present = master_df.loc[master_df.index.time == \
-                                     next_m.time()].shape[0]
+        time_present = minute_counts[next_m.hour*60 + next_m.minute]
         
         # missing records
         missing_rec = recs - time_present
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17, 2026
+
+Lazy module imports
+
+Provider, trader and delivery modules are imported on first use
+instead of at import time, so analytics can be imported without
+the network-facing stack.
+Set STRACK_RELOAD=1 environment variable to get modules reloaded
+on first use (development mode, same as old importlib.reload chains).
+
+@author: vyachez
+"""
+# Imports
+import os
+import importlib
+import threading
+
+RELOAD = os.environ.get("STRACK_RELOAD", "0") == "1"
+
+_lock = threading.Lock()
+
+
+class LazyModule():
+    '''
+        Module proxy importing module 'name' on first attribute access.
+    '''
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        '''imports (and in development mode reloads) module once'''
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if RELOAD:
+                        module = importlib.reload(module)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return "<lazy module '{}' ({})>".format(self._name, state)
+
+def lazy_module(name):
+    '''returns LazyModule proxy for module 'name' '''
+    return LazyModule(name)
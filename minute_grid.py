@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18, 2026
+
+Memory-mapped minute grid cache
+
+Session minute bars of every ticker are kept in dense .npy array
+(days x 390 session minutes x OHLCV) with NaN for missing minutes,
+days axis is shared by all tickers. Arrays are opened memory-mapped,
+so several processes share one copy in page cache and lookups like
+"close at 15:59 on day d" are plain indexing:
+    grid = MinuteGrid(grid_dir)
+    grid["AAPL"][grid.day_index(day), grid.minute_index("15:59"), CLOSE]
+Build (or rebuild) cache from intraday table with build_minute_grid().
+
+@author: vyachez
+"""
+# Imports
+import os
+import json
+import datetime
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+import sql_utils as stkl
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(FIELDS))
+SESSION_MINUTES = stkl.SESSION_CLOSE_MINUTE - stkl.SESSION_OPEN_MINUTE + 1 # 390
+MANIFEST = "manifest.json"
+
+
+def build_minute_grid(db_path, grid_dir, tickers=None, start=None, end=None,
+                      dtype='float64'):
+    '''
+        Builds minute grid cache from intraday table (one ticker in memory
+        at time). Existing cache in grid_dir is replaced.
+        takes:
+            - db_path - str - database path (or sql_utils.Database handle)
+            - grid_dir - str - cache directory
+            - tickers - list - tickers to cache (None - all)
+            - start, end - datetime.date() / "yyyy-mm-dd" - days range
+                           (None - unbounded)
+            - dtype - str - array dtype ('float32' halves size, volumes above
+                            2**24 lose precision)
+        returns:
+            MinuteGrid
+    '''
+    os.makedirs(grid_dir, exist_ok=True)
+    days = np.array(stkl.get_db_intraday_days(db_path, start, end), dtype='datetime64[D]')
+    files = {}
+    for df in stkl.iter_db_intraday(db_path, by='ticker', tickers=tickers,
+                                    start=start, end=end, session_only=True,
+                                    compact=False):
+        ticker = df['ticker'].iloc[0]
+        files[ticker] = quote(ticker, safe='') + ".npy"
+        grid = np.lib.format.open_memmap(os.path.join(grid_dir, files[ticker] + ".tmp"),
+                                         mode='w+', dtype=dtype,
+                                         shape=(len(days), SESSION_MINUTES, len(FIELDS)))
+        grid[:] = np.nan
+        minutes = df.index.values.astype('datetime64[m]').astype(np.int64)
+        d = np.searchsorted(days.astype(np.int64), minutes // 1440)
+        m = minutes % 1440 - stkl.SESSION_OPEN_MINUTE
+        grid[d, m] = df[FIELDS].values
+        grid.flush()
+        del grid
+        os.replace(os.path.join(grid_dir, files[ticker] + ".tmp"),
+                   os.path.join(grid_dir, files[ticker]))
+    # manifest last - readers see complete cache
+    manifest = {'days': [str(d) for d in days], 'fields': FIELDS,
+                'tickers': files, 'dtype': str(np.dtype(dtype)),
+                'built': datetime.datetime.now().isoformat(timespec='seconds')}
+    with open(os.path.join(grid_dir, MANIFEST + ".tmp"), 'w') as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(grid_dir, MANIFEST + ".tmp"),
+               os.path.join(grid_dir, MANIFEST))
+    print("Built minute grid for {} tickers, {} days".format(len(files), len(days)))
+    return MinuteGrid(grid_dir)
+
+
+class MinuteGrid():
+    '''
+        Read-only memory-mapped minute grid cache.
+        grid[ticker] - array (days x 390 minutes x OHLCV), NaN - no data
+        takes:
+            - grid_dir - str - cache directory built by build_minute_grid()
+    '''
+    def __init__(self, grid_dir):
+        self.grid_dir = grid_dir
+        with open(os.path.join(grid_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.days = np.array(manifest['days'], dtype='datetime64[D]')
+        self.tickers = sorted(manifest['tickers'])
+        self._files = manifest['tickers']
+        self._arrays = {}
+
+    def __contains__(self, ticker):
+        return ticker in self._files
+
+    def __getitem__(self, ticker):
+        '''returns memory-mapped array of ticker (opened once)'''
+        if ticker not in self._arrays:
+            self._arrays[ticker] = np.load(os.path.join(self.grid_dir, self._files[ticker]),
+                                           mmap_mode='r')
+        return self._arrays[ticker]
+
+    def day_index(self, day):
+        '''returns days axis index of day (datetime.date() / "yyyy-mm-dd"),
+        raises KeyError if day is not cached'''
+        d = np.datetime64(pd.Timestamp(str(day)).date(), 'D')
+        i = int(np.searchsorted(self.days, d))
+        if i == len(self.days) or self.days[i] != d:
+            raise KeyError("{} is not in minute grid".format(day))
+        return i
+
+    @staticmethod
+    def minute_index(minute):
+        '''returns session minute index (0 - 9:30, 389 - 15:59) of
+        datetime.time() / "hh:mm" '''
+        if isinstance(minute, str):
+            minute = datetime.datetime.strptime(minute, "%H:%M").time()
+        i = minute.hour*60 + minute.minute - stkl.SESSION_OPEN_MINUTE
+        if i < 0 or i >= SESSION_MINUTES:
+            raise KeyError("{} is outside of session minutes".format(minute))
+        return i
+
+    def day(self, ticker, day):
+        '''returns (390 minutes x OHLCV) array of ticker at day'''
+        return self[ticker][self.day_index(day)]
+
+    def value(self, ticker, day, minute, field):
+        '''returns single value, e.g. value("AAPL", day, "15:59", "close")'''
+        return float(self[ticker][self.day_index(day), self.minute_index(minute),
+                                  FIELDS.index(field)])
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18, 2026
+
+Partitioned Parquet storage backend for intraday data
+
+Alternative to intraday table of sql_utils with the same record, read and
+delete functions - pass store directory instead of database path.
+Data is kept in Parquet files partitioned by date and ticker (hive style):
+    <store>/date=2020-03-02/ticker=AAPL/part-0.parquet
+Ticker and date filters prune partitions, time filters are pushed down to
+Parquet row groups and only requested columns are read.
+Requires pyarrow (pip install pyarrow), imported on first use.
+Daily summaries are computed from minutes on request; daily_bars table
+and monthly partitioning are sqlite only and raise NotImplementedError here.
+
+@author: vyachez
+"""
+# Imports
+import os
+import shutil
+import datetime
+import threading
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from sql_utils import INTRADAY_COLS, SESSION_OPEN_MINUTE, SESSION_CLOSE_MINUTE
+from sql_stats import instrumented
+from lazy_import import lazy_module
+pa = lazy_module("pyarrow")
+pc = lazy_module("pyarrow.compute")
+pq = lazy_module("pyarrow.parquet")
+ds = lazy_module("pyarrow.dataset")
+
+VALUE_COLS = ['open', 'high', 'low', 'close', 'volume']
+PART_FILE = "part-0.parquet"
+
+
+class Database():
+    '''
+        Store handle - counterpart of sql_utils.Database, so collectors
+        can use either backend the same way.
+        takes:
+            - db_path - string - store directory
+    '''
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _root(db_path):
+    '''returns store directory for path or Database handle'''
+    if isinstance(db_path, Database):
+        return db_path.db_path
+    return db_path
+
+def _file_schema():
+    '''schema of partition files (ticker and date are in path)'''
+    return pa.schema([('time', pa.timestamp('ms'))]+\
+                     [(col, pa.float64()) for col in VALUE_COLS])
+
+def _dataset(root):
+    '''returns pyarrow dataset of store with date and ticker partition columns'''
+    part_schema = pa.schema([('date', pa.string()), ('ticker', pa.string())])
+    schema = pa.schema(list(_file_schema())+list(part_schema))
+    return ds.dataset(root, schema=schema, format='parquet',
+                      partitioning=ds.partitioning(part_schema, flavor='hive'))
+
+def _partition_path(root, day, ticker):
+    '''returns partition file path of ticker at day'''
+    return os.path.join(root, "date={}".format(day),
+                        "ticker={}".format(quote(ticker, safe='')), PART_FILE)
+
+def _bound(value, end=False):
+    '''query bound -> pd.Timestamp: dates cover whole day,
+    datetimes/timestamps are exact minutes'''
+    ts = pd.Timestamp(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime) or \
+            (isinstance(value, str) and len(value.strip()) <= 10):
+        ts = ts.normalize()
+        return ts + pd.Timedelta(minutes=24*60-1) if end else ts
+    return ts.floor('min')
+
+def create_intraday_table(db_path):
+    ''' create intraday store directory
+    takes:
+        - db_path - string - store directory '''
+    os.makedirs(_root(db_path), exist_ok=True)
+    print("Created intraday store successfully")
+
+@instrumented
+def rec_db_intraday_df(db_path, df):
+    '''
+    Records tickers dataframe to store (upsert).
+    Each ticker-day partition file is merged with new rows: new minutes
+    are inserted, existing minutes replaced if values differ; partitions
+    without changes are not rewritten. Files are replaced atomically.
+
+    Parameters
+    ----------
+    db_path : string - store directory (or Database handle)
+    df : Pandas Dataframe - loaded tickers data in strict predefined format:
+        columns = ['open', 'high', 'low', 'close', 'volume', 'ticker']
+        index - datetime.datetime()
+        index.name = "time"
+
+    Returns
+    -------
+    dict - counts of 'inserted', 'updated' and 'unchanged' rows.
+    '''
+    root = _root(db_path)
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    data = df[VALUE_COLS].astype(float)
+    data.index = pd.DatetimeIndex(df.index).floor('min').rename('time')
+    days = data.index.normalize().date
+    for (day, ticker), new in data.groupby([days, df['ticker'].values], sort=False):
+        new = new[~new.index.duplicated(keep='last')].sort_index()
+        path = _partition_path(root, day, ticker)
+        if os.path.exists(path):
+            old = pq.read_table(path).to_pandas().set_index('time')
+            common = new.index.intersection(old.index)
+            o, n = old.loc[common], new.loc[common]
+            changed = ((o != n) & ~(o.isna() & n.isna())).any(axis=1)
+            updated = int(changed.sum())
+            counts['updated'] += updated
+            counts['unchanged'] += len(common) - updated
+            counts['inserted'] += len(new) - len(common)
+            if updated == 0 and len(new) == len(common):
+                continue
+            new = pd.concat([old.drop(common), new]).sort_index()
+        else:
+            counts['inserted'] += len(new)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(new.reset_index(), schema=_file_schema(),
+                                     preserve_index=False)
+        tmp = "{}.{}.tmp".format(path, threading.get_ident())
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+    print("Successfully recorded data to intraday store: "+\
+          "{inserted} inserted, {updated} updated, {unchanged} unchanged".format(**counts))
+    return counts
+
+def _filter(tickers=None, start=None, end=None, session_only=False):
+    '''returns pyarrow filter expression (None - no filter);
+    date and ticker predicates prune partitions'''
+    expr = []
+    if tickers != None:
+        if isinstance(tickers, str):
+            tickers = [tickers]
+        expr.append(ds.field('ticker').isin(list(tickers)))
+    if start != None:
+        start = _bound(start)
+        expr.append(ds.field('date') >= str(start.date()))
+        expr.append(ds.field('time') >= pa.scalar(start.to_pydatetime(), pa.timestamp('ms')))
+    if end != None:
+        end = _bound(end, end=True)
+        expr.append(ds.field('date') <= str(end.date()))
+        expr.append(ds.field('time') <= pa.scalar(end.to_pydatetime(), pa.timestamp('ms')))
+    if session_only:
+        minute = pc.add(pc.multiply(pc.hour(ds.field('time')), 60),
+                        pc.minute(ds.field('time')))
+        expr.append((minute >= SESSION_OPEN_MINUTE) & (minute <= SESSION_CLOSE_MINUTE))
+    if len(expr) == 0:
+        return None
+    res = expr[0]
+    for e in expr[1:]:
+        res = res & e
+    return res
+
+def _columns(columns):
+    '''validates requested intraday columns (None - all)'''
+    columns = list(INTRADAY_COLS if columns == None else columns)
+    unknown = [col for col in columns if col not in INTRADAY_COLS]
+    if len(unknown) > 0:
+        raise ValueError("Unknown intraday columns: {}".format(unknown))
+    return columns
+
+def _to_frame(table, columns, compact=False):
+    '''pyarrow table -> dataframe in common format sorted by time, ticker'''
+    df = table.to_pandas()
+    df = df.sort_values(['time', 'ticker'] if 'ticker' in df.columns else ['time'],
+                        kind='stable')
+    df.index = pd.DatetimeIndex(df.pop('time').values, name='time')
+    if compact:
+        for col in VALUE_COLS:
+            # volumes exceed float32 exact integer range - kept float64
+            if col in df.columns and col != 'volume':
+                df[col] = df[col].astype(np.float32)
+        if 'ticker' in df.columns:
+            df['ticker'] = df['ticker'].astype('category')
+    return df[columns]
+
+@instrumented
+def query_intraday(db_path, tickers=None, start=None, end=None,
+                   columns=None, session_only=False):
+    '''
+    Returns intraday data for any tickers and time range in one scan.
+    Read sql_utils.query_intraday() for parameters - same contract, with
+    store directory (or Database handle) instead of database path.
+    Only partitions of requested tickers and dates and requested columns
+    are read.
+    '''
+    columns = _columns(columns)
+    root = _root(db_path)
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name='time'))
+    read = ['time']+columns+(['ticker'] if 'ticker' not in columns else [])
+    table = _dataset(root).to_table(columns=read,
+                                    filter=_filter(tickers, start, end, session_only))
+    return _to_frame(table, columns)
+
+@instrumented
+def iter_db_intraday(db_path, by='ticker', chunk_rows=500000, tickers=None,
+                     start=None, end=None, columns=None, session_only=False,
+                     compact=False):
+    '''
+    Streams intraday data in frames - read sql_utils.iter_db_intraday().
+    by='ticker' and by='day' read one partition set at time,
+    by='rows' yields scanner batches of up to 'chunk_rows' rows
+    (each sorted, not ordered between batches).
+    '''
+    if by not in ('ticker', 'day', 'rows'):
+        raise ValueError("Unknown 'by' value: {}".format(by))
+    columns = _columns(columns)
+    root = _root(db_path)
+    if not os.path.isdir(root):
+        return
+    dset = _dataset(root)
+    read = ['time']+columns+(['ticker'] if 'ticker' not in columns else [])
+    expr = _filter(tickers, start, end, session_only)
+    if by == 'rows':
+        for batch in dset.to_batches(columns=read, filter=expr, batch_size=chunk_rows):
+            if batch.num_rows > 0:
+                yield _to_frame(pa.Table.from_batches([batch]), columns, compact)
+        return
+    key = 'ticker' if by == 'ticker' else 'date'
+    keys = pc.unique(dset.to_table(columns=[key], filter=expr)[key]).to_pylist()
+    for k in sorted(keys):
+        part = ds.field(key) == k
+        table = dset.to_table(columns=read, filter=part if expr == None else expr & part)
+        if table.num_rows > 0:
+            yield _to_frame(table, columns, compact)
+
+@instrumented
+def get_db_intraday_coverage(db_path, tickers=None, start=None, end=None):
+    '''
+    Returns (ticker, date) pairs present in store with minute counts -
+    read sql_utils.get_db_intraday_coverage(). Only partition columns are
+    read (row counts come from file metadata).
+    '''
+    root = _root(db_path)
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=['ticker', 'date', 'minutes'])
+    table = _dataset(root).to_table(columns=['ticker', 'date'],
+                                    filter=_filter(tickers, start, end))
+    df = table.group_by(['ticker', 'date']).aggregate([('date', 'count')]).to_pandas()
+    df = df.rename(columns={'date_count': 'minutes'})
+    df['date'] = [datetime.date.fromisoformat(d) for d in df['date']]
+    df = df.sort_values(['date', 'ticker'], kind='stable').reset_index(drop=True)
+    return df[['ticker', 'date', 'minutes']]
+
+@instrumented
+def get_db_intraday_all(db_path):
+    ''' returning all data from intraday store as dataframe
+        filtered and sorted for common application.
+        takes:
+            - db_path - string - store directory (or Database handle)'''
+    # getting dataframe
+    df = query_intraday(db_path)
+    print("Successfully retrieved all data from intraday store")
+    return df
+
+@instrumented
+def get_db_intraday_date(db_path, date):
+    ''' returning data filtered by date from intraday store as dataframe
+        filtered and sorted for common application.
+        takes:
+            - db_path - string - store directory (or Database handle)
+            - date - datetime.datetime(yyy, m, d).date() object'''
+    # getting dataframe
+    df = query_intraday(db_path, start=date, end=date)
+    print("Successfully retrieved requested data from intraday store")
+    return df
+
+@instrumented
+def get_db_intraday_ticker(db_path, ticker):
+    ''' returning data filtered by ticker from intraday store as dataframe
+        filtered and sorted for common application.
+        takes:
+            - db_path - string - store directory (or Database handle)
+            - ticker - string - ticker'''
+    # getting dataframe
+    df = query_intraday(db_path, tickers=ticker)
+    print("Successfully retrieved requested data from intraday store")
+    return df
+
+@instrumented
+def get_db_intraday_date_ticker(db_path, ticker, date):
+    ''' returning data filtered by date and ticker from intraday store as dataframe
+        filtered and sorted for common application.
+        takes:
+            - db_path - string - store directory (or Database handle)
+            - ticker - string - ticker
+            - date - datetime.datetime(yyy, m, d).date() object'''
+    # getting dataframe
+    df = query_intraday(db_path, tickers=ticker, start=date, end=date)
+    print("Successfully retrieved requested data from intraday store")
+    return df
+
+def _date_dirs(root, first=None, last=None):
+    '''returns (day, directory) of date partitions with day in
+    [first, last] (None - unbounded)'''
+    if not os.path.isdir(root):
+        return []
+    res = []
+    for name in sorted(os.listdir(root)):
+        if not name.startswith("date="):
+            continue
+        day = datetime.date.fromisoformat(name[len("date="):])
+        if (first == None or day >= first) and (last == None or day <= last):
+            res.append((day, os.path.join(root, name)))
+    return res
+
+def _delete_intraday_range(db_path, start, end, tickers):
+    '''delete_db_intraday_range() without message, returns deleted rows'''
+    first = None if start == None else _bound(start)
+    last = None if end == None else _bound(end, end=True)
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    deleted = 0
+    for day, day_dir in _date_dirs(_root(db_path), None if first == None else first.date(),
+                                   None if last == None else last.date()):
+        day_first = pd.Timestamp(day)
+        whole = (first == None or first <= day_first) and \
+            (last == None or last >= day_first + pd.Timedelta(minutes=24*60-1))
+        if tickers == None:
+            names = [name for name in os.listdir(day_dir) if name.startswith("ticker=")]
+        else:
+            names = ["ticker={}".format(quote(t, safe='')) for t in tickers]
+        for name in names:
+            path = os.path.join(day_dir, name, PART_FILE)
+            if not os.path.exists(path):
+                continue
+            if whole:
+                # whole ticker-day - partition removed
+                deleted += pq.ParquetFile(path).metadata.num_rows
+                shutil.rmtree(os.path.dirname(path))
+                continue
+            table = pq.read_table(path)
+            times = pd.DatetimeIndex(table.column('time').to_pandas())
+            drop = np.ones(len(times), dtype=bool)
+            if first != None:
+                drop &= times >= first
+            if last != None:
+                drop &= times <= last
+            if not drop.any():
+                continue
+            deleted += int(drop.sum())
+            if drop.all():
+                shutil.rmtree(os.path.dirname(path))
+                continue
+            tmp = "{}.{}.tmp".format(path, threading.get_ident())
+            pq.write_table(table.filter(pa.array(~drop)), tmp)
+            os.replace(tmp, path)
+        if len(os.listdir(day_dir)) == 0:
+            os.rmdir(day_dir)
+    return deleted
+
+@instrumented
+def delete_db_intraday_range(db_path, start=None, end=None, tickers=None, vacuum=False):
+    '''
+    Deletes intraday data in time range and/or of tickers - read
+    sql_utils.delete_db_intraday_range(). Whole ticker-day partitions
+    inside range are removed, partially covered ones are rewritten.
+    'vacuum' has no effect (removed files free space right away).
+    
+    Returns
+    -------
+    int - number of deleted rows.
+    '''
+    deleted = _delete_intraday_range(db_path, start, end, tickers)
+    print("Deleted {} rows from intraday store successfully.".format(deleted))
+    return deleted
+
+@instrumented
+def delete_db_intraday_date(db_path, date, vacuum=False):
+    '''Deleting data for required date from intraday store
+    takes:
+        - db_path - string - store directory (or Database handle)
+        - date - datetime.datetime(yyy, m, d).date() object
+        - vacuum - bool - no effect (partition files are removed)
+    returns:
+        int - number of deleted rows
+        '''
+    deleted = _delete_intraday_range(db_path, date, date, None)
+    print("Deleted {} from intraday store successfully ({} rows).".format(date, deleted))
+    return deleted
+
+@instrumented
+def delete_db_intraday_ticker(db_path, ticker, start=None, end=None, vacuum=False):
+    '''Deleting data of ticker (optionally in time range) from intraday store
+    takes:
+        - db_path - string - store directory (or Database handle)
+        - ticker - string or list of strings - ticker(s)
+        - start, end, vacuum - read delete_db_intraday_range()
+    returns:
+        int - number of deleted rows'''
+    return delete_db_intraday_range(db_path, start=start, end=end, tickers=ticker,
+                                    vacuum=vacuum)
+
+@instrumented
+def apply_intraday_retention(db_path, keep_days, today=None, vacuum=True):
+    '''Deletes intraday data older than 'keep_days' calendar days -
+    read sql_utils.apply_intraday_retention()
+    returns:
+        int - number of deleted rows'''
+    today = datetime.datetime.now().date() if today == None else today
+    cutoff = today - datetime.timedelta(days=keep_days)
+    print("Retention: deleting intraday data up to {}".format(cutoff))
+    return delete_db_intraday_range(db_path, end=cutoff, vacuum=vacuum)
+
+@instrumented(rows=False)
+def vacuum_db(db_path, max_pages=0):
+    '''no-op kept for parity with sql_utils.vacuum_db() - removed
+    partition files free space right away
+    returns:
+        int - number of freed pages (always 0)'''
+    return 0
+
+@instrumented
+def get_db_daily_summary(db_path, ticker, day):
+    '''returns session summary of ticker at day - read
+    sql_utils.get_db_daily_summary(); computed from session minutes
+    of single ticker-day partition (no summary table in store)'''
+    d = query_intraday(db_path, tickers=ticker, start=day, end=day, session_only=True)
+    if d.empty:
+        return None
+    minutes = d.index.hour * 60 + d.index.minute
+    opn = d['open'].values[minutes == SESSION_OPEN_MINUTE]
+    cle = d['close'].values[minutes == SESSION_CLOSE_MINUTE]
+    return {'open': float(opn[0]) if len(opn) > 0 else None,
+            'high': float(d['high'].max()), 'low': float(d['low'].min()),
+            'close': float(cle[0]) if len(cle) > 0 else None,
+            'avg_volume': float(d['volume'].mean()),
+            'total_volume': float(d['volume'].sum()), 'minutes': int(d.shape[0])}
+
+def _unsupported(name, hint):
+    '''returns function failing with NotImplementedError for sql_utils
+    feature missing in Parquet store'''
+    def unsupported(*args, **kwargs):
+        raise NotImplementedError("{} is not supported by Parquet storage ".format(name)+\
+                                  "backend: {}".format(hint))
+    unsupported.__name__ = name
+    unsupported.__doc__ = "not supported by Parquet store ({})".format(hint)
+    return unsupported
+
+# sql_utils features without Parquet counterpart - fail clearly instead of
+# AttributeError or silently using sqlite database
+query_daily_summary = _unsupported("query_daily_summary",
+                                   "use get_db_daily_summary() per ticker-day")
+rebuild_daily_summary = _unsupported("rebuild_daily_summary", "no summary table in store")
+rec_db_daily_bars_df = _unsupported("rec_db_daily_bars_df", "daily_bars table is sqlite only")
+query_daily_bars = _unsupported("query_daily_bars", "daily_bars table is sqlite only")
+partition_intraday_monthly = _unsupported("partition_intraday_monthly",
+                                          "store is partitioned by date already")
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17, 2026
+
+Offline Polygon stand-in server
+
+Local HTTP server answering Polygon endpoints used by data_loader
+with deterministic synthetic data:
+    /v2/aggs/ticker/{ticker}/range/{multiplier}/minute/{from}/{to}
+    /v2/aggs/grouped/locale/us/market/stocks/{date}
+    /v2/reference/tickers
+    /v1/last/stocks/{ticker}
+    /v2/snapshot/locale/us/markets/stocks/tickers
+Latency, 429 rate limits, empty responses and server errors can be
+injected to exercise collection paths without credentials or network.
+
+Usage:
+    python polygon_standin.py --port 8077 --latency 0.05 --p-429 0.02
+    POLYGON_BASE_URL=http://127.0.0.1:8077 POLYGON_API_KEY=standin python ...
+
+@author: vyachez
+"""
+# Imports
+import numpy as np
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SESSION_MINUTES = 390 # 9:30 - 15:59
+UNIVERSE_SIZE = 500 # synthetic tickers in reference endpoint
+
+
+@lru_cache(maxsize=4096)
+def day_bars(ticker, day):
+    '''
+        Deterministic synthetic session minute bars for ticker and day
+        takes:
+            - ticker - str
+            - day - datetime.date() - weekends have no bars
+        returns:
+            list of dicts in Polygon aggregates 'results' format
+    '''
+    if day.weekday() > 4:
+        return []
+    rng = np.random.default_rng(zlib.crc32("{}{}".format(ticker, day).encode()))
+    base = 20 + zlib.crc32(ticker.encode()) % 300
+    close = base * np.exp(np.cumsum(rng.normal(0, 0.0008, SESSION_MINUTES)))
+    opn = np.concatenate([[base], close[:-1]])
+    high = np.maximum(opn, close) * (1 + rng.random(SESSION_MINUTES) * 0.001)
+    low = np.minimum(opn, close) * (1 - rng.random(SESSION_MINUTES) * 0.001)
+    vol = rng.integers(100, 20000, SESSION_MINUTES)
+    # local wall clock 9:30, so clients decode bars to session minutes
+    t0 = int(datetime.datetime(day.year, day.month, day.day, 9, 30).timestamp() * 1000)
+    return [{'v': int(vol[i]), 'vw': round(float(close[i]), 4),
+             'o': round(float(opn[i]), 4), 'c': round(float(close[i]), 4),
+             'h': round(float(high[i]), 4), 'l': round(float(low[i]), 4),
+             't': t0 + i * 60000, 'n': int(vol[i] // 100) + 1}
+            for i in range(SESSION_MINUTES)]
+
+def universe_tickers(size=UNIVERSE_SIZE):
+    '''returns synthetic tickers universe "T0000", "T0001", ...'''
+    return ["T{:04d}".format(i) for i in range(size)]
+
+def _parse_bound(value, end=False):
+    '''aggs range bound: "yyyy-mm-dd" or epoch ms -> epoch ms'''
+    if value.isdigit():
+        return int(value)
+    day = datetime.datetime.strptime(value, "%Y-%m-%d")
+    if end:
+        day = day + datetime.timedelta(days=1)
+    return int(day.timestamp() * 1000) - (1 if end else 0)
+
+
+class StandinConfig():
+    '''
+        Fault injection settings of stand-in server.
+        takes:
+            - latency - float - seconds added to every response
+            - jitter - float - random extra latency up to 'jitter' seconds
+            - p_429 - float - share of requests answered 429 (with Retry-After)
+            - p_empty - float - share of requests answered with empty results
+            - p_error - float - share of requests answered 500
+            - retry_after - int - Retry-After header value on 429 (seconds)
+            - seed - int - random seed of injected faults
+    '''
+    def __init__(self, latency=0.0, jitter=0.0, p_429=0.0, p_empty=0.0,
+                 p_error=0.0, retry_after=1, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.p_429 = p_429
+        self.p_empty = p_empty
+        self.p_error = p_error
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        '''returns injected outcome for next request and its latency'''
+        with self.lock:
+            x = self.rng.random()
+            delay = self.latency + self.rng.random() * self.jitter
+        if x < self.p_429:
+            return "429", delay
+        if x < self.p_429 + self.p_error:
+            return "error", delay
+        if x < self.p_429 + self.p_error + self.p_empty:
+            return "empty", delay
+        return "ok", delay
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    '''routes Polygon paths to synthetic responses'''
+    protocol_version = "HTTP/1.1" # keep-alive, as real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(status)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split("/") if p]
+        outcome, delay = self.server.config.draw()
+        if delay > 0:
+            time.sleep(delay)
+        if outcome == "429":
+            return self._send(429, {"status": "ERROR",
+                                    "error": "You've exceeded the maximum requests per minute"},
+                              {"Retry-After": str(self.server.config.retry_after)})
+        if outcome == "error":
+            return self._send(500, {"status": "ERROR", "error": "Internal server error"})
+        empty = outcome == "empty"
+        try:
+            if parts[:3] == ["v2", "aggs", "ticker"] and len(parts) == 9:
+                return self._aggs(parts[3], parts[7], parts[8], query, empty)
+            if parts[:3] == ["v2", "aggs", "grouped"] and len(parts) == 8:
+                return self._grouped(parts[7], empty)
+            if parts[:3] == ["v2", "reference", "tickers"]:
+                return self._tickers(query, empty)
+            if parts[:3] == ["v1", "last", "stocks"] and len(parts) == 4:
+                return self._last(parts[3], empty)
+            if parts[:2] == ["v2", "snapshot"]:
+                return self._snapshot(query, empty)
+        except (ValueError, KeyError) as ex:
+            return self._send(400, {"status": "ERROR", "error": str(ex)})
+        return self._send(404, {"status": "NOT_FOUND"})
+
+    def _aggs(self, ticker, start, end, query, empty):
+        st = _parse_bound(start)
+        en = _parse_bound(end, end=True)
+        limit = int(query.get("limit", 5000))
+        offset = int(query.get("cursor", 0))
+        bars = []
+        if not empty:
+            day = datetime.datetime.fromtimestamp(st / 1000).date()
+            last = datetime.datetime.fromtimestamp(en / 1000).date()
+            while day <= last:
+                bars.extend(b for b in day_bars(ticker, day) if st <= b['t'] <= en)
+                day += datetime.timedelta(days=1)
+        page = bars[offset:offset+limit]
+        payload = {"ticker": ticker, "status": "OK", "adjusted": True,
+                   "queryCount": len(bars), "resultsCount": len(page)}
+        if len(page) > 0:
+            payload["results"] = page
+        if offset + limit < len(bars):
+            path = self.path.split("?")[0]
+            payload["next_url"] = "{}{}?sort=asc&limit={}&cursor={}".format(
+                self.server.url, path, limit, offset + limit)
+        return self._send(200, payload)
+
+    def _grouped(self, date, empty):
+        day = datetime.datetime.strptime(date, "%Y-%m-%d").date()
+        rows = []
+        for tk in ([] if empty else universe_tickers(self.server.universe_size)):
+            bars = day_bars(tk, day)
+            if len(bars) == 0:
+                continue
+            vol = sum(b['v'] for b in bars)
+            rows.append({'T': tk, 'o': bars[0]['o'], 'c': bars[-1]['c'],
+                         'h': max(b['h'] for b in bars), 'l': min(b['l'] for b in bars),
+                         'v': vol, 'vw': round(sum(b['vw'] * b['v'] for b in bars) / vol, 4),
+                         'n': sum(b['n'] for b in bars), 't': bars[-1]['t'] + 60000})
+        payload = {"status": "OK", "adjusted": True,
+                   "queryCount": len(rows), "resultsCount": len(rows)}
+        if len(rows) > 0:
+            payload["results"] = rows
+        return self._send(200, payload)
+
+    def _tickers(self, query, empty):
+        universe = universe_tickers(self.server.universe_size)
+        perpage = int(query.get("perpage", 50))
+        page = int(query.get("page", 1))
+        rows = [] if empty else [{"ticker": tk, "name": "Synthetic {}".format(tk),
+                                  "market": "STOCKS", "locale": "US", "currency": "USD",
+                                  "active": True, "primaryExch": "NYE",
+                                  "updated": "2020-01-02", "url": ""}
+                                 for tk in universe[(page-1)*perpage:page*perpage]]
+        return self._send(200, {"page": page, "perPage": perpage,
+                                "count": len(universe), "status": "OK",
+                                "tickers": rows})
+
+    def _price(self, ticker):
+        bars = day_bars(ticker, _last_session_day())
+        return bars[-1]['c']
+
+    def _last(self, ticker, empty):
+        if empty:
+            return self._send(404, {"status": "NOT_FOUND"})
+        return self._send(200, {"status": "success", "symbol": ticker,
+                                "last": {"price": self._price(ticker), "size": 100,
+                                         "exchange": 4,
+                                         "timestamp": int(time.time() * 1000)}})
+
+    def _snapshot(self, query, empty):
+        tickers = [tk for tk in query.get("tickers", "").split(",") if tk]
+        rows = [] if empty else [{"ticker": tk,
+                                  "lastTrade": {"p": self._price(tk), "s": 100,
+                                                "t": int(time.time() * 1e9)}}
+                                 for tk in tickers]
+        return self._send(200, {"status": "OK", "tickers": rows})
+
+def _last_session_day():
+    '''returns today or latest weekday before it'''
+    day = datetime.datetime.now().date()
+    while day.weekday() > 4:
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+class StandinServer(ThreadingHTTPServer):
+    '''
+        Stand-in server with request counters.
+        stats - dict - requests served in total and by status code
+    '''
+    daemon_threads = True
+
+    def __init__(self, config, port=0, universe_size=UNIVERSE_SIZE):
+        super().__init__(("127.0.0.1", port), StandinHandler)
+        self.config = config
+        self.universe_size = universe_size
+        self.url = "http://127.0.0.1:{}".format(self.server_address[1])
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, status):
+        with self.stats_lock:
+            self.stats["requests"] = self.stats.get("requests", 0) + 1
+            self.stats[status] = self.stats.get(status, 0) + 1
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {}
+
+def start_standin(config=None, port=0, universe_size=UNIVERSE_SIZE):
+    '''
+        Starts stand-in server in background thread
+        takes:
+            - config - StandinConfig - fault injection (None - no faults)
+            - port - int - port to listen on 127.0.0.1 (0 - any free)
+            - universe_size - int - synthetic tickers in reference endpoint
+        returns:
+            StandinServer (server.url - base url, server.shutdown() to stop)
+    '''
+    server = StandinServer(config or StandinConfig(), port, universe_size)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Polygon stand-in server")
+    parser.add_argument("--port", type=int, default=8077)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--p-429", type=float, default=0.0)
+    parser.add_argument("--p-empty", type=float, default=0.0)
+    parser.add_argument("--p-error", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--universe-size", type=int, default=UNIVERSE_SIZE)
+    args = parser.parse_args()
+    config = StandinConfig(args.latency, args.jitter, args.p_429, args.p_empty,
+                           args.p_error, args.retry_after)
+    server = StandinServer(config, args.port, args.universe_size)
+    print("Polygon stand-in serving at {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
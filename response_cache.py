@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17, 2026
+
+On-disk cache of raw Polygon aggregates responses
+
+Responses are stored gzip compressed, one file per
+(ticker, multiplier, start_date, end_date) request.
+Responses stored after the close of range's last session (extended
+hours, New York time) never expire; responses stored earlier expire
+after 'today_ttl' seconds or as soon as that session closes. Least
+recently used files are evicted when cache grows above 'max_bytes'
+(size is tracked on writes, directory is scanned only to evict).
+
+@author: vyachez
+"""
+# Imports
+import os
+import re
+import gzip
+import json
+import time
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+
+MARKET_TZ = ZoneInfo("America/New_York")
+SESSION_END = datetime.time(20, 0) # end of extended hours session
+
+
+class ResponseCache():
+    '''
+        Disk cache for raw json responses.
+        takes:
+            - cache_dir - str - directory to keep cached responses in
+            - max_bytes - int - cache size limit (compressed bytes)
+            - today_ttl - int - seconds before responses of unfinished sessions expire
+    '''
+    def __init__(self, cache_dir, max_bytes=2*1024**3, today_ttl=300):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.today_ttl = today_ttl
+        self.lock = threading.Lock()
+        self._size = None # bytes of cached files, counted on first write
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, ticker, multiplier, start_date, end_date):
+        '''returns cache file path for request'''
+        name = "{}_{}_{}_{}.json.gz".format(ticker, multiplier, start_date, end_date)
+        return os.path.join(self.cache_dir, re.sub(r'[^\w.\-]', '_', name))
+
+    def _expired(self, path, end_date):
+        '''responses stored after end_date session close are final, others
+        live today_ttl seconds, but not past the close'''
+        close = _session_close(end_date)
+        stored = os.path.getmtime(path)
+        if stored >= close:
+            return False
+        now = time.time()
+        return now >= close or now - stored > self.today_ttl
+
+    def get(self, ticker, multiplier, start_date, end_date):
+        '''returns cached json (dict) or None if missing or expired'''
+        path = self.path(ticker, multiplier, start_date, end_date)
+        try:
+            if self._expired(path, end_date):
+                return None
+            with gzip.open(path, 'rt') as f:
+                jsn = json.load(f)
+            # marking as recently used (access time only - mtime keeps ttl)
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+            return jsn
+        except (OSError, ValueError):
+            return None
+
+    def put(self, ticker, multiplier, start_date, end_date, jsn):
+        '''stores json (dict) response and evicts old entries if needed'''
+        path = self.path(ticker, multiplier, start_date, end_date)
+        tmp = "{}.{}.tmp".format(path, threading.get_ident())
+        with gzip.open(tmp, 'wt', compresslevel=6) as f:
+            json.dump(jsn, f)
+        with self.lock:
+            if self._size == None:
+                self._size = self.size()
+            try:
+                self._size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp, path)
+            self._size += os.path.getsize(path)
+            full = self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def size(self):
+        '''returns total size of cached files in bytes'''
+        return sum(e.stat().st_size for e in os.scandir(self.cache_dir)
+                   if e.name.endswith('.json.gz'))
+
+    def evict(self):
+        '''removes least recently used files until cache fits max_bytes'''
+        with self.lock:
+            entries = []
+            for e in os.scandir(self.cache_dir):
+                if e.name.endswith('.json.gz'):
+                    st = e.stat()
+                    entries.append((st.st_atime, st.st_size, e.path))
+            total = sum(sz for _, sz, _ in entries)
+            for _, sz, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= sz
+                except OSError:
+                    pass
+            self._size = total
+
+    def clear(self):
+        '''removes all cached files'''
+        with self.lock:
+            for e in os.scandir(self.cache_dir):
+                if e.name.endswith('.json.gz'):
+                    os.remove(e.path)
+            self._size = 0
+
+def _session_close(date):
+    '''returns epoch seconds of session end of date (New York time)'''
+    close = datetime.datetime.combine(_to_date(date), SESSION_END, tzinfo=MARKET_TZ)
+    return close.timestamp()
+
+def _to_date(date):
+    '''converts "yyyy-mm-dd" string or date object to datetime.date()'''
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    if isinstance(date, datetime.date):
+        return date
+    return datetime.datetime.strptime(str(date)[:10], "%Y-%m-%d").date()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18, 2026
+
+Retry scheduling for data collection
+
+Shared by collectors instead of hand-made retry loops:
+    Backoff - exponential delays with jitter, never shorter than
+              provider's Retry-After
+    CircuitBreaker - per provider (get_breaker("polygon")): after
+              'failure_threshold' failures in a row provider is skipped
+              for 'reset_timeout' seconds, then tried again with one call
+    RetryScheduler - work queue: failed items go to the end of the queue
+              with their backoff delay instead of blocking the loop,
+              other items are worked on meanwhile (one at a time or
+              in worker threads)
+Retryable failures are signalled with RetryableError: RateLimited (HTTP
+429) and ProviderUnavailable (5xx, timeouts) count against provider's
+breaker, BlankData (provider answered without data) is retried per item
+and does not touch the breaker.
+
+@author: vyachez
+"""
+# Imports
+import time
+import random
+import logging
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED
+from concurrent.futures import wait as futures_wait
+from email.utils import parsedate_to_datetime
+
+
+class RetryableError(Exception):
+    '''
+        Failure worth retrying later.
+        takes:
+            - msg - str
+            - retry_after - float - seconds provider asked to wait (None - unknown)
+    '''
+    def __init__(self, msg="", retry_after=None):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+class RateLimited(RetryableError):
+    '''provider answered HTTP 429'''
+
+class ProviderUnavailable(RetryableError):
+    '''provider answered HTTP 5xx'''
+
+class BlankData(RetryableError):
+    '''provider answered without data (not provider failure)'''
+
+# failures of provider itself - counted by circuit breaker
+PROVIDER_ERRORS = (RateLimited, ProviderUnavailable)
+
+
+def retry_after_seconds(headers):
+    '''returns seconds of Retry-After header (delay or HTTP date) or None'''
+    value = (headers or {}).get('Retry-After')
+    if value == None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.datetime.now(when.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class Backoff():
+    '''
+        Exponential backoff with jitter.
+        takes:
+            - base - float - seconds of first delay
+            - factor - float - growth per attempt
+            - max_wait - float - delay cap (before jitter)
+            - jitter - float - share of delay drawn at random (0 - none, 1 - full jitter)
+    '''
+    def __init__(self, base=1.0, factor=2.0, max_wait=120.0, jitter=0.5):
+        self.base = base
+        self.factor = factor
+        self.max_wait = max_wait
+        self.jitter = jitter
+
+    def delay(self, attempt, retry_after=None):
+        '''returns seconds to wait after failed attempt number 'attempt'
+        (0 - first), at least 'retry_after' '''
+        cap = min(self.max_wait, self.base * self.factor ** attempt)
+        wait = cap * (1 - self.jitter) + random.uniform(0, cap * self.jitter)
+        if retry_after != None:
+            wait = max(wait, retry_after)
+        return wait
+
+
+class CircuitBreaker():
+    '''
+        Circuit breaker of single provider (thread safe).
+        "closed" - calls allowed; "open" - provider skipped after
+        'failure_threshold' failures in a row; "half-open" - after
+        'reset_timeout' seconds one trial call is allowed, its success
+        closes breaker, failure opens it again.
+        takes:
+            - name - str - provider name
+            - failure_threshold - int - failures in a row to open
+            - reset_timeout - float - seconds before trial call
+    '''
+    def __init__(self, name, failure_threshold=5, reset_timeout=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None # time.monotonic() of opening
+        self.trial = False # half-open trial call in flight
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened == None:
+            return "closed"
+        if time.monotonic() - self.opened >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        '''returns True if call to provider may be made now'''
+        with self.lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def retry_in(self):
+        '''returns seconds until provider may be tried again (0 - now)'''
+        with self.lock:
+            if self.opened == None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened))
+
+    def record_success(self):
+        with self.lock:
+            if self.opened != None:
+                logging.info("Provider {} recovered".format(self.name))
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def release(self):
+        '''ends trial call without outcome (call failed for other reason)'''
+        with self.lock:
+            self.trial = False
+
+    def failures_in_row(self):
+        '''returns failures in a row since last success'''
+        with self.lock:
+            return self.failures
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or (self.opened == None and
+                              self.failures >= self.failure_threshold):
+                if self.opened == None:
+                    msg = "Provider {} is degraded ({} failures in a row), ".format(
+                        self.name, self.failures)+\
+                        "skipping it for {} seconds".format(self.reset_timeout)
+                    print(msg)
+                    logging.warning(msg)
+                self.opened = time.monotonic()
+            self.trial = False
+
+# one breaker per provider shared by all collectors of process
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(provider, failure_threshold=5, reset_timeout=60.0):
+    '''returns CircuitBreaker of provider (created on first call)'''
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider, failure_threshold, reset_timeout)
+        return _breakers[provider]
+
+
+class RetryScheduler():
+    '''
+        Work queue running work(item, provider) for every item.
+        RetryableError puts item to the end of queue, due after backoff
+        delay (or Retry-After); meanwhile other items are worked on.
+        Providers are tried in order: provider with open breaker is
+        skipped, item moves to next provider after 'failover_after'
+        failures on current one.
+        takes:
+            - providers - list - provider names in order of preference
+            - max_attempts - int - attempts per item
+            - backoff - Backoff (None - Backoff())
+            - failover_after - int - item failures before next provider
+            - poll - float - seconds between checks while trial call of
+                             half-open provider is in flight
+    '''
+    def __init__(self, providers=("polygon",), max_attempts=10, backoff=None,
+                 failover_after=5, poll=0.5):
+        self.providers = list(providers)
+        self.max_attempts = max_attempts
+        self.backoff = backoff if backoff != None else Backoff()
+        self.failover_after = failover_after
+        self.poll = poll
+
+    def provider(self, failures):
+        '''returns (provider, wait) - provider for item with 'failures'
+        failures so far and seconds to wait if all breakers are open'''
+        first = min(failures // max(1, self.failover_after), len(self.providers) - 1)
+        candidates = self.providers[first:]
+        for p in candidates:
+            if get_breaker(p).allow():
+                return p, 0.0
+        # all open - waiting for earliest trial (polling while trial
+        # call of half-open provider is in flight)
+        waits = [get_breaker(p).retry_in() for p in candidates]
+        i = waits.index(min(waits))
+        return candidates[i], max(waits[i], self.poll)
+
+    def pause(self, provider):
+        '''returns seconds to hold off new requests to provider:
+        0 if healthy, growing with its failures in a row'''
+        breaker = get_breaker(provider)
+        failures = breaker.failures_in_row()
+        if failures == 0:
+            return 0.0
+        return max(breaker.retry_in(), self.backoff.delay(failures - 1))
+
+    def run(self, items, work, on_fail=None, workers=1):
+        '''
+            Runs work(item, provider) for all items.
+            takes:
+                - items - iterable - work items (hashable, e.g. tickers)
+                - work - callable - returns item result or raises
+                                    RetryableError (retry later) / other
+                                    Exception (item failed); only
+                                    PROVIDER_ERRORS count against breaker
+                - on_fail - callable - on_fail(item, error) for items
+                                       given up on
+                - workers - int - items worked on at once (work runs in
+                                  worker threads if more than 1)
+            returns:
+                dict - {item: result} of succeeded items
+        '''
+        queue = deque((item, 0, 0.0) for item in items) # item, failures, due time
+        results = {}
+        if workers <= 1:
+            while len(queue) > 0:
+                entry, wait = self._next(queue)
+                if entry == None:
+                    time.sleep(wait)
+                    continue
+                item, failures, provider = entry
+                self._finish(entry, lambda: work(item, provider), queue, results, on_fail)
+            return results
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            while len(queue) > 0 or len(running) > 0:
+                wait = None
+                while len(queue) > 0 and len(running) < workers:
+                    entry, wait = self._next(queue)
+                    if entry == None:
+                        break
+                    running[pool.submit(work, entry[0], entry[2])] = entry
+                    wait = None
+                if len(running) == 0:
+                    time.sleep(wait)
+                    continue
+                # first finished item (or next item due while slots are free)
+                done, _ = futures_wait(running, timeout=wait, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(running.pop(future), future.result, queue, results, on_fail)
+        return results
+
+    def _next(self, queue):
+        '''takes first due item of queue with provider to use ->
+        ((item, failures, provider), None); if none is due - (None, seconds
+        to wait); items with all providers open go back to queue'''
+        while True:
+            now = time.monotonic()
+            wait = min(e[2] for e in queue) - now
+            if wait > 0:
+                return None, wait
+            # first due item, not due ones rotate to the end
+            while queue[0][2] > now:
+                queue.rotate(-1)
+            item, failures, due = queue.popleft()
+            provider, wait = self.provider(failures)
+            if wait > 0:
+                queue.append((item, failures, now + wait))
+                continue
+            return (item, failures, provider), None
+
+    def _finish(self, entry, result, queue, results, on_fail):
+        '''records outcome of work call (result() returns or raises it):
+        item result, requeue with backoff delay or giving up'''
+        item, failures, provider = entry
+        breaker = get_breaker(provider)
+        try:
+            results[item] = result()
+            breaker.record_success()
+        except RetryableError as ex:
+            if isinstance(ex, PROVIDER_ERRORS):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            failures += 1
+            if failures >= self.max_attempts:
+                self._give_up(item, ex, on_fail)
+                return
+            delay = self.backoff.delay(failures - 1, ex.retry_after)
+            msg = "Retrying {} in {:.1f} seconds ({}: {})".format(item, delay,
+                                                                   provider, ex)
+            print(msg)
+            logging.warning(msg)
+            queue.append((item, failures, time.monotonic() + delay))
+        except Exception as ex:
+            breaker.release()
+            self._give_up(item, ex, on_fail)
+
+    def _give_up(self, item, error, on_fail):
+        msg = "Giving up on {}: {}".format(item, error)
+        print(msg)
+        logging.critical(msg)
+        if on_fail != None:
+            on_fail(item, error)
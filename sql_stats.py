@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18, 2026
+
+Instrumentation of database calls
+
+Every instrumented call (sql_utils functions) records wall time, rows
+returned or written and bytes (dataframe memory) to in-process 'stats':
+    import sql_utils as stkl
+    ... collection / analysis run ...
+    print(stkl.stats.summary())
+Optional JSON-lines log of every call: STRACK_SQL_LOG=<path> environment
+variable or stats.enable_log(path).
+Debug mode logs EXPLAIN QUERY PLAN of every distinct statement executed on
+sql_utils connections and warns about full table scans:
+STRACK_SQL_EXPLAIN=1 environment variable or stats.set_explain(True).
+
+@author: vyachez
+"""
+# Imports
+import os
+import json
+import time
+import logging
+import inspect
+import sqlite3
+import datetime
+import functools
+import itertools
+import threading
+
+import pandas as pd
+
+EXPLAIN_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+
+class QueryStats():
+    '''
+        Accumulates per function calls, wall time, rows and bytes.
+        takes:
+            - log_path - str - JSON-lines log file (None - no log)
+            - explain - bool - log query plans of distinct statements
+    '''
+    def __init__(self, log_path=None, explain=False):
+        self.lock = threading.Lock()
+        self.log_path = log_path
+        self.explain = explain
+        self.calls = {}
+        self.plans = {}
+
+    def enable_log(self, path):
+        '''appends record of every call to JSON-lines file 'path' '''
+        self.log_path = path
+
+    def disable_log(self):
+        self.log_path = None
+
+    def set_explain(self, on=True):
+        '''switches query plan logging (debug mode)'''
+        self.explain = on
+
+    def reset(self):
+        '''clears accumulated stats and seen statements'''
+        with self.lock:
+            self.calls = {}
+            self.plans = {}
+
+    def record(self, func, seconds, rows=0, nbytes=0, error=None):
+        '''adds one call of function 'func' '''
+        with self.lock:
+            st = self.calls.setdefault(func, {'calls': 0, 'seconds': 0.0,
+                                              'rows': 0, 'bytes': 0, 'errors': 0})
+            st['calls'] += 1
+            st['seconds'] += seconds
+            st['rows'] += rows
+            st['bytes'] += nbytes
+            st['errors'] += error != None
+        self._log({'func': func, 'seconds': round(seconds, 6), 'rows': rows,
+                   'bytes': nbytes, 'error': error})
+
+    def summary(self):
+        '''
+            returns Pandas Dataframe - one row per function sorted by total time:
+            calls, seconds, mean_ms, rows, bytes, errors
+        '''
+        with self.lock:
+            df = pd.DataFrame.from_dict(self.calls, orient='index',
+                                        columns=['calls', 'seconds', 'rows',
+                                                 'bytes', 'errors'])
+        df.index.name = 'func'
+        df.insert(2, 'mean_ms', df['seconds'] / df['calls'].clip(lower=1) * 1000)
+        return df.sort_values('seconds', ascending=False)
+
+    def explain_plan(self, conn, sql, params=()):
+        '''logs query plan of statement once per distinct statement text'''
+        key = " ".join(sql.split())
+        if not key.upper().startswith(EXPLAIN_STATEMENTS):
+            return
+        with self.lock:
+            if key in self.plans:
+                return
+            self.plans[key] = None
+        try:
+            cur = conn.cursor(sqlite3.Cursor) # plain cursor - no recursion
+            plan = [r[-1] for r in cur.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        except (sqlite3.Error, ValueError) as ex:
+            plan = ["not available: {}".format(ex)]
+        # schema lookups scan tiny sqlite_master - not reported
+        full_scan = any(p.startswith('SCAN') and 'CONSTANT ROW' not in p and
+                        'sqlite_master' not in p for p in plan)
+        with self.lock:
+            self.plans[key] = plan
+        msg = "EXPLAIN QUERY PLAN {}\n    {}".format(key, "\n    ".join(plan))
+        if full_scan:
+            logging.warning("Full scan in query plan: " + msg)
+        else:
+            logging.info(msg)
+        self._log({'explain': key, 'plan': plan, 'full_scan': full_scan})
+
+    def _log(self, rec):
+        '''appends record to JSON-lines log if enabled'''
+        path = self.log_path
+        if path == None:
+            return
+        rec = dict({'ts': datetime.datetime.now().isoformat(timespec='milliseconds'),
+                    'pid': os.getpid()}, **rec)
+        line = json.dumps(rec, default=str) + "\n"
+        with self.lock:
+            with open(path, 'a') as f:
+                f.write(line)
+
+stats = QueryStats(os.environ.get("STRACK_SQL_LOG"),
+                   os.environ.get("STRACK_SQL_EXPLAIN", "0") == "1")
+
+
+def _measure(obj):
+    '''returns (rows, bytes) of call result or written dataframe'''
+    if isinstance(obj, pd.DataFrame):
+        return len(obj), int(obj.memory_usage(index=True).sum())
+    if isinstance(obj, bool) or obj is None:
+        return 0, 0
+    if isinstance(obj, int):
+        return obj, 0
+    if isinstance(obj, (list, tuple)):
+        return len(obj), 0
+    return 0, 0
+
+# instrumented calls in progress per thread - nested calls (instrumented
+# function calling another one) are not recorded, so time is not counted twice
+_calls = threading.local()
+
+def _enter():
+    '''marks instrumented call start, True if it is outermost call of thread'''
+    depth = getattr(_calls, 'depth', 0)
+    _calls.depth = depth + 1
+    return depth == 0
+
+def _leave():
+    _calls.depth -= 1
+
+def instrumented(func=None, rows=True):
+    '''
+        Decorator recording calls of database function to 'stats'.
+        Rows/bytes - of returned dataframe (or list / row count) or, for
+        writers, of dataframe argument; generators are measured over all
+        yielded frames (time spent inside generator only). Calls made
+        inside other instrumented call are not recorded.
+        @instrumented(rows=False) - returned value is not a row count
+        (e.g. freed pages).
+    '''
+    if func == None:
+        return functools.partial(instrumented, rows=rows)
+    name = func.__name__
+    def written(args, kwargs):
+        frames = [a for a in itertools.chain(args, kwargs.values())
+                  if isinstance(a, pd.DataFrame)]
+        return _measure(frames[0]) if len(frames) > 0 else (0, 0)
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            seconds, n, nbytes, error = 0.0, 0, 0, None
+            outer = False # any step made outside other instrumented call
+            gen = func(*args, **kwargs)
+            try:
+                while True:
+                    top = _enter()
+                    st = time.perf_counter()
+                    try:
+                        frame = next(gen)
+                    except StopIteration:
+                        break
+                    finally:
+                        _leave()
+                        if top:
+                            outer = True
+                            seconds += time.perf_counter() - st
+                    if top:
+                        r, b = _measure(frame)
+                        n, nbytes = n + r, nbytes + b
+                    yield frame
+            except Exception as ex:
+                error = repr(ex)
+                raise
+            finally:
+                gen.close()
+                if outer:
+                    stats.record(name, seconds, n, nbytes, error)
+        return gen_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enter():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _leave()
+        st = time.perf_counter()
+        try:
+            res = func(*args, **kwargs)
+        except Exception as ex:
+            stats.record(name, time.perf_counter() - st, error=repr(ex))
+            raise
+        finally:
+            _leave()
+        seconds = time.perf_counter() - st
+        n, nbytes = _measure(res)
+        if res is None or isinstance(res, dict) and 'inserted' in res:
+            n, nbytes = written(args, kwargs)
+        elif isinstance(res, dict):
+            n = 1
+        elif not rows:
+            n = 0
+        stats.record(name, seconds, n, nbytes)
+        return res
+    return wrapper
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    '''cursor logging query plans of executed statements in debug mode'''
+    def execute(self, sql, params=()):
+        if stats.explain:
+            stats.explain_plan(self.connection, sql, params)
+        return super().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        if stats.explain:
+            seq_of_params = iter(seq_of_params)
+            first = next(seq_of_params, None)
+            if first != None:
+                stats.explain_plan(self.connection, sql, first)
+                seq_of_params = itertools.chain([first], seq_of_params)
+        return super().executemany(sql, seq_of_params)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    '''connection (sqlite3.connect factory) using InstrumentedCursor -
+    single point every statement passes through'''
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
@@ -5,13 +5,79 @@ Created on Fri May  8 19:16:12 2020
 @author: vyachez
 
 STRACK SQL functions
+
+Every function takes either database path or Database handle
+(reusable connection, read Database) as first argument.
+Calls are timed and counted in 'stats' (read sql_stats), e.g.
+stats.summary() or STRACK_SQL_EXPLAIN=1 to log query plans.
 """
 
 import sqlite3
+import datetime
 from sqlite3 import Error
 
+import numpy as np
 import pandas as pd
 
+from sql_stats import stats, instrumented, InstrumentedConnection
+
+STATEMENT_CACHE = 256 # compiled statements kept per connection
+SCHEMA_VERSION = 2 # intraday schema version (PRAGMA user_version)
+INTRADAY_COLS = ['open', 'high', 'low', 'close', 'volume', 'ticker']
+SESSION_OPEN_MINUTE = 9*60+30 # 9:30 - minute of day
+SESSION_CLOSE_MINUTE = 15*60+59 # 15:59 - minute of day
+
+CREATE_TICKERS_SQL = "CREATE TABLE IF NOT EXISTS tickers "+\
+                        "(ticker_id integer PRIMARY KEY,"+\
+                            "ticker text NOT NULL UNIQUE)"
+CREATE_INTRADAY_SQL = "CREATE TABLE IF NOT EXISTS intraday "+\
+                        "(ticker_id integer NOT NULL,"+\
+                            "time integer NOT NULL,"+\
+                            "open real,"+\
+                            "high real,"+\
+                            "low real,"+\
+                            "close real,"+\
+                            "volume real,"+\
+                            "PRIMARY KEY (ticker_id, time)) WITHOUT ROWID"
+# time ranges over all tickers (e.g. whole day) - key starts with ticker_id
+CREATE_INTRADAY_TIME_IDX_SQL = "CREATE INDEX IF NOT EXISTS intraday_time_idx "+\
+                        "ON intraday (time)"
+# monthly partition tables (optional layout) - intraday becomes view over them
+PARTITION_GLOB = "intraday_[0-9][0-9][0-9][0-9][0-9][0-9]" # intraday_YYYYMM
+CREATE_PARTITION_SQL = "CREATE TABLE IF NOT EXISTS {0} "+\
+                        "(ticker_id integer NOT NULL,"+\
+                            "time integer NOT NULL,"+\
+                            "open real,"+\
+                            "high real,"+\
+                            "low real,"+\
+                            "close real,"+\
+                            "volume real,"+\
+                            "PRIMARY KEY (ticker_id, time)) WITHOUT ROWID"
+CREATE_PARTITION_TIME_IDX_SQL = "CREATE INDEX IF NOT EXISTS {0}_time_idx ON {0} (time)"
+# per ticker-day session (9:30 - 15:59) stats, maintained on intraday ingest
+CREATE_DAILY_SUMMARY_SQL = "CREATE TABLE IF NOT EXISTS daily_summary "+\
+                        "(ticker_id integer NOT NULL,"+\
+                            "day integer NOT NULL,"+\
+                            "open real,"+\
+                            "high real,"+\
+                            "low real,"+\
+                            "close real,"+\
+                            "avg_volume real,"+\
+                            "total_volume real,"+\
+                            "minutes integer,"+\
+                            "PRIMARY KEY (ticker_id, day)) WITHOUT ROWID"
+# day - days since 1970-01-01; open - 9:30 bar open, close - 15:59 bar close
+SUMMARIZE_SQL = "INSERT OR REPLACE INTO daily_summary "+\
+                        "SELECT ticker_id, time / 1440,"+\
+                            "MAX(CASE WHEN time % 1440 = {} THEN open END),".format(SESSION_OPEN_MINUTE)+\
+                            "MAX(high), MIN(low),"+\
+                            "MAX(CASE WHEN time % 1440 = {} THEN close END),".format(SESSION_CLOSE_MINUTE)+\
+                            "AVG(volume), SUM(volume), COUNT(*) "+\
+                        "FROM intraday WHERE {} AND "+\
+                            "time % 1440 BETWEEN {} AND {} ".format(SESSION_OPEN_MINUTE,
+                                                                  SESSION_CLOSE_MINUTE)+\
+                        "GROUP BY ticker_id, time / 1440"
+
 def create_db(db_path):
     """ create SQLite database
     takes:
@@ -38,162 +104,1412 @@ def connect_db(db_path):
         print("Error: {}".format(e))
     return conn
 
-def create_intraday_table(db_path):
-    """ create a table for intraday data
+class Database():
+    '''
+        Reusable database handle - one connection shared by many calls.
+        Pass it instead of db_path to any function of this module, or use
+        as context manager (commits on exit, rolls back on error):
+            with Database(db_path) as db:
+                rec_db_intraday_df(db, df)
+                df = get_db_intraday_ticker(db, "AAPL")
+        Connection runs in WAL mode and keeps compiled statements cached,
+        so repeated queries are prepared once.
+        takes:
+            - db_path - string - database path
+            - cache_size_mb - int - page cache size
+            - mmap_size_mb - int - memory mapped I/O size
+    '''
+    def __init__(self, db_path, cache_size_mb=64, mmap_size_mb=256):
+        self.db_path = db_path
+        self.conn = _open(db_path, cache_size_mb, mmap_size_mb)
+
+    def execute(self, sql, params=()):
+        '''executes statement on handle connection'''
+        return self.conn.execute(sql, params)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        if self.conn != None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.conn != None:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        self.close()
+
+def _open(db_path, cache_size_mb=64, mmap_size_mb=256):
+    '''opens tuned connection (WAL, page cache, mmap), no banner;
+    new database files get incremental auto vacuum (no effect on existing)'''
+    conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE,
+                           check_same_thread=False, factory=InstrumentedConnection)
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL') # before WAL creates file
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-{}'.format(int(cache_size_mb*1024)))
+    conn.execute('PRAGMA mmap_size={}'.format(int(mmap_size_mb*1024*1024)))
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+def _connect(db):
+    '''returns (connection, owned) for database path, Database handle
+    or sqlite3 connection;
+    owned connections are closed by _release()'''
+    if isinstance(db, Database):
+        return db.conn, False
+    if isinstance(db, sqlite3.Connection):
+        return db, False
+    return _open(db), True
+
+def _release(conn, owned):
+    '''closes connection if opened by _connect() for single call'''
+    if owned and conn:
+        conn.close()
+
+def create_intraday_table(db_path, monthly=False):
+    """ create tables for intraday data (schema v2):
+        tickers - dictionary of tickers (ticker_id, ticker)
+        intraday - minute bars keyed by (ticker_id, time), WITHOUT ROWID,
+                   time - integer minutes since 1970-01-01 of bar wall clock time,
+                   indexed by time for all tickers ranges
+                   (with 'monthly' - view over intraday_YYYYMM partition tables
+                   of the same structure, created as data arrives)
+        daily_summary - session stats per (ticker_id, day), read
+                        get_db_daily_summary()
+    New database files use incremental auto vacuum - read vacuum_db().
+    Existing v1 intraday table is left untouched - read migrate_intraday_v1_to_v2().
     takes:
-        - db_path - string - database path"""
-    # table variables
-    create_table_sql = "CREATE TABLE IF NOT EXISTS intraday "+\
-                                "(time text,"+\
-                                    "open real,"+\
-                                    "high real,"+\
-                                    "low real,"+\
-                                    "close real,"+\
-                                    "volume real,"+\
-                                    "ticker text)"
+        - db_path - string - database path (or Database handle)
+        - monthly - bool - monthly partitions layout (read partition_intraday_monthly())"""
     # creating connection
-    conn = connect_db(db_path)
+    conn, owned = _connect(db_path)
     try:
+        if get_schema_version(conn) == 1:
+            print("Error: intraday table has v1 schema. Run migration: "+\
+                  "python sql_utils.py migrate <db_path>")
+            return
         c = conn.cursor()
-        c.execute(create_table_sql)
+        _create_intraday_v2(c, monthly)
         conn.commit()
         print("Created intraday table successfully")
     except Error as e:
         print(e)
     finally:
-        if conn:
-            conn.close()
+        _release(conn, owned)
+
+def _create_intraday_v2(c, monthly=False):
+    '''creates v2 intraday tables with cursor c and marks schema version'''
+    c.execute(CREATE_TICKERS_SQL)
+    if monthly or _is_partitioned(c):
+        if c.execute('SELECT name FROM sqlite_master WHERE name = "intraday"').fetchone() == None:
+            _create_intraday_view(c)
+    else:
+        c.execute(CREATE_INTRADAY_SQL)
+        c.execute(CREATE_INTRADAY_TIME_IDX_SQL)
+    c.execute(CREATE_DAILY_SUMMARY_SQL)
+    c.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+def get_schema_version(db_path):
+    '''returns intraday schema version of database:
+    0 - no intraday table, 1 - legacy text time/ticker table, 2 - current
+    takes:
+        - db_path - string - database path (or Database handle / connection)'''
+    conn, owned = _connect(db_path)
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            cols = [r[1] for r in conn.execute('PRAGMA table_info(intraday)')]
+            if 'ticker' in cols:
+                version = 1
+    finally:
+        _release(conn, owned)
+    return version
+
+def _is_partitioned(c):
+    '''True if intraday is view over monthly partitions (cursor or connection)'''
+    return c.execute('SELECT type FROM sqlite_master WHERE name = "intraday"').fetchone() == ('view',)
+
+def _partitions(c):
+    '''returns sorted names of monthly partition tables'''
+    return [r[0] for r in c.execute('SELECT name FROM sqlite_master WHERE type = "table" '+\
+                                    'AND name GLOB ? ORDER BY name', (PARTITION_GLOB,))]
+
+def _partition_name(minute):
+    '''returns partition table name of month containing minute since epoch'''
+    month = str(np.datetime64(int(minute), 'm').astype('datetime64[M]'))
+    return "intraday_" + month.replace("-", "")
+
+def _partition_minutes(name):
+    '''returns (first, last) minute since epoch of partition month'''
+    month = np.datetime64("{}-{}".format(name[-6:-2], name[-2:]), 'M')
+    first = int(month.astype('datetime64[m]').astype(np.int64))
+    last = int((month + 1).astype('datetime64[m]').astype(np.int64)) - 1
+    return first, last
+
+def _intraday_sources(c):
+    '''returns tables holding intraday rows in time order:
+    partition tables with monthly layout, otherwise intraday table'''
+    return _partitions(c) if _is_partitioned(c) else ['intraday']
+
+def _create_intraday_view(c):
+    '''(re)creates intraday view over current partition tables'''
+    c.execute('DROP VIEW IF EXISTS intraday')
+    parts = _partitions(c)
+    if len(parts) == 0:
+        sel = 'SELECT CAST(NULL AS integer) AS ticker_id, CAST(NULL AS integer) AS time, '+\
+            'CAST(NULL AS real) AS open, CAST(NULL AS real) AS high, CAST(NULL AS real) AS low, '+\
+            'CAST(NULL AS real) AS close, CAST(NULL AS real) AS volume WHERE 0'
+    else:
+        sel = ' UNION ALL '.join('SELECT ticker_id, time, open, high, low, close, volume '+\
+                                 'FROM {}'.format(p) for p in parts)
+    c.execute('CREATE VIEW intraday AS ' + sel)
+
+def _create_partition(c, name):
+    '''creates partition table (if missing) and adds it to intraday view'''
+    if c.execute('SELECT name FROM sqlite_master WHERE name = ?', (name,)).fetchone() == None:
+        c.execute(CREATE_PARTITION_SQL.format(name))
+        c.execute(CREATE_PARTITION_TIME_IDX_SQL.format(name))
+        _create_intraday_view(c)
+
+def _to_minutes(index):
+    '''DatetimeIndex -> int64 array of minutes since epoch (wall clock)'''
+    return pd.DatetimeIndex(index).values.astype('datetime64[m]').astype(np.int64)
+
+def _from_minutes(minutes):
+    '''int64 array of minutes since epoch -> DatetimeIndex named "time"'''
+    return pd.DatetimeIndex(pd.to_datetime(np.asarray(minutes, dtype=np.int64), unit='m'),
+                            name='time')
+
+def _day_minutes(date):
+    '''returns (first, last) minute since epoch of day'''
+    first = int(np.datetime64(str(pd.Timestamp(str(date)).date()), 'm').astype(np.int64))
+    return first, first + 24*60 - 1
+
+def _ticker_ids(conn, tickers, create=False):
+    '''returns {ticker: ticker_id}, adding missing tickers if 'create' '''
+    tickers = list(dict.fromkeys(tickers))
+    if create:
+        conn.executemany('INSERT OR IGNORE INTO tickers (ticker) VALUES (?)',
+                         [(tk,) for tk in tickers])
+    ids = {}
+    for i in range(0, len(tickers), 500):
+        part = tickers[i:i+500]
+        sel = 'SELECT ticker, ticker_id FROM tickers WHERE ticker IN '+\
+            '({})'.format(",".join("?"*len(part)))
+        ids.update(conn.execute(sel, part).fetchall())
+    return ids
+
+def _minute_bound(value, end=False):
+    '''query bound -> minute since epoch: dates cover whole day,
+    datetimes/timestamps are exact minutes'''
+    ts = pd.Timestamp(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime) or \
+            (isinstance(value, str) and len(value.strip()) <= 10):
+        first, last = _day_minutes(ts.date())
+        return last if end else first
+    return int(np.datetime64(ts.to_datetime64(), 'm').astype(np.int64))
+
+@instrumented
+def query_intraday(db_path, tickers=None, start=None, end=None,
+                   columns=None, session_only=False):
+    '''
+    Returns intraday data for any tickers and time range in one query.
+    Ticker, time range and session filters and column projection are done
+    by SQLite with bound parameters on (ticker_id, time) key; frame comes
+    sorted by time (then ticker) - no sort_index() needed.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    tickers : string or list of strings - tickers (None - all)
+    start, end : datetime.date() / datetime.datetime() / "yyyy-mm-dd [hh:mm]" -
+                 inclusive range (dates cover whole day, None - unbounded)
+    columns : list - subset of ['open', 'high', 'low', 'close', 'volume', 'ticker']
+              (None - all)
+    session_only : bool - only regular session minutes 9:30 - 15:59
+    
+    Returns
+    -------
+    Pandas Dataframe - requested columns, index - datetime named "time"
+    '''
+    columns = _intraday_columns(columns)
+    # creating connection
+    conn, owned = _connect(db_path)
+    try:
+        where, params = _intraday_filters(conn, tickers, start, end, session_only)
+        if where == None:
+            return pd.DataFrame(columns=columns, index=_from_minutes([]))
+        # column projection
+        fields = ['i.time']+['t.ticker' if col == 'ticker' else 'i.'+col for col in columns]
+        sel = 'SELECT {} FROM intraday i'.format(", ".join(fields))
+        if 'ticker' in columns:
+            sel += ' JOIN tickers t ON t.ticker_id = i.ticker_id'
+        if len(where) > 0:
+            sel += ' WHERE '+' AND '.join(where)
+        sel += ' ORDER BY i.time, i.ticker_id'
+        df = pd.read_sql(sql=sel, con=conn, params=params)
+    finally:
+        _release(conn, owned)
+    df.index = _from_minutes(df.pop('time').values)
+    return df
+
+def _intraday_columns(columns):
+    '''validates requested intraday columns (None - all)'''
+    columns = list(INTRADAY_COLS if columns == None else columns)
+    unknown = [col for col in columns if col not in INTRADAY_COLS]
+    if len(unknown) > 0:
+        raise ValueError("Unknown intraday columns: {}".format(unknown))
+    return columns
+
+def _intraday_filters(conn, tickers, start, end, session_only):
+    '''returns (where, params) lists for intraday alias "i",
+    where is None if none of requested tickers is known'''
+    where = []
+    params = []
+    if tickers != None:
+        if isinstance(tickers, str):
+            tickers = [tickers]
+        ids = list(_ticker_ids(conn, tickers).values())
+        if len(ids) == 0:
+            return None, None
+        where.append('i.ticker_id IN ({})'.format(",".join("?"*len(ids))))
+        params.extend(ids)
+    if start != None and end != None:
+        where.append('i.time BETWEEN ? AND ?')
+        params.extend([_minute_bound(start), _minute_bound(end, end=True)])
+    elif start != None:
+        where.append('i.time >= ?')
+        params.append(_minute_bound(start))
+    elif end != None:
+        where.append('i.time <= ?')
+        params.append(_minute_bound(end, end=True))
+    if session_only:
+        where.append('i.time % 1440 BETWEEN ? AND ?')
+        params.extend([SESSION_OPEN_MINUTE, SESSION_CLOSE_MINUTE])
+    return where, params
+
+def _ticker_categories(conn):
+    '''returns (categories, codes) - sorted tickers and lookup array
+    ticker_id -> category code'''
+    rows = conn.execute('SELECT ticker_id, ticker FROM tickers ORDER BY ticker').fetchall()
+    codes = np.full(max([tid for tid, _ in rows], default=0) + 1, -1, dtype=np.int32)
+    for code, (tid, _) in enumerate(rows):
+        codes[tid] = code
+    return [tk for _, tk in rows], codes
+
+def _intraday_frame(rows, columns, categories, codes, compact):
+    '''(time, ticker_id, values...) rows -> dataframe in common format'''
+    values = [col for col in columns if col != 'ticker']
+    arr = np.array(rows, dtype=np.float64).reshape(len(rows), 2 + len(values))
+    df = pd.DataFrame(index=_from_minutes(arr[:, 0].astype(np.int64)))
+    for j, col in enumerate(values):
+        # volumes exceed float32 exact integer range - kept float64
+        df[col] = arr[:, 2+j].astype(np.float32 if compact and col != 'volume'
+                                     else np.float64)
+    if 'ticker' in columns:
+        tickers = pd.Categorical.from_codes(codes[arr[:, 1].astype(np.int64)],
+                                            categories=categories)
+        df['ticker'] = tickers if compact else np.asarray(tickers, dtype=object)
+    return df[columns]
+
+@instrumented
+def iter_db_intraday(db_path, by='ticker', chunk_rows=500000, tickers=None,
+                     start=None, end=None, columns=None, session_only=False,
+                     compact=False):
+    '''
+    Streams intraday data in frames instead of loading whole table, so
+    full history can be processed in bounded memory.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    by : string - 'ticker' - frame per ticker (tickers in alphabetical order),
+                  'day' - frame per day with data,
+                  'rows' - frames of up to 'chunk_rows' rows
+    chunk_rows : int - rows per frame for by='rows'
+    tickers, start, end, columns, session_only : filters, read query_intraday()
+    compact : bool - opt-in float32 prices and categorical ticker column
+              (categories are all tickers of database, same in every frame);
+              default - float64 prices as stored, same as query_intraday()
+    
+    Returns
+    -------
+    generator of Pandas Dataframes - requested columns, index - datetime named "time",
+    each frame sorted by time (then ticker)
+    '''
+    if by not in ('ticker', 'day', 'rows'):
+        raise ValueError("Unknown 'by' value: {}".format(by))
+    columns = _intraday_columns(columns)
+    values = [col for col in columns if col != 'ticker']
+    # creating connection
+    conn, owned = _connect(db_path)
+    try:
+        where, params = _intraday_filters(conn, tickers, start, end, session_only)
+        if where == None:
+            return
+        categories, codes = _ticker_categories(conn)
+        fields = ", ".join(['i.time', 'i.ticker_id']+['i.'+col for col in values])
+        sel = 'SELECT {} FROM intraday i'.format(fields)
+        if by == 'ticker':
+            ids = conn.execute('SELECT ticker_id FROM tickers ORDER BY ticker').fetchall()
+            sel += ' WHERE '+' AND '.join(['i.ticker_id = ?']+where)+' ORDER BY i.time'
+            for (tid,) in ids:
+                rows = conn.execute(sel, [tid]+params).fetchall()
+                if len(rows) > 0:
+                    yield _intraday_frame(rows, columns, categories, codes, compact)
+        elif by == 'day':
+            span = 'SELECT MIN(i.time), MAX(i.time) FROM {} i'
+            if len(where) > 0:
+                span += ' WHERE '+' AND '.join(where)
+            spans = [conn.execute(span.format(src), params).fetchone()
+                     for src in _intraday_sources(conn)]
+            spans = [sp for sp in spans if sp[0] != None]
+            if len(spans) == 0:
+                return
+            first, last = min(sp[0] for sp in spans), max(sp[1] for sp in spans)
+            sel += ' WHERE '+' AND '.join(['i.time BETWEEN ? AND ?']+where)+\
+                ' ORDER BY i.time, i.ticker_id'
+            for day in range(first // 1440, last // 1440 + 1):
+                rows = conn.execute(sel, [day*1440, day*1440 + 1439]+params).fetchall()
+                if len(rows) > 0:
+                    yield _intraday_frame(rows, columns, categories, codes, compact)
+        else:
+            # keyset pagination on (time, ticker_id) - every page is index seek
+            # (table by table with monthly partitions - they do not overlap)
+            for src in _intraday_sources(conn):
+                page = 'SELECT {} FROM {} i WHERE '.format(fields, src)+\
+                    ' AND '.join(['(i.time, i.ticker_id) > (?, ?)']+where)+\
+                    ' ORDER BY i.time, i.ticker_id LIMIT ?'
+                key = [-1, -1]
+                while True:
+                    rows = conn.execute(page, key+params+[chunk_rows]).fetchall()
+                    if len(rows) == 0:
+                        break
+                    key = [rows[-1][0], rows[-1][1]]
+                    yield _intraday_frame(rows, columns, categories, codes, compact)
+    finally:
+        _release(conn, owned)
+
+def _intraday_arrays(df, ids):
+    '''dataframe in common format -> (ticker_id, time, values) arrays
+    sorted by (ticker_id, time) key, last row kept for repeated keys'''
+    minutes = _to_minutes(df.index)
+    tid = df['ticker'].map(ids).values.astype(np.int64)
+    vals = df[['open', 'high', 'low', 'close', 'volume']].astype(float).values
+    order = np.lexsort((minutes, tid))
+    # repeated (ticker, time) - keeping last one, as upsert would
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (tid[order][1:] != tid[order][:-1]) | \
+        (minutes[order][1:] != minutes[order][:-1])
+    order = order[last]
+    return tid[order], minutes[order], vals[order]
+
+def _intraday_rows(tid, minutes, vals):
+    '''v2 arrays -> iterator of row tuples for executemany'''
+    return zip(tid.tolist(), minutes.tolist(), *vals.T.tolist())
+
+def _key_ranges(tid, minutes):
+    '''returns list of (ticker_id, first time, last time) ranges
+    of sorted v2 key arrays'''
+    starts = np.flatnonzero(np.r_[True, tid[1:] != tid[:-1]])
+    ends = np.r_[starts[1:], len(tid)] - 1
+    return list(zip(tid[starts].tolist(), minutes[starts].tolist(), minutes[ends].tolist()))
+
+def _day_starts(tid, minutes):
+    '''returns start positions of (ticker_id, day) groups of sorted
+    v2 key arrays'''
+    day = minutes // 1440
+    return np.flatnonzero(np.r_[True, (tid[1:] != tid[:-1]) | (day[1:] != day[:-1])])
 
+def _count_key_ranges(conn, ranges):
+    '''number of stored rows within (ticker_id, first time, last time) ranges'''
+    sel = 'SELECT COUNT(*) FROM intraday WHERE ticker_id = ? AND time BETWEEN ? AND ?'
+    return sum(conn.execute(sel, key).fetchone()[0] for key in ranges)
+
+def _summarize_ranges(conn, ranges):
+    '''recalculates daily_summary of whole days covered by
+    (ticker_id, first time, last time) ranges'''
+    for tid, first, last in ranges:
+        first, last = first // 1440, last // 1440
+        conn.execute('DELETE FROM daily_summary WHERE ticker_id = ? AND day BETWEEN ? AND ?',
+                     (tid, first, last))
+        conn.execute(SUMMARIZE_SQL.format('ticker_id = ? AND time BETWEEN ? AND ?'),
+                     (tid, first*1440, last*1440 + 1439))
+
+def _summary_rows(tid, minutes, vals):
+    '''returns daily_summary rows (as SUMMARIZE_SQL) computed from sorted
+    v2 arrays holding all rows of their ticker-days - no table read'''
+    tod = minutes % 1440
+    session = (tod >= SESSION_OPEN_MINUTE) & (tod <= SESSION_CLOSE_MINUTE)
+    tid, minutes, tod, vals = tid[session], minutes[session], tod[session], vals[session]
+    if len(tid) == 0:
+        return []
+    starts = _day_starts(tid, minutes)
+    sizes = np.diff(np.r_[starts, len(tid)])
+    group = np.repeat(np.arange(len(starts)), sizes)
+    opn = np.full(len(starts), np.nan)
+    cle = np.full(len(starts), np.nan)
+    first = tod == SESSION_OPEN_MINUTE
+    opn[group[first]] = vals[first, 0]
+    last = tod == SESSION_CLOSE_MINUTE
+    cle[group[last]] = vals[last, 3]
+    # NULLs are skipped by SQL aggregates - NaN likewise
+    known = ~np.isnan(vals[:, 4])
+    volumes = np.add.reduceat(known.astype(np.int64), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        high = np.fmax.reduceat(vals[:, 1], starts)
+        low = np.fmin.reduceat(vals[:, 2], starts)
+        total = np.where(volumes > 0, np.add.reduceat(np.where(known, vals[:, 4], 0.0),
+                                                      starts), np.nan)
+        avg = total / volumes
+    cols = [tid[starts].tolist(), (minutes[starts] // 1440).tolist()]+\
+        [[None if np.isnan(v) else v for v in col.tolist()]
+         for col in (opn, high, low, cle, avg, total)]+[sizes.tolist()]
+    return list(zip(*cols))
+
+def _upsert_intraday(conn, tid, minutes, vals, partitioned):
+    '''upserts sorted v2 arrays to intraday table (or monthly partition
+    tables of their rows)'''
+    if not partitioned:
+        conn.executemany(UPSERT_INTRADAY_SQL.format('intraday'),
+                         _intraday_rows(tid, minutes, vals))
+        return
+    # routing rows to monthly partition tables
+    months = minutes.astype('datetime64[m]').astype('datetime64[M]')
+    for month in np.unique(months):
+        name = _partition_name(month.astype('datetime64[m]').astype(np.int64))
+        _create_partition(conn, name)
+        rows = months == month
+        conn.executemany(UPSERT_INTRADAY_SQL.format(name),
+                         _intraday_rows(tid[rows], minutes[rows], vals[rows]))
+
+@instrumented
 def get_tables(db_path):
     '''returns list of tables in provided database
     takes:
-        - db_path - string - database path'''
+        - db_path - string - database path (or Database handle)'''
     # creating connection
-    conn = connect_db(db_path)
+    conn, owned = _connect(db_path)
     # creating cursor
     c = conn.cursor()
     # getting tables
     tables = c.execute('SELECT name from sqlite_master where type= "table"')
     tab_list = tables.fetchall()
     # closing connection
-    conn.close()
+    _release(conn, owned)
     return tab_list
 
-def rec_db_intraday_df(db_path, df):
+# idempotent write - existing (ticker_id, time) rows are updated only if
+# values differ, so reruns for the same day do not duplicate or rewrite rows
+UPSERT_INTRADAY_SQL = "INSERT INTO {} "+\
+                        "(ticker_id, time, open, high, low, close, volume) "+\
+                        "VALUES (?,?,?,?,?,?,?) "+\
+                        "ON CONFLICT (ticker_id, time) DO UPDATE SET "+\
+                            "open = excluded.open, high = excluded.high, "+\
+                            "low = excluded.low, close = excluded.close, "+\
+                            "volume = excluded.volume "+\
+                        "WHERE open IS NOT excluded.open OR high IS NOT excluded.high "+\
+                            "OR low IS NOT excluded.low OR close IS NOT excluded.close "+\
+                            "OR volume IS NOT excluded.volume"
+
+@instrumented
+def rec_db_intraday_df(db_path, df, batch_rows=500000):
     '''
-    Records tickers dataframe to intraday table database.
+    Records tickers dataframe to intraday table database (bulk upsert).
+    Rows are upserted on (ticker, time): new rows are inserted, existing
+    rows are updated only if values differ, so recording the same data
+    again changes nothing. Rows are written with executemany in explicit
+    transactions of up to 'batch_rows' rows, daily_summary of ticker-days
+    with inserted or updated rows is updated in the same transaction
+    (computed from dataframe when it holds whole new ticker-days). With monthly layout
+    rows are routed to partition table of their month.
     
     Parameters
     ----------
-    db_path : string - database path
+    db_path : string - database path (or Database handle)
     df : Pandas Dataframe - loaded tickers data in strict predefined format:
         columns = ['open', 'high', 'low', 'close', 'volume', 'ticker']
         index - datetime.datetime()
         index.name = "time"
+    batch_rows : int - rows per transaction
     
     Returns
     -------
-    None.
+    dict - counts of 'inserted', 'updated' and 'unchanged' rows.
     '''
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
     # creating connection
-    conn = connect_db(db_path)
-    # recording df to database
-    df.to_sql("intraday", con=conn, if_exists='append', index_label='time')
-    conn.commit()
-    # closing connection
-    conn.close()
-    print("Successfully recorded data to intraday table")
+    conn, owned = _connect(db_path)
+    try:
+        version = get_schema_version(conn)
+        if version == 1:
+            raise RuntimeError("Intraday table has v1 schema. Run migration: "+\
+                               "python sql_utils.py migrate <db_path>")
+        if version == 0 and conn.execute('SELECT name FROM sqlite_master '+\
+                                         'WHERE name = "intraday"').fetchone() == None:
+            # new database - creating v2 tables
+            _create_intraday_v2(conn)
+            conn.commit()
+        ids = _ticker_ids(conn, df['ticker'].unique(), create=True)
+        if conn.execute('SELECT name FROM sqlite_master WHERE type = "table" '+\
+                        'AND name = "daily_summary"').fetchone() == None:
+            conn.execute(CREATE_DAILY_SUMMARY_SQL)
+            print("Created daily_summary table - summaries of earlier data "+\
+                  "need rebuild: python sql_utils.py rebuild-summary <db_path>")
+        conn.commit()
+        partitioned = _is_partitioned(conn)
+        tid, minutes, vals = _intraday_arrays(df, ids)
+        for i in range(0, len(tid), batch_rows):
+            batch = (tid[i:i+batch_rows], minutes[i:i+batch_rows], vals[i:i+batch_rows])
+            # recording batch to database in one transaction
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # stored rows of batch ticker-days counted before upsert:
+                # rows of new ticker-days are all inserts and their
+                # summaries come from batch itself; ticker-days with stored
+                # rows are upserted one by one, so only changed ones are
+                # summarized again and inserts are counted after upsert
+                starts = _day_starts(batch[0], batch[1])
+                ends = np.r_[starts[1:], len(batch[0])]
+                days = [(t, m // 1440 * 1440, m // 1440 * 1440 + 1439)
+                        for t, m in zip(batch[0][starts].tolist(), batch[1][starts].tolist())]
+                stored = [_count_key_ranges(conn, [day]) for day in days]
+                changes = conn.total_changes
+                new = np.repeat(np.array(stored) == 0, ends - starts)
+                if new.any():
+                    rows = tuple(a[new] for a in batch)
+                    _upsert_intraday(conn, *rows, partitioned)
+                    inserted = conn.total_changes - changes
+                    conn.executemany('INSERT OR REPLACE INTO daily_summary '+\
+                                     'VALUES (?,?,?,?,?,?,?,?,?)', _summary_rows(*rows))
+                else:
+                    inserted = 0
+                changes = inserted
+                changed = []
+                for day, first, last, n in zip(days, starts, ends, stored):
+                    if n == 0:
+                        continue
+                    before = conn.total_changes
+                    _upsert_intraday(conn, *(a[first:last] for a in batch), partitioned)
+                    if conn.total_changes > before:
+                        changes += conn.total_changes - before
+                        # new rows of ticker-day are counted after upsert
+                        inserted -= n
+                        changed.append(day)
+                inserted += _count_key_ranges(conn, changed)
+                # keeping daily summary of updated ticker-days up to date
+                _summarize_ranges(conn, changed)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            counts['inserted'] += inserted
+            counts['updated'] += changes - inserted
+            counts['unchanged'] += len(batch[0]) - changes
+    finally:
+        # closing connection
+        _release(conn, owned)
+    print("Successfully recorded data to intraday table: "+\
+          "{inserted} inserted, {updated} updated, {unchanged} unchanged".format(**counts))
+    return counts
     
+@instrumented
 def get_db_intraday_all(db_path):
     ''' returning all data from intraday db table as dataframe
         filtered and sorted for common application.
         takes:
-            - db_path - string - database path'''
-    # creating connection
-    conn = connect_db(db_path)
+            - db_path - string - database path (or Database handle)'''
     # getting dataframe
-    df = pd.read_sql(sql='SELECT * FROM intraday', con=conn,
-                     index_col=['time'],
-                     parse_dates=['time']).sort_index()
-    # closing connection
-    conn.close()
+    df = query_intraday(db_path)
     print("Successfully retrieved all data from intraday table")
     return df
 
+@instrumented
 def get_db_intraday_date(db_path, date):
     ''' returning data filtered by date from intraday db table as dataframe
         filtered and sorted for common application.
         takes:
-            - db_path - string - database path
+            - db_path - string - database path (or Database handle)
             - date - datetime.datetime(yyy, m, d).date() object'''
-    # creating connection
-    conn = connect_db(db_path)
-    # selecting by criteria
-    sel = 'SELECT * from intraday WHERE time '+\
-        'LIKE "{}%"'.format(date)
     # getting dataframe
-    df = pd.read_sql(sql=sel, con=conn,
-                     index_col=['time'],
-                     parse_dates=['time']).sort_index()
-    # closing connection
-    conn.close()
+    df = query_intraday(db_path, start=date, end=date)
     print("Successfully retrieved requested data from intraday table")
     return df
 
+@instrumented
 def get_db_intraday_ticker(db_path, ticker):
     ''' returning data filtered by date from intraday db table as dataframe
         filtered and sorted for common application.
         takes:
-            - db_path - string - database path
+            - db_path - string - database path (or Database handle)
             - ticker - string - ticker'''
-    # creating connection
-    conn = connect_db(db_path)
-    # selecting by criteria
-    sel = 'SELECT * from intraday WHERE ticker '+\
-        '= "{}"'.format(ticker)
     # getting dataframe
-    df = pd.read_sql(sql=sel, con=conn,
-                     index_col=['time'],
-                     parse_dates=['time']).sort_index()
-    # closing connection
-    conn.close()
+    df = query_intraday(db_path, tickers=ticker)
     print("Successfully retrieved requested data from intraday table")
     return df
 
+@instrumented
 def get_db_intraday_date_ticker(db_path, ticker, date):
     ''' returning data filtered by date and ticker from intraday db table as dataframe
         filtered and sorted for common application.
         takes:
-            - db_path - string - database path
+            - db_path - string - database path (or Database handle)
             - ticker - string - ticker
             - date - datetime.datetime(yyy, m, d).date() object'''
-    # creating connection
-    conn = connect_db(db_path)
-    # selecting by criteria
-    sel = 'SELECT * from intraday WHERE ticker '+\
-        '= "{}" AND time LIKE "{}%"'.format(ticker, date)
     # getting dataframe
-    df = pd.read_sql(sql=sel, con=conn,
-                     index_col=['time'],
-                     parse_dates=['time']).sort_index()
-    # closing connection
-    conn.close()
+    df = query_intraday(db_path, tickers=ticker, start=date, end=date)
     print("Successfully retrieved requested data from intraday table")
     return df
 
-def delete_db_intraday_date(db_path, date):
+@instrumented
+def get_db_intraday_days(db_path, start=None, end=None):
+    ''' returning sorted list of days having data in intraday table
+        (skip scan of time index - one index seek per day).
+        takes:
+            - db_path - string - database path (or Database handle)
+            - start, end - datetime.date() / "yyyy-mm-dd" - inclusive range
+                           (None - unbounded)'''
+    first = -1 if start == None else _minute_bound(start) - 1
+    last = None if end == None else _minute_bound(end, end=True)
+    days = []
+    # creating connection
+    conn, owned = _connect(db_path)
+    try:
+        for src in _intraday_sources(conn):
+            while True:
+                t = conn.execute('SELECT MIN(time) FROM {} WHERE time > ?'.format(src),
+                                 (first,)).fetchone()[0]
+                if t == None or (last != None and t > last):
+                    break
+                days.append(t // 1440)
+                first = (t // 1440)*1440 + 1439
+    finally:
+        _release(conn, owned)
+    return [datetime.date(1970, 1, 1) + datetime.timedelta(days=d) for d in days]
+
+@instrumented
+def get_db_intraday_coverage(db_path, tickers=None, start=None, end=None):
+    '''
+    Returns (ticker, date) pairs present in intraday table with minute
+    counts - aggregate over (ticker_id, time) key or covering time index,
+    no price data is read.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    tickers : string or list of strings - tickers (None - all)
+    start, end : datetime.date() / "yyyy-mm-dd" - inclusive days range
+                 (None - unbounded)
+    
+    Returns
+    -------
+    Pandas Dataframe - columns ['ticker', 'date', 'minutes'] (date -
+    datetime.date()), sorted by date and ticker
+    '''
+    rows = []
+    conn, owned = _connect(db_path)
+    try:
+        where, params = _intraday_filters(conn, tickers, start, end, False)
+        if where != None:
+            names = dict(conn.execute('SELECT ticker_id, ticker FROM tickers').fetchall())
+            for src in _intraday_sources(conn):
+                sel = 'SELECT i.ticker_id, i.time / 1440 AS day, COUNT(*) FROM {} i'.format(src)
+                if tickers == None:
+                    # time index holds (time, ticker_id) - far smaller than table
+                    sel += ' INDEXED BY {}_time_idx'.format(src)
+                if len(where) > 0:
+                    sel += ' WHERE '+' AND '.join(where)
+                sel += ' GROUP BY i.ticker_id, day'
+                rows.extend((names[tid], day, n)
+                            for tid, day, n in conn.execute(sel, params))
+    finally:
+        _release(conn, owned)
+    df = pd.DataFrame(rows, columns=['ticker', 'day', 'minutes'])
+    df = df.sort_values(['day', 'ticker'], kind='stable').reset_index(drop=True)
+    df.insert(1, 'date', [datetime.date(1970, 1, 1) + datetime.timedelta(days=int(d))
+                          for d in df.pop('day')])
+    return df
+
+@instrumented
+def delete_db_intraday_range(db_path, start=None, end=None, tickers=None, vacuum=False):
+    '''
+    Deletes intraday data in time range (time index) and/or of tickers
+    (primary key) and updates daily_summary. With monthly layout months
+    fully inside range are dropped as whole partition tables.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    start, end : datetime.date() / datetime.datetime() / "yyyy-mm-dd [hh:mm]" -
+                 inclusive range (dates cover whole day, None - unbounded)
+    tickers : string or list of strings - tickers (None - all)
+    vacuum : bool - return freed pages to file system after delete (read
+             vacuum_db()); for many deletes call vacuum_db() once after them
+    
+    Returns
+    -------
+    int - number of deleted rows.
+    '''
+    deleted = _delete_intraday_range(db_path, start, end, tickers, vacuum)
+    print("Deleted {} rows from intraday table successfully.".format(deleted))
+    return deleted
+
+def _delete_intraday_range(db_path, start, end, tickers, vacuum):
+    '''delete_db_intraday_range() without message, returns deleted rows'''
+    first = 0 if start == None else _minute_bound(start)
+    last = (1 << 40)*1440 - 1 if end == None else _minute_bound(end, end=True)
+    conn, owned = _connect(db_path)
+    try:
+        where = ['time BETWEEN ? AND ?']
+        params = [first, last]
+        if tickers != None:
+            if isinstance(tickers, str):
+                tickers = [tickers]
+            ids = list(_ticker_ids(conn, tickers).values())
+            if len(ids) == 0:
+                return 0
+            where.append('ticker_id IN ({})'.format(",".join("?"*len(ids))))
+            params.extend(ids)
+        cond = ' AND '.join(where)
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            deleted = 0
+            if _is_partitioned(conn):
+                dropped = False
+                for name in _partitions(conn):
+                    p_first, p_last = _partition_minutes(name)
+                    if p_last < first or p_first > last:
+                        continue
+                    if tickers == None and first <= p_first and p_last <= last:
+                        # whole month - dropping table instead of deleting rows
+                        deleted += conn.execute('SELECT COUNT(*) FROM {}'.format(name)).fetchone()[0]
+                        conn.execute('DROP TABLE {}'.format(name))
+                        dropped = True
+                    else:
+                        deleted += conn.execute('DELETE FROM {} WHERE {}'.format(name, cond),
+                                                params).rowcount
+                if dropped:
+                    _create_intraday_view(conn)
+            else:
+                deleted = conn.execute('DELETE FROM intraday WHERE '+cond, params).rowcount
+            # summaries of range days, partially deleted edge days recalculated
+            day_cond = cond.replace('time BETWEEN ? AND ?', 'day BETWEEN ? AND ?')
+            conn.execute('DELETE FROM daily_summary WHERE '+day_cond,
+                         [first // 1440, last // 1440]+params[2:])
+            edges = set()
+            if first % 1440 != 0:
+                edges.add(first // 1440)
+            if last % 1440 != 1439:
+                edges.add(last // 1440)
+            for day in edges:
+                conn.execute(SUMMARIZE_SQL.format(cond), [day*1440, day*1440 + 1439]+params[2:])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if vacuum:
+            vacuum_db(conn)
+    finally:
+        _release(conn, owned)
+    return deleted
+
+@instrumented
+def delete_db_intraday_date(db_path, date, vacuum=False):
     '''Deleting data for required date from intraday table database
     takes:
-        - db_path - string - database path
+        - db_path - string - database path (or Database handle)
         - date - datetime.datetime(yyy, m, d).date() object
+        - vacuum - bool - read delete_db_intraday_range()
+    returns:
+        int - number of deleted rows
         '''
+    deleted = _delete_intraday_range(db_path, date, date, None, vacuum)
+    print("Deleted {} from intraday table successfully ({} rows).".format(date, deleted))
+    return deleted
+
+@instrumented
+def delete_db_intraday_ticker(db_path, ticker, start=None, end=None, vacuum=False):
+    '''Deleting data of ticker (optionally in time range) from intraday table
+    takes:
+        - db_path - string - database path (or Database handle)
+        - ticker - string or list of strings - ticker(s)
+        - start, end, vacuum - read delete_db_intraday_range()
+    returns:
+        int - number of deleted rows'''
+    return delete_db_intraday_range(db_path, start=start, end=end, tickers=ticker,
+                                    vacuum=vacuum)
+
+@instrumented
+def apply_intraday_retention(db_path, keep_days, today=None, vacuum=True):
+    '''Deletes intraday data older than 'keep_days' calendar days
+    (whole months are dropped as partitions with monthly layout)
+    takes:
+        - db_path - string - database path (or Database handle)
+        - keep_days - int - days of data to keep including today
+        - today - datetime.date() - reference day (None - today)
+        - vacuum - bool - return freed pages once after delete
+    returns:
+        int - number of deleted rows'''
+    today = datetime.datetime.now().date() if today == None else today
+    cutoff = today - datetime.timedelta(days=keep_days)
+    print("Retention: deleting intraday data up to {}".format(cutoff))
+    return delete_db_intraday_range(db_path, end=cutoff, vacuum=vacuum)
+
+@instrumented(rows=False)
+def partition_intraday_monthly(db_path):
+    '''
+    Converts single intraday table to monthly partitions layout:
+    intraday_YYYYMM tables behind intraday view, so old months can be
+    dropped as tables. Each month is copied in own transaction (table,
+    rows and index together), so interrupted conversion is resumed by
+    running it again; intraday table is dropped only after partitions
+    hold all of its rows.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    
+    Returns
+    -------
+    list - names of created partition tables.
+    '''
+    conn, owned = _connect(db_path)
+    try:
+        if _is_partitioned(conn):
+            print("Intraday table is already partitioned")
+            return _partitions(conn)
+        conn.commit()
+        copied = 0
+        months = dict.fromkeys(_partition_name(_day_minutes(day)[0])
+                               for day in get_db_intraday_days(conn))
+        for name in months:
+            first, last = _partition_minutes(name)
+            source = conn.execute('SELECT COUNT(*) FROM intraday WHERE time BETWEEN ? AND ?',
+                                  (first, last)).fetchone()[0]
+            if conn.execute('SELECT name FROM sqlite_master WHERE name = ?',
+                            (name,)).fetchone() != None:
+                if conn.execute('SELECT COUNT(*) FROM {}'.format(name)).fetchone()[0] == source:
+                    copied += source
+                    continue
+                # incomplete copy of earlier run - copied again
+                print("Partition {} is incomplete, copying again".format(name))
+            conn.execute('BEGIN')
+            try:
+                conn.execute('DROP TABLE IF EXISTS {}'.format(name))
+                conn.execute(CREATE_PARTITION_SQL.format(name))
+                conn.execute('INSERT INTO {} SELECT ticker_id, time, open, high, low, close, volume '.format(name)+\
+                             'FROM intraday WHERE time BETWEEN ? AND ? ORDER BY ticker_id, time',
+                             (first, last))
+                conn.execute(CREATE_PARTITION_TIME_IDX_SQL.format(name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            copied += source
+            print("Created partition {}".format(name))
+        total = conn.execute('SELECT COUNT(*) FROM intraday').fetchone()[0]
+        if copied != total:
+            raise RuntimeError("Partitions hold {} of {} intraday rows - ".format(copied, total)+\
+                               "intraday table is kept, run conversion again")
+        conn.execute('DROP TABLE intraday')
+        _create_intraday_view(conn)
+        conn.commit()
+        parts = _partitions(conn)
+        vacuum_db(conn)
+    finally:
+        _release(conn, owned)
+    print("Intraday table converted to {} monthly partitions".format(len(parts)))
+    return parts
+
+@instrumented(rows=False)
+def vacuum_db(db_path, max_pages=0):
+    '''
+    Returns free pages to file system so database file stays sized to live
+    data. Incremental auto vacuum databases are vacuumed incrementally (up to
+    'max_pages', 0 - all free pages); others are left as is until
+    enable_incremental_vacuum() is run.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    max_pages : int - pages to free per call (0 - all)
+    
+    Returns
+    -------
+    int - number of freed pages.
+    '''
+    conn, owned = _connect(db_path)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 0
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # executescript steps pragma to completion (execute frees one page)
+        conn.executescript('PRAGMA incremental_vacuum({});'.format(int(max_pages)))
+        freed = free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # shrinking file now instead of at next checkpoint
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    finally:
+        _release(conn, owned)
+    return freed
+
+@instrumented
+def enable_incremental_vacuum(db_path):
+    '''Switches existing database to incremental auto vacuum
+    (one full VACUUM - rewrites whole file, needs free disk space of db size)
+    takes:
+        - db_path - string - database path (or Database handle)'''
+    conn, owned = _connect(db_path)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            conn.commit()
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        print("Incremental vacuum enabled")
+    finally:
+        _release(conn, owned)
+
+@instrumented
+def rebuild_daily_summary(db_path):
+    '''Recalculates daily_summary table from whole intraday table
+    (for databases recorded before daily_summary existed)
+    takes:
+        - db_path - string - database path (or Database handle)
+    returns:
+        int - number of ticker-day summaries'''
+    conn, owned = _connect(db_path)
+    try:
+        conn.execute(CREATE_DAILY_SUMMARY_SQL)
+        conn.execute('DELETE FROM daily_summary')
+        conn.execute(SUMMARIZE_SQL.format('1'))
+        conn.commit()
+        n = conn.execute('SELECT COUNT(*) FROM daily_summary').fetchone()[0]
+    finally:
+        _release(conn, owned)
+    print("Rebuilt daily_summary table: {} ticker-days".format(n))
+    return n
+
+@instrumented
+def get_db_daily_summary(db_path, ticker, day):
+    '''returns session summary of ticker at day (one key lookup):
+    dict with 'open' (9:30), 'high', 'low', 'close' (15:59), 'avg_volume',
+    'total_volume' and 'minutes' (None if open/close minute is missing),
+    or None if there is no session data
+    takes:
+        - db_path - string - database path (or Database handle)
+        - ticker - string - ticker
+        - day - datetime.date() / "yyyy-mm-dd"'''
+    conn, owned = _connect(db_path)
+    try:
+        row = conn.execute('SELECT s.open, s.high, s.low, s.close, s.avg_volume, '+\
+                           's.total_volume, s.minutes FROM daily_summary s '+\
+                           'JOIN tickers t ON t.ticker_id = s.ticker_id '+\
+                           'WHERE t.ticker = ? AND s.day = ?',
+                           (ticker, _day_minutes(day)[0] // 1440)).fetchone()
+    finally:
+        _release(conn, owned)
+    if row == None:
+        return None
+    return dict(zip(['open', 'high', 'low', 'close', 'avg_volume',
+                     'total_volume', 'minutes'], row))
+
+@instrumented
+def query_daily_summary(db_path, tickers=None, start=None, end=None):
+    '''
+    Returns daily_summary rows for tickers and days range.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    tickers : string or list of strings - tickers (None - all)
+    start, end : datetime.date() / "yyyy-mm-dd" - inclusive days range
+                 (None - unbounded)
+    
+    Returns
+    -------
+    Pandas Dataframe - columns ['ticker', 'open', 'high', 'low', 'close',
+    'avg_volume', 'total_volume', 'minutes'], index - datetime named "day",
+    sorted by day and ticker
+    '''
+    where = []
+    params = []
+    conn, owned = _connect(db_path)
+    try:
+        if tickers != None:
+            if isinstance(tickers, str):
+                tickers = [tickers]
+            ids = list(_ticker_ids(conn, tickers).values()) or [-1]
+            where.append('s.ticker_id IN ({})'.format(",".join("?"*len(ids))))
+            params.extend(ids)
+        if start != None:
+            where.append('s.day >= ?')
+            params.append(_day_minutes(start)[0] // 1440)
+        if end != None:
+            where.append('s.day <= ?')
+            params.append(_day_minutes(end)[0] // 1440)
+        sel = 'SELECT s.day, t.ticker, s.open, s.high, s.low, s.close, s.avg_volume, '+\
+            's.total_volume, s.minutes FROM daily_summary s '+\
+            'JOIN tickers t ON t.ticker_id = s.ticker_id'
+        if len(where) > 0:
+            sel += ' WHERE '+' AND '.join(where)
+        sel += ' ORDER BY s.day, t.ticker'
+        df = pd.read_sql(sql=sel, con=conn, params=params)
+    finally:
+        _release(conn, owned)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('day').values.astype(np.int64),
+                                               unit='D'), name='day')
+    return df
+
+@instrumented
+def migrate_intraday_v1_to_v2(db_path, chunk_rows=200000, keep_v1=False):
+    '''
+    Converts v1 intraday table (text time and ticker, no keys) to v2 schema
+    (read create_intraday_table()) in chunks of 'chunk_rows' rows, committing
+    each chunk. Interrupted migration resumes from last committed chunk.
+    Duplicated v1 rows collapse to one row per ticker and minute.
+    
+    Parameters
+    ----------
+    db_path : string - database path
+    chunk_rows : int - rows converted per transaction
+    keep_v1 : bool - keep old table as intraday_v1 after migration
+    
+    Returns
+    -------
+    int - number of v1 rows converted.
+    '''
+    conn = _open(db_path)
+    try:
+        c = conn.cursor()
+        tables = [r[0] for r in c.execute('SELECT name FROM sqlite_master WHERE type = "table"')]
+        if 'intraday_v1' not in tables:
+            if get_schema_version(conn) != 1:
+                print("Nothing to migrate: intraday table is not v1")
+                return 0
+            # rename, new schema and progress mark in one transaction
+            c.execute('BEGIN')
+            try:
+                c.execute('ALTER TABLE intraday RENAME TO intraday_v1')
+                _create_intraday_v2(c)
+                c.execute('PRAGMA user_version = 0') # set to 2 once finished
+                c.execute('CREATE TABLE IF NOT EXISTS migration_v1_progress (last_rowid integer)')
+                c.execute('INSERT INTO migration_v1_progress VALUES (0)')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        elif 'migration_v1_progress' not in tables:
+            if conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+                print("Nothing to migrate: migration is finished, old table kept as intraday_v1")
+                return 0
+            # progress mark lost - converting from start (rows are upserted on key)
+            _create_intraday_v2(c)
+            c.execute('PRAGMA user_version = 0')
+            c.execute('CREATE TABLE migration_v1_progress (last_rowid integer)')
+            c.execute('INSERT INTO migration_v1_progress VALUES (0)')
+            conn.commit()
+        last = c.execute('SELECT last_rowid FROM migration_v1_progress').fetchone()[0]
+        total = c.execute('SELECT COUNT(*) FROM intraday_v1 WHERE rowid > ?', (last,)).fetchone()[0]
+        done = 0
+        print("Migrating {} intraday rows to v2 schema...".format(total))
+        while True:
+            chunk = pd.read_sql(sql='SELECT rowid, time, open, high, low, close, volume, ticker '+\
+                                'FROM intraday_v1 WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                con=conn, params=(last, chunk_rows), index_col='time',
+                                parse_dates=['time'])
+            if chunk.empty:
+                break
+            ids = _ticker_ids(conn, chunk['ticker'].unique(), create=True)
+            c.executemany('INSERT OR REPLACE INTO intraday VALUES (?,?,?,?,?,?,?)',
+                          _intraday_rows(*_intraday_arrays(chunk, ids)))
+            last = int(chunk['rowid'].max())
+            c.execute('UPDATE migration_v1_progress SET last_rowid = ?', (last,))
+            conn.commit()
+            done += chunk.shape[0]
+            print("Migrated {} of {} rows".format(done, total))
+        rebuild_daily_summary(conn)
+        if not keep_v1:
+            c.execute('DROP TABLE intraday_v1')
+        c.execute('DROP TABLE migration_v1_progress')
+        c.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+        conn.commit()
+        print("Migration to v2 schema finished successfully")
+        return done
+    finally:
+        conn.close()
+
+def create_ticker_universe_table(db_path):
+    """ create tables for tickers reference snapshot:
+        ticker_universe - tickers keyed by (market, ticker), 'market' is
+                          queried market, 'ticker_market' - market of Polygon data
+        ticker_universe_snapshots - date of last complete snapshot of market
+    takes:
+        - db_path - string - database path (or Database handle)"""
+    # table variables
+    create_table_sql = "CREATE TABLE IF NOT EXISTS ticker_universe "+\
+                                "(market text,"+\
+                                    "ticker text,"+\
+                                    "name text,"+\
+                                    "locale text,"+\
+                                    "currency text,"+\
+                                    "active integer,"+\
+                                    "primaryExch text,"+\
+                                    "updated text,"+\
+                                    "url text,"+\
+                                    "snapshot_date text,"+\
+                                    "ticker_market text,"+\
+                                    "PRIMARY KEY (market, ticker))"
+    create_snap_sql = "CREATE TABLE IF NOT EXISTS ticker_universe_snapshots "+\
+                                "(market text PRIMARY KEY,"+\
+                                    "snapshot_date text,"+\
+                                    "tickers integer,"+\
+                                    "changed integer)"
     # creating connection
-    conn = connect_db(db_path)
-    # creating cursor
-    c = conn.cursor()
-    # deleting by criteria
-    delete = 'DELETE from intraday WHERE '+\
-        'time LIKE "{}%"'.format(date)
-    c.execute(delete)
-    conn.commit()
-    print("Deleted {} from intraday table successfully.".format(date))
+    conn, owned = _connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute(create_table_sql)
+        c.execute(create_snap_sql)
+        conn.commit()
+    except Error as e:
+        print(e)
+    finally:
+        _release(conn, owned)
+
+@instrumented
+def rec_db_ticker_universe(db_path, df, market, snapshot_date=None):
+    '''
+    Records tickers reference snapshot to ticker_universe table.
+    Only tickers which are new or have different 'updated' date are written.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    df : Pandas Dataframe - tickers in data_loader.TICKER_COLS format
+    market : string - market of tickers (e.g. "stocks")
+    snapshot_date : string - "yyyy-mm-dd" date to mark snapshot complete
+                    (None - snapshot date is not changed)
+    
+    Returns
+    -------
+    int - number of tickers written.
+    '''
+    create_ticker_universe_table(db_path)
+    cols = ['ticker','name','market','locale','currency','active','primaryExch','updated','url']
+    # creating connection
+    conn, owned = _connect(db_path)
+    try:
+        c = conn.cursor()
+        known = dict(c.execute('SELECT ticker, updated FROM ticker_universe '+\
+                               'WHERE market = ?', (market,)).fetchall())
+        new = df[cols].astype(object).where(df[cols].notna(), None)
+        changed = new.loc[[known.get(tk, 0) != upd for tk, upd in
+                           zip(new['ticker'], new['updated'])]]
+        refreshed = snapshot_date or str(pd.Timestamp.now().date())
+        rows = [(market, tk, nm, lc, cur, None if act is None else int(act),
+                 exch, upd, url, refreshed, mkt)
+                for tk, nm, mkt, lc, cur, act, exch, upd, url in changed.itertuples(index=False)]
+        c.executemany('INSERT OR REPLACE INTO ticker_universe (market, ticker, name, locale, '+\
+                      'currency, active, primaryExch, updated, url, snapshot_date, ticker_market) '+\
+                      'VALUES (?,?,?,?,?,?,?,?,?,?,?)', rows)
+        if snapshot_date != None:
+            c.execute('INSERT OR REPLACE INTO ticker_universe_snapshots VALUES '+\
+                      '(?,?,?,?)', (market, snapshot_date, new.shape[0], len(rows)))
+        conn.commit()
+        print("Recorded {} new or updated of {} tickers to ".format(len(rows), new.shape[0])+\
+              "ticker_universe table")
+    finally:
+        _release(conn, owned)
+    return len(rows)
+
+@instrumented
+def get_db_ticker_universe_date(db_path, market):
+    '''returns date ("yyyy-mm-dd") of latest complete tickers snapshot
+    for market or None
+    takes:
+        - db_path - string - database path (or Database handle)
+        - market - string - market of tickers'''
+    conn, owned = _connect(db_path)
+    try:
+        res = conn.execute('SELECT snapshot_date FROM ticker_universe_snapshots '+\
+                           'WHERE market = ?', (market,)).fetchone()
+    except Error:
+        res = None
+    finally:
+        _release(conn, owned)
+    return res[0] if res else None
+
+@instrumented
+def get_db_ticker_universe(db_path, market):
+    ''' returning tickers snapshot from ticker_universe table as dataframe
+        sorted by ticker.
+        takes:
+            - db_path - string - database path (or Database handle)
+            - market - string - market of tickers'''
+    sel = 'SELECT ticker, name, ticker_market AS market, locale, currency, active, '+\
+        'primaryExch, updated, url FROM ticker_universe '+\
+        'WHERE market = ? ORDER BY ticker'
+    conn, owned = _connect(db_path)
+    try:
+        df = pd.read_sql(sql=sel, con=conn, params=(market,))
+    finally:
+        _release(conn, owned)
+    # unknown status (NULL) is not active
+    df['active'] = df['active'].fillna(0).astype(bool)
+    print("Successfully retrieved tickers from ticker_universe table")
+    return df
+
+DAILY_BARS_COLS = ['open', 'high', 'low', 'close', 'volume', 'vwap', 'transactions']
+
+def create_daily_bars_table(db_path):
+    """ create table for daily bars (grouped daily aggregates):
+        daily_bars - one bar per (ticker_id, day), day - days since 1970-01-01,
+                     tickers from tickers dictionary of intraday schema
+    takes:
+        - db_path - string - database path (or Database handle)"""
+    # table variables
+    create_table_sql = "CREATE TABLE IF NOT EXISTS daily_bars "+\
+                                "(ticker_id integer NOT NULL,"+\
+                                    "day integer NOT NULL,"+\
+                                    "open real,"+\
+                                    "high real,"+\
+                                    "low real,"+\
+                                    "close real,"+\
+                                    "volume real,"+\
+                                    "vwap real,"+\
+                                    "transactions integer,"+\
+                                    "PRIMARY KEY (ticker_id, day)) WITHOUT ROWID"
+    # creating connection
+    conn, owned = _connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute(CREATE_TICKERS_SQL)
+        c.execute(create_table_sql)
+        conn.commit()
+    except Error as e:
+        print(e)
+    finally:
+        _release(conn, owned)
+
+@instrumented
+def rec_db_daily_bars_df(db_path, df):
+    '''
+    Records daily bars to daily_bars table (upsert on ticker and day) in
+    one transaction.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    df : Pandas Dataframe - data_loader.get_grouped_daily_polygon() format:
+        columns = ['open', 'high', 'low', 'close', 'volume', 'vwap',
+                   'transactions', 'ticker'] ('vwap', 'transactions' optional)
+        index - datetime (day) named "day"
+    
+    Returns
+    -------
+    int - number of bars written.
+    '''
+    create_daily_bars_table(db_path)
+    df = df.reindex(columns=DAILY_BARS_COLS+['ticker'])
+    days = pd.DatetimeIndex(df.index).values.astype('datetime64[D]').astype(np.int64)
+    conn, owned = _connect(db_path)
+    try:
+        ids = _ticker_ids(conn, df['ticker'].unique().tolist(), create=True)
+        tids = df['ticker'].map(ids).values
+        vals = df[DAILY_BARS_COLS].astype(object).where(df[DAILY_BARS_COLS].notna(), None)
+        rows = zip(tids.tolist(), days.tolist(), *[vals[col].tolist() for col in DAILY_BARS_COLS])
+        conn.executemany('INSERT OR REPLACE INTO daily_bars VALUES (?,?,?,?,?,?,?,?,?)', rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _release(conn, owned)
+    print("Successfully recorded {} bars to daily_bars table".format(df.shape[0]))
+    return df.shape[0]
+
+@instrumented
+def query_daily_bars(db_path, tickers=None, start=None, end=None):
+    '''
+    Returns daily_bars rows for tickers and days range.
+    
+    Parameters
+    ----------
+    db_path : string - database path (or Database handle)
+    tickers : string or list of strings - tickers (None - all)
+    start, end : datetime.date() / "yyyy-mm-dd" - inclusive days range
+                 (None - unbounded)
+    
+    Returns
+    -------
+    Pandas Dataframe - columns ['open', 'high', 'low', 'close', 'volume',
+    'vwap', 'transactions', 'ticker'], index - datetime named "day",
+    sorted by day and ticker
+    '''
+    where = []
+    params = []
+    conn, owned = _connect(db_path)
+    try:
+        if tickers != None:
+            if isinstance(tickers, str):
+                tickers = [tickers]
+            ids = list(_ticker_ids(conn, tickers).values()) or [-1]
+            where.append('b.ticker_id IN ({})'.format(",".join("?"*len(ids))))
+            params.extend(ids)
+        if start != None:
+            where.append('b.day >= ?')
+            params.append(_day_minutes(start)[0] // 1440)
+        if end != None:
+            where.append('b.day <= ?')
+            params.append(_day_minutes(end)[0] // 1440)
+        sel = 'SELECT b.day, '+", ".join('b.'+col for col in DAILY_BARS_COLS)+\
+            ', t.ticker FROM daily_bars b JOIN tickers t ON t.ticker_id = b.ticker_id'
+        if len(where) > 0:
+            sel += ' WHERE '+' AND '.join(where)
+        sel += ' ORDER BY b.day, t.ticker'
+        df = pd.read_sql(sql=sel, con=conn, params=params)
+    finally:
+        _release(conn, owned)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('day').values.astype(np.int64),
+                                               unit='D'), name='day')
+    return df
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="STRACK database tools")
+    sub = parser.add_subparsers(dest="cmd")
+    mig = sub.add_parser("migrate", help="convert v1 intraday table to v2 schema")
+    mig.add_argument("db_path")
+    mig.add_argument("--chunk-rows", type=int, default=200000)
+    mig.add_argument("--keep-v1", action="store_true")
+    reb = sub.add_parser("rebuild-summary", help="recalculate daily_summary table")
+    reb.add_argument("db_path")
+    ret = sub.add_parser("retention", help="delete intraday data older than N days")
+    ret.add_argument("db_path")
+    ret.add_argument("--keep-days", type=int, required=True)
+    prt = sub.add_parser("partition", help="convert intraday table to monthly partitions")
+    prt.add_argument("db_path")
+    vac = sub.add_parser("vacuum", help="return free pages (enables incremental vacuum once)")
+    vac.add_argument("db_path")
+    args = parser.parse_args()
+    if args.cmd == "migrate":
+        migrate_intraday_v1_to_v2(args.db_path, args.chunk_rows, args.keep_v1)
+    elif args.cmd == "rebuild-summary":
+        rebuild_daily_summary(args.db_path)
+    elif args.cmd == "retention":
+        apply_intraday_retention(args.db_path, args.keep_days)
+    elif args.cmd == "partition":
+        partition_intraday_monthly(args.db_path)
+    elif args.cmd == "vacuum":
+        enable_incremental_vacuum(args.db_path)
+        print("Freed {} pages".format(vacuum_db(args.db_path)))
+    else:
+        parser.print_help()
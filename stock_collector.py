@@ -8,29 +8,33 @@ market data collection
 @author: vyachez
 """
 # Imports
-import numpy as np
 import pandas as pd
 from tqdm import tqdm
-import random
+import os
+import json
 import time
 from os import sys
 import more_itertools
 import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
-import importlib
-import strack_utils as u
-importlib.reload(u)
-import strack_sql as stkl
-importlib.reload(stkl)
-import strack_trade_exec as trader
-importlib.reload(trader)
-import strack_delivery as sms
-importlib.reload(sms)
-
-def get_stock(tickers, day, wait=5, db_path=None,
+import sql_utils as stkl
+import data_loader as dl
+import retry_scheduler as rs
+# intraday storage backend of collectors (read storage_backend)
+from storage_backend import storage, set_storage_backend
+from lazy_import import lazy_module
+u = lazy_module("strack_utils")
+trader = lazy_module("strack_trade_exec")
+sms = lazy_module("strack_delivery")
+
+def get_stock(tickers, day, wait=0, db_path=None,
               scope = "full",
               strict=False,
-              attempts = 10, acc_type=None):
+              attempts = 10, acc_type=None,
+              engine = "sync", concurrency = 8,
+              rate = None, flush_every = 1):
     '''
         parses intraday STOCK minute data from Polygon (with identical Yahoo Finance backup)
          and UPDATES intraday table in database.
@@ -38,12 +42,26 @@ def get_stock(tickers, day, wait=5, db_path=None,
         takes:
         - tickers - list - all tickers of stocks
         - day - datetime.datetime(yyyy,m,d).date() to collect data for
-        - wait - int - time to wait in seconds before uploading next ticker.
-        - db_path - str - path to database sqlite3.
+        - wait - float - min seconds between ticker requests ("sync" engine only,
+                         0 - paced by 'rate' only); retries wait for their
+                         backoff in retry queue, not here
+        - db_path - str - path to database sqlite3 (store directory for parquet
+                          storage backend, read storage_backend).
         - scope - str - "full" or "compact" if "compact" (limits to 60 minutes output)
+                        or "daily" - daily bars of all tickers with one grouped
+                        request to daily_bars table (read get_stock_daily())
         - strict - bool - in case if check for data integrity needed for each ticker
         - atempts - int  - to collect ticker in case of error (need to be more than 5 to change data provider)
         - acc_type - "paper" or "market"
+        - engine - str - "sync" (one ticker at a time) or
+                        "async" (concurrent requests, read get_stock_async())
+        - concurrency - int - max requests in flight ("async" engine only)
+        - rate - float - max Polygon requests per second
+                         (None - data_loader.polygon_rate_limit(acc_type))
+        - flush_every - int - with db_path, validated data is written every
+                        'flush_every' tickers in one transaction (memory holds
+                        that many tickers, finished tickers survive crash);
+                        0 - single write after all tickers
     
     Returns:
             Pandas Dataframe - loaded tickers data in strict predefined format:
@@ -57,12 +75,12 @@ def get_stock(tickers, day, wait=5, db_path=None,
         
     '''    
     provider = "polygon"
-    def_wait = 10 # default wait time
     
     if attempts < 6:
         msg = "Attention: if less "+\
             "than 6 attempts - backup collection "+\
-                "method/provider will not be triggered in case of fail."
+                "method/provider will not be triggered in case of ticker fail "+\
+                "(only if provider is degraded)."
         print(msg)
         logging.warning(msg)   
     
@@ -73,137 +91,83 @@ def get_stock(tickers, day, wait=5, db_path=None,
     print(msg)
     logging.info(msg)
     
-    # creating blank dataframe
-    master_df = pd.DataFrame(columns = ['open', 'high', 'low', 'close',
-                                        'volume', 'ticker'])
-            
-    # defaulting variables
-    base_provider = provider
-    base_attempts = attempts
-    # iterating through tickers and uploading
-    for s in tqdm(tickers):
-        ticker_empty = False
-        if db_path != None:
-            time.sleep(def_wait)
-        else:
-            time.sleep(wait)
-        if strict:
-            try:
-                no_data = True
-                wait_att = def_wait # time to wait if fail (incremental)
-                at_count = 0
-                attempts = base_attempts
-                provider = base_provider
-                while no_data:
-                    # selecting provider method
-                    if provider == "yfinance":
-                        d = u.get_ticker_yfinance(s)
-                    elif provider == "polygon":
-                        # verifying account
-                        if acc_type == None:
-                            logging.critical("Fatal: Specify account type")
-                            sys.exit()
-                        # getting day data
-                        start_date = end_date = str(day)
-                        # limiting scope
-                        if scope == "compact":
-                            limit = 60 # 1 hour
-                        else:
-                            limit = 0
-                        d = u.get_ticker_polygon(s, acc_type, 1,
-                            start_date, end_date, limit)
-                    else:
-                        logging.critical("Fatal: "+\
-                                         "wrong provider name {}".format(provider))
-                        sys.exit()
-                    # verifying integrity
-                    if d.empty != True:
-                        no_data = False
-                        if d.loc[d.index.date == day].shape[0] == 0:
-                            no_data = True
-                    if no_data:
-                        msg = "Error: Got BLANK {} data for {}. Retrying...".format(day, s)
-                        print(msg)
-                        logging.warning(msg)
-                        attempts = attempts - 1
-                        at_count += 1
-                        time.sleep(wait_att)
-                        wait_att += 5
-                        # smart change of data provider
-                        if at_count > 4 and provider != "yfinance":
-                            provider = "yfinance"
-                            wait_att = 5
-                            msg = "Trying changing data provider "+\
-                                "to {} to get {} data".format(provider, s)
-                            print(msg)
-                            logging.warning(msg)
-                    if attempts == 0:
-                        ticker_empty = True
-                        msg = "I could not get data for {}.".format(s)
-                        print(msg)
-                        logging.critical(msg)
-                        no_data = False 
-            except Exception as ex:
-                msg = "Unexpected Error: unable to get and convert data for {}: {}".format(s, ex)
-                print(msg)
-                logging.warning(msg)
-                time.sleep(def_wait+5)
-                continue
-        else:
-            try:
-                # selecting provider method
-                if provider == "yfinance":
-                    d = u.get_ticker_yfinance(s)
-                elif provider == "polygon":
-                    # verifying account
-                    if acc_type == None:
-                        logging.critical("Fatal: Specify account type")
-                        sys.exit()
-                    # getting day data
-                    start_date = end_date = str(day)
-                    # limiting scope
-                    if scope == "compact":
-                        limit = 60 # 1 hour
-                    else:
-                        limit = 0
-                    d = u.get_ticker_polygon(s, acc_type, 1,
-                        start_date, end_date, limit)
-                else:
-                    logging.critical("Fatal: "+\
-                                     "wrong provider name {}".format(provider))
-                    sys.exit()
-                # verifying integrity
-                if d.empty != True:
-                    if d.loc[d.index.date == day].shape[0] == 0:
-                        ticker_empty = True
-                        msg = "Got BLANK {} data for {}.".format(day, s)
-                        print(msg)
-                        logging.warning(msg)
-                else:
-                    ticker_empty = True
-                    msg = "Got BLANK {} data for {}.".format(day, s)
-                    print(msg)
-                    logging.warning(msg)
-            except Exception as ex:
-                msg = "Unexpected Error: unable to get and convert data for {}: {}".format(s, ex)
-                print(msg)
-                logging.warning(msg)
-                time.sleep(def_wait+5)
-                continue
+    if scope == "daily":
+        return get_stock_daily([day], acc_type, tickers=tickers, db_path=db_path,
+                               attempts=min(attempts, 3))
+    
+    if engine == "async":
+        return _run_async(get_stock_async(tickers, day, db_path=db_path,
+                                          scope=scope, strict=strict,
+                                          attempts=attempts, acc_type=acc_type,
+                                          concurrency=concurrency, rate=rate,
+                                          flush_every=flush_every))
+    
+    # verifying account
+    if acc_type == None and provider == "polygon":
+        msg = "Fatal: Specify account type"
+        logging.critical(msg)
+        sys.exit()
+    
+    # Polygon requests paced by token bucket instead of fixed sleeps
+    if rate == None:
+        rate = dl.polygon_rate_limit(acc_type)
+    if wait > 0:
+        rate = min(rate, 1 / wait)
+    limiter = dl.RateLimiter(rate)
+    # collected data is written by tickers or returned at the end
+    writer = _DayWriter(day, db_path, flush_every)
+    # failed tickers are requeued with backoff, degraded provider is
+    # skipped (read retry_scheduler)
+    scheduler = rs.RetryScheduler(providers=(provider, "yfinance"),
+                                  max_attempts=attempts, failover_after=5)
+    progress = tqdm(total=len(tickers))
 
-        if ticker_empty != True:
-            try:
-                d = d.loc[d.index.date == day].copy()
-                master_df = master_df.append(d, ignore_index = False, sort=False)
-            except Exception as ex:
-                msg = "Error: unable to add ticker data {} to master: {}".format(s, ex)
-                print(msg)
-                logging.warning(msg)
-                time.sleep(def_wait+5)
-        else:
+    def collect(s, provider):
+        '''single attempt to collect and save ticker 's' data'''
+        if provider == "polygon":
+            limiter.acquire()
+        d = _fetch_ticker_day(s, day, provider, scope, acc_type)
+        # verifying integrity
+        if d.empty or d.loc[d.index.date == day].shape[0] == 0:
+            if strict:
+                raise rs.BlankData("Got BLANK {} data for {}".format(day, s))
+            msg = "Got BLANK {} data for {}.".format(day, s)
+            print(msg)
+            logging.warning(msg)
             msg = "No {} ticker data".format(s)
             print(msg)
             logging.warning(msg)
+            progress.update()
+            return False
+        writer.add(d.loc[d.index.date == day].copy())
+        progress.update()
+        return True
+
+    def failed(s, error):
+        msg = "I could not get data for {}.".format(s)
+        print(msg)
+        logging.critical(msg)
+        progress.update()
+
+    try:
+        scheduler.run(tickers, collect, on_fail=failed)
+    finally:
+        progress.close()
+    return writer.close()
+
+def _run_async(coro):
+    '''runs coroutine to completion and returns its result; called from
+    running event loop (e.g. Jupyter) it runs in own loop of worker thread'''
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+def _save_or_return(master_df, day, db_path):
+    '''sorts collected day data and saves it to intraday table
+    (if db_path) or returns it'''
     if master_df.empty:
         msg = "No data collected!"
         print(msg)
@@ -214,25 +178,220 @@ def get_stock(tickers, day, wait=5, db_path=None,
         master_df.index.name = "time"
         if db_path != None:
             # saving collected data to database - intraday table
-            stkl.rec_db_intraday_df(db_path, master_df)
+            storage().rec_db_intraday_df(db_path, master_df)
             msg = "Saved collected data for {} to intraday table.".format(day)
             print(msg)
             logging.info(msg)
         else:
             return master_df   
+
+class _DayWriter():
+    '''
+        Collects validated ticker frames of get_stock() day. With db_path
+        buffered frames are written every 'flush_every' tickers (one
+        transaction per write), otherwise (or flush_every=0) all frames are
+        concatenated once at close() - no growing dataframe copies.
+    '''
+    def __init__(self, day, db_path, flush_every=1):
+        self.day = day
+        self.db_path = db_path
+        self.flush_every = flush_every if db_path != None else 0
+        self.frames = []
+        self.rows = 0
+        self.db = None
+        if self.flush_every > 0:
+            # one connection for all writes of the day
+            self.db = storage().Database(db_path) if isinstance(db_path, str) else db_path
+
+    def add(self, d):
+        self.frames.append(d)
+        if self.flush_every > 0 and len(self.frames) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        '''writes buffered frames to intraday table'''
+        if len(self.frames) == 0:
+            return
+        df = pd.concat(self.frames, sort=False).sort_index()
+        df.index.name = "time"
+        self.frames = []
+        storage().rec_db_intraday_df(self.db, df)
+        self.rows += df.shape[0]
+
+    def close(self):
+        '''writes remaining frames, returns read get_stock()'''
+        if self.flush_every == 0:
+            master_df = pd.concat(self.frames, sort=False) if len(self.frames) > 0 else \
+                pd.DataFrame(columns = ['open', 'high', 'low', 'close', 'volume', 'ticker'])
+            return _save_or_return(master_df, self.day, self.db_path)
+        try:
+            self.flush()
+        finally:
+            if self.db is not self.db_path:
+                self.db.close()
+        if self.rows == 0:
+            msg = "No data collected!"
+            print(msg)
+            logging.warning(msg)
+        else:
+            msg = "Saved collected data for {} to intraday table ({} rows).".format(self.day,
+                                                                                  self.rows)
+            print(msg)
+            logging.info(msg)
+
+def _fetch_ticker_day(s, day, provider, scope, acc_type):
+    '''single attempt to get 'day' data for ticker 's' from provider'''
+    # selecting provider method
+    if provider == "yfinance":
+        d = u.get_ticker_yfinance(s)
+    elif provider == "polygon":
+        # verifying account (runs in worker threads of async engine - no exit)
+        if acc_type == None:
+            raise ValueError("Specify account type")
+        # getting day data
+        start_date = end_date = str(day)
+        # limiting scope
+        if scope == "compact":
+            limit = 60 # 1 hour
+        else:
+            limit = 0
+        d = dl.get_ticker_polygon(s, acc_type, 1,
+            start_date, end_date, limit)
+    else:
+        raise ValueError("Wrong provider name {}".format(provider))
+    return d
+
+async def _collect_ticker_async(s, day, scope, strict, attempts, acc_type,
+                                limiter, semaphore, executor, scheduler, writer,
+                                writes):
+    '''
+        get_stock() ticker collection for asyncio engine: same retry and
+        provider switching rules (read retry_scheduler), but waiting on
+        retries does not hold a concurrency slot. Ticker day data is handed
+        to writer (_DayWriter) right away, so finished tasks keep no frames;
+        writer runs in single thread executor 'writes' - database writes are
+        serialised and do not stall requests in flight on event loop.
+        Returns (ticker, True if data was written).
+    '''
+    loop = asyncio.get_running_loop()
+    failures = 0
+    while True:
+        provider, wait = scheduler.provider(failures)
+        if wait > 0:
+            await asyncio.sleep(wait)
+            continue
+        breaker = rs.get_breaker(provider)
+        retry_after = None
+        try:
+            async with semaphore:
+                # pacing against provider rate limit
+                if provider == "polygon":
+                    await asyncio.sleep(limiter.reserve())
+                d = await loop.run_in_executor(executor, _fetch_ticker_day,
+                                               s, day, provider, scope, acc_type)
+        except rs.RetryableError as ex:
+            if isinstance(ex, rs.PROVIDER_ERRORS):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            retry_after = ex.retry_after
+            msg = "Error: {} for {}. Retrying...".format(ex, s)
+        except Exception as ex:
+            breaker.release()
+            msg = "Unexpected Error: unable to get and convert data for {}: {}".format(s, ex)
+            print(msg)
+            logging.warning(msg)
+            return s, False
+        else:
+            # verifying integrity
+            if d.empty != True and d.loc[d.index.date == day].shape[0] > 0:
+                breaker.record_success()
+                await loop.run_in_executor(writes, writer.add,
+                                           d.loc[d.index.date == day].copy())
+                return s, True
+            if not strict:
+                breaker.record_success()
+                msg = "Got BLANK {} data for {}.".format(day, s)
+                print(msg)
+                logging.warning(msg)
+                return s, False
+            # data-level blank - retried, provider is not degraded by it
+            breaker.release()
+            msg = "Error: Got BLANK {} data for {}. Retrying...".format(day, s)
+        print(msg)
+        logging.warning(msg)
+        failures += 1
+        if failures >= attempts:
+            msg = "I could not get data for {}.".format(s)
+            print(msg)
+            logging.critical(msg)
+            return s, False
+        await asyncio.sleep(scheduler.backoff.delay(failures - 1, retry_after))
+
+async def get_stock_async(tickers, day, db_path=None,
+                          scope = "full",
+                          strict=False,
+                          attempts = 10, acc_type=None,
+                          concurrency = 8, rate = None,
+                          flush_every = 1):
+    '''
+        asyncio engine of get_stock(): overlaps up to 'concurrency' requests
+        in flight and paces Polygon requests with token bucket of 'rate'
+        requests per second instead of fixed sleeps.
+        Same strict/non-strict, scope and provider fallback rules.
+        takes:
+        - tickers, day, db_path, scope, strict, attempts, acc_type,
+          flush_every - read get_stock()
+        - concurrency - int - max requests in flight
+        - rate - float - max Polygon requests per second
+                         (None - data_loader.polygon_rate_limit(acc_type))
+    Returns:
+            read get_stock()
+    '''
+    # verifying account before launching requests
+    if acc_type == None:
+        msg = "Fatal: Specify account type"
+        logging.critical(msg)
+        raise ValueError(msg)
+    if rate == None:
+        rate = dl.polygon_rate_limit(acc_type)
+    limiter = dl.RateLimiter(rate, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    writer = _DayWriter(day, db_path, flush_every)
+    scheduler = rs.RetryScheduler(providers=("polygon", "yfinance"),
+                                  max_attempts=attempts, failover_after=5)
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, \
+            ThreadPoolExecutor(max_workers=1) as writes:
+        tasks = [_collect_ticker_async(s, day, scope, strict, attempts, acc_type,
+                                       limiter, semaphore, executor, scheduler, writer,
+                                       writes)
+                 for s in tickers]
+        # tickers are written by tasks as they complete
+        for fut in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            s, written = await fut
+            if not written:
+                msg = "No {} ticker data".format(s)
+                print(msg)
+                logging.warning(msg)
+        return await loop.run_in_executor(writes, writer.close)
     
 def get_stock_bulk(ticker,
                       start_date,
                       end_date,
                       attempts = 3,
                       acc_type = None,
-                      db_path = None):
+                      db_path = None,
+                      chunk_days = 5):
     '''
         Designed to get stock for wide time frames for single ticker.
         POLYGON provider ONLY.
         
         Does not verify each date.
         
+        Range is streamed by chunks of 'chunk_days' days; with db_path each
+        chunk is saved as soon as it arrives (memory bounded by one chunk).
+        
         If you need day to day data use get_stock() function.
         
         takes:
@@ -240,12 +399,16 @@ def get_stock_bulk(ticker,
             - start_date, end_date - datetime.datetime(yyyy,mm,dd).date() - range
             - atempts - int  - to collect ticker in case of error
             - acc_type - "paper" or "market"
-            - db_path - str - path to database sqlite3.
+            - db_path - str - path to database sqlite3 (store directory for parquet
+                          storage backend, read storage_backend).
+            - chunk_days - int - calendar days per Polygon request
         Returns:
             Pandas Dataframe - loaded tickers data in strict predefined format:
                 columns = ['open', 'high', 'low', 'close', 'volume', 'ticker']
                 index - datetime.datetime()
                 index.name = "time" 
+            OR
+            None if saved to db.
     '''
     # verifying account
     if acc_type == None:
@@ -259,66 +422,201 @@ def get_stock_bulk(ticker,
     print(msg)
     logging.info(msg)
 
-    def_wait = 10 # default wait time
-
-    ticker_empty = False
-    # getting data
-    try:
-        no_data = True
-        wait_att = def_wait # time to wait if fail (incremental)
-        at_count = 0
-        while no_data:
-            d = u.get_ticker_polygon(ticker, acc_type, 1,
-                start_date, end_date, 0)
-            # verifying integrity
-            if d.empty != True:
-                no_data = False
-            if no_data:
-                msg = "Error: Got BLANK data for {}. Retrying...".format(ticker)
-                print(msg)
-                logging.warning(msg)
-                attempts = attempts - 1
-                at_count += 1
-                time.sleep(wait_att)
-                wait_att += 5
-            if attempts == 0:
-                msg = "I could not get data for {}.".format(ticker)
-                ticker_empty = True
-                print(msg)
-                logging.critical(msg)
-                no_data = False 
-    except Exception as ex:
-        msg = "Unexpected Error: unable to get and convert data for {}: {}".format(ticker, ex)
-        ticker_empty = True
-        print(msg)
-        logging.warning(msg)
-        time.sleep(def_wait+5)
+    # getting data, retries with backoff (read retry_scheduler)
+    unit = _BulkRange(start_date, end_date, acc_type, db_path, chunk_days)
+    scheduler = rs.RetryScheduler(providers=("polygon",), max_attempts=attempts)
+    ticker_empty = ticker not in scheduler.run([ticker], unit, on_fail=_bulk_failed)
 
     if ticker_empty == True:
         msg = "No {} ticker data".format(ticker)
         print(msg)
         logging.warning(msg)
     else:
-        d = d.sort_index()
         if db_path != None:
-            # saving collected data to database - intraday table
-            stkl.rec_db_intraday_df(db_path, d)
-            msg = "Saved collected data for {}.".format(ticker)
+            msg = "Saved collected data for {} ({} rows).".format(ticker, unit.rows)
             print(msg)
             logging.info(msg)
         else:
+            d = pd.concat(unit.chunks, sort=False)
+            # resumed day may be received twice
+            d = d[~d.index.duplicated(keep='last')].sort_index()
+            d.index.name = "time"
             return d 
+
+class _BulkRange():
+    '''
+        get_stock_bulk() range collection of single ticker as
+        RetryScheduler work: each attempt streams remaining range (retries
+        continue from last received day), chunks are saved to db_path as
+        they arrive or kept in 'chunks'. Raises RetryableError on rate
+        limits / provider errors / no data.
+    '''
+    def __init__(self, start_date, end_date, acc_type, db_path, chunk_days=5):
+        self.end_date = end_date
+        self.acc_type = acc_type
+        self.db_path = db_path
+        self.chunk_days = chunk_days
+        self.resume_from = start_date
+        self.rows = 0 # rows received
+        self.chunks = [] # kept only if not saving to db
+
+    def __call__(self, ticker, provider):
+        for d in dl.iter_ticker_polygon(ticker, self.acc_type, 1, self.resume_from,
+                                        self.end_date, self.chunk_days):
+            self.rows += d.shape[0]
+            self.resume_from = d.index.max().date()
+            if self.db_path != None:
+                # saving collected chunk to database - intraday table
+                storage().rec_db_intraday_df(self.db_path, d)
+            else:
+                self.chunks.append(d)
+        # verifying integrity
+        if self.rows == 0:
+            raise rs.BlankData("Got BLANK data for {}".format(ticker))
+        return self.rows
+
+def _bulk_failed(ticker, error):
+    msg = "I could not get data for {}.".format(ticker)
+    print(msg)
+    logging.critical(msg)
         
+def _load_checkpoint(filename, db_path):
+    '''returns checkpoint manifest of batch collection (completed units)
+    for db_path - new one if file is missing or belongs to other database'''
+    ckpt = {'db_path': str(db_path), 'units': {}}
+    if os.path.exists(filename):
+        try:
+            with open(filename) as f:
+                saved = json.load(f)
+            if saved.get('db_path') == str(db_path):
+                ckpt = saved
+            else:
+                msg = "Checkpoint {} is for other database - starting over".format(filename)
+                print(msg)
+                logging.warning(msg)
+        except (ValueError, OSError) as ex:
+            msg = "ERROR: Failed to read checkpoint {}: {}".format(filename, ex)
+            print(msg)
+            logging.warning(msg)
+    return ckpt
+
+def _save_checkpoint(filename, ckpt):
+    '''writes checkpoint manifest atomically (no half written file on crash)'''
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename + ".tmp", 'w') as f:
+        json.dump(ckpt, f, indent=1)
+    os.replace(filename + ".tmp", filename)
+
+def _unit_key(ticker, batch_days):
+    '''checkpoint key of (ticker, batch) unit'''
+    return "{}|{}|{}".format(ticker, batch_days[0], batch_days[-1])
+
+def _coverage(db, tickers, start, end):
+    '''returns set of (ticker, date) pairs with data in database between
+    start and end (coverage query - no price data is loaded)'''
+    cov = storage().get_db_intraday_coverage(db, tickers=list(tickers),
+                                             start=start, end=end)
+    return set(zip(cov['ticker'], cov['date']))
+
+def _is_sqlite_db(db_path):
+    '''True if db_path is sqlite Database handle, new database file path
+    or path of existing sqlite database'''
+    if isinstance(db_path, stkl.Database):
+        return True
+    if not isinstance(db_path, str) or os.path.isdir(db_path):
+        return False
+    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
+        return True
+    with open(db_path, 'rb') as f:
+        return f.read(16) == b"SQLite format 3\x00"
+
+def get_stock_daily(days, acc_type, tickers=None, db_path=None, attempts=3,
+                    wait=10):
+    '''
+        Collects daily bars of all tickers with Polygon grouped daily
+        requests - one request per day instead of one per ticker and day.
+        POLYGON provider ONLY.
+        takes:
+            - days - list - datetime.date() trading days
+            - acc_type - "paper" or "market"
+            - tickers - list - keep only these tickers (None - all Polygon tickers)
+            - db_path - str - path to database sqlite3 (daily_bars table,
+                              sqlite only for any storage backend)
+            - attempts - int - requests per day on rate limits / provider errors
+                               (day without bars is non-trading day, not retried)
+            - wait - int - seconds before first retry (exponential backoff)
+        Returns:
+            Pandas Dataframe - read data_loader.get_grouped_daily_polygon(),
+                               all days sorted by day and ticker
+            OR
+            None if saved to db.
+    '''
+    # verifying account
+    if acc_type == None:
+        msg = "Fatal: Specify account type"
+        logging.critical(msg)
+        sys.exit()
+    # daily_bars table is kept in sqlite database only
+    if db_path != None and not _is_sqlite_db(db_path):
+        raise ValueError("get_stock_daily needs sqlite database path, got {}".format(db_path))
+    msg = "Grouped daily collection from POLYGON for {} days".format(len(days))
+    print(msg)
+    logging.info(msg)
+    frames = []
+
+    def collect(day, provider):
+        '''single grouped request for day'''
+        bars = dl.get_grouped_daily_polygon(day, acc_type, tickers)
+        if bars.empty:
+            # answered OK without bars - market was closed
+            msg = "No daily bars for {} - non-trading day".format(day)
+            print(msg)
+            logging.info(msg)
+            return 0
+        if db_path != None:
+            stkl.rec_db_daily_bars_df(db_path, bars)
+        else:
+            frames.append(bars)
+        return bars.shape[0]
+
+    def failed(day, error):
+        msg = "No daily bars for {}".format(day)
+        print(msg)
+        logging.critical(msg)
+
+    # rate limited or failed days are retried after other days
+    scheduler = rs.RetryScheduler(providers=("polygon",), max_attempts=attempts,
+                                  backoff=rs.Backoff(base=wait))
+    scheduler.run(days, collect, on_fail=failed)
+    if db_path != None or len(frames) == 0:
+        return None
+    return pd.concat(frames, sort=False).sort_values(['ticker'], kind='stable').sort_index(kind='stable')
+
 def batch_tickers_collector(tickers, start_date, end_date, acc_type, path,
-                            db_path, deliver=False):
+                            db_path, deliver=False, trade_days=None, pause=True,
+                            resume=True, dry_run=False):
     '''Collects wide range dates by batches for provided multiple tickers
         All args are mandatory - explanation at get_stock_bulk function
         
         tickers - list
         Start_date, End_date - datetime.datetime() only (no date() at the end)
+        trade_days - list of datetime.date() - trading days to collect
+                     (None - taken from broker calendar for start/end dates)
+        pause - bool - sleeps between tickers while provider is failing
+                (backoff of its failures in a row, read retry_scheduler)
+        resume - bool - skip (ticker, batch) units completed by previous runs
+                        (checkpoint path/strack_data/tick_batch_checkpoint.json)
+                        or already covered in database; False - start over
+        dry_run - bool - only report remaining work, nothing is downloaded
         
         Workflow: breaks requested dates by batch of 'batch_counter' days (maximum capacity
-        for single upload via Polygon) and downloads for each ticker saving to database
+        for single upload via Polygon) and downloads for each ticker saving to database.
+        Every complete (ticker, batch) unit is recorded to checkpoint, so after
+        crash the same call continues where it stopped; units with missing
+        dates are collected again.
+        
+        returns:
+            dict - {batch days tuple: list of remaining tickers} (dry_run only)
         
         CAUTION! DATA corruption may occur if used inaccurately
     '''
@@ -332,86 +630,157 @@ def batch_tickers_collector(tickers, start_date, end_date, acc_type, path,
                        'error':error}
         return log
     
-    # account
-    tx = trader.Trader(acc_type=acc_type, deliver=False,
-                                   stop_limit=1)
-    
     # getting tradable days
-    days_trade = tx.api.get_calendar(start_date, end_date)
+    if trade_days == None:
+        # account
+        tx = trader.Trader(acc_type=acc_type, deliver=False,
+                                       stop_limit=1)
+        trade_days = [d.date.date() for d in tx.api.get_calendar(start_date, end_date)]
+    days_trade = list(trade_days)
     
     msg_notif = "Batch Downloader for tickers data activated."
     logging.info(msg_notif)
     print(msg_notif)
-    if deliver:
+    if deliver and not dry_run:
         sms.send(msg_notif)
     
     # batching days by downloadable days sizer
     batch_counter = 5
-    days_batched = list(more_itertools.windowed(days_trade,n=batch_counter, step=batch_counter))
+    days_batched = [tuple(filter(None, batch)) for batch in
+                    more_itertools.windowed(days_trade,n=batch_counter, step=batch_counter)
+                    if any(batch)]
     for batch in days_batched:
         print("*************")
-        st_d = list(filter(None, batch))[0].date.date()
-        en_d = list(filter(None, batch))[-1].date.date()
-        print("Batched dates: {} - {}:".format(st_d, en_d))
-        for d in list(filter(None, batch)):
-            print(d.date.date())
+        print("Batched dates: {} - {}:".format(batch[0], batch[-1]))
+        for d in batch:
+            print(d)
+    
+    # remaining (ticker, batch) units
+    ckpt_file = path+'/strack_data/tick_batch_checkpoint.json'
+    ckpt = _load_checkpoint(ckpt_file, db_path) if resume else \
+        {'db_path': str(db_path), 'units': {}}
+    covered = set()
+    if resume and os.path.exists(db_path) and len(days_batched) > 0:
+        db = storage().Database(db_path)
+        try:
+            covered = _coverage(db, tickers, days_batched[0][0], days_batched[-1][-1])
+        finally:
+            db.close()
+    pending = {}
+    skipped = 0
+    for batch in days_batched:
+        pending[batch] = []
+        for tk in tickers:
+            unit = ckpt['units'].get(_unit_key(tk, batch))
+            if resume and unit != None and len(unit.get('missing', [])) == 0:
+                skipped += 1
+            elif resume and all((tk, d) in covered for d in batch):
+                # downloaded before checkpoints, by other tool or on retry
+                ckpt['units'][_unit_key(tk, batch)] = {'covered': True}
+                skipped += 1
+            else:
+                # units with missing dates (older checkpoints) are retried
+                ckpt['units'].pop(_unit_key(tk, batch), None)
+                pending[batch].append(tk)
+    left = sum(len(tks)*len(batch) for batch, tks in pending.items())
+    msg = "Remaining work: {} of {} ticker batches ".format(
+        sum(len(tks) for tks in pending.values()), len(days_batched)*len(tickers))+\
+        "({} ticker days), {} already done".format(left, skipped)
+    print(msg)
+    logging.info(msg)
+    if dry_run:
+        for batch, tks in pending.items():
+            if len(tks) > 0:
+                print("{} - {}: {} tickers".format(batch[0], batch[-1], len(tks)))
+        return pending
+    if resume:
+        _save_checkpoint(ckpt_file, ckpt)
             
-    # downloading by batches with start date and end date
+    # downloading by batches with start date and end date; failed tickers
+    # of batch go to the end of its queue while others are downloaded
+    scheduler = rs.RetryScheduler(providers=("polygon",), max_attempts=3)
     count = 0
     err_log = {}
     print("Started downloading...\n")
+    # one database connection for all batches
+    db = storage().Database(db_path)
+
+    def check(tk, batch):
+        '''checks downloaded dates of (ticker, batch) unit'''
+        nonlocal count, err_log
+        print("Checking...")
+        master = _coverage(db, [tk], batch[0], batch[-1]) # (ticker, date) pairs
+        missing = []
+        # checking if all dates downloaded
+        for d in batch:
+            if (tk, d) not in master:
+                missing.append(str(d))
+                msg = "ERROR: {} date was not downloaded for {}".format(d, tk)
+                err_log = err_logger(count, err_log, tk, d, msg)
+                print(msg)
+                logging.warning(msg)
+                if deliver:
+                    sms.send(msg) 
+                count+=1
+        # unit is done - not repeated on resume; units with missing
+        # dates (in error log) are retried by next run
+        if resume and len(missing) == 0:
+            ckpt['units'][_unit_key(tk, batch)] = {'missing': missing}
+            _save_checkpoint(ckpt_file, ckpt)
+        progress.update()
+        if pause:
+            # holding off only while provider shows failures
+            sl = scheduler.pause("polygon")
+            if sl > 0:
+                print("Sleeping {:.0f} seconds".format(sl))
+                time.sleep(sl)
+
     try:
         for batch in tqdm(days_batched):
+            if len(pending[batch]) == 0:
+                continue
             print("*************")
-            st_d = list(filter(None, batch))[0].date.date()
-            en_d = list(filter(None, batch))[-1].date.date()
+            units = {tk: _BulkRange(batch[0], batch[-1], acc_type, db)
+                     for tk in pending[batch]}
+
+            def collect(tk, provider):
+                units[tk](tk, provider)
+                check(tk, batch)
+
+            def failed(tk, error):
+                _bulk_failed(tk, error)
+                check(tk, batch)
+
             # downloading tickers
-            for tk in tqdm(tickers):
-                get_stock_bulk(tk, st_d, en_d,
-                                  attempts = 3,
-                                  acc_type = acc_type,
-                                  db_path = db_path)
-                # checking if download is successful
-                print("Checking...")
-                master = stkl.get_db_intraday_ticker(db_path, tk) # obtaining database
-                master_dates = np.array(np.unique(master.index.date))
-                # iterating via dataframe to check if all dates downloaded
-                for d in list(filter(None, batch)):
-                    if d.date.date() not in master_dates:
-                        msg = "ERROR: {} date was not downloaded for {}".format(d.date.date(), tk)
-                        err_log = err_logger(count, err_log, tk, d.date.date(), msg)
-                        print(msg)
-                        logging.warning(msg)
-                        if deliver:
-                            sms.send(msg) 
-                        count+=1
-                sl = random.randint(5, 33)
-                print("Sleeping {} seconds".format(sl))
-                time.sleep(sl)
-            sl = random.randint(5, 120)
-            print("Sleeping {} seconds before next batch".format(sl))
-            time.sleep(sl)
+            progress = tqdm(total=len(units))
+            try:
+                scheduler.run(list(units), collect, on_fail=failed)
+            finally:
+                progress.close()
     
         # final dates check
         print("Final Checking for dates...")
-        master = stkl.get_db_intraday_all(db_path) # obtaining database
-        master_dates = np.array(np.unique(master.index.date))
-        # iterating via dataframe to check if all dates downloaded
-        for d in list(filter(None, days_trade)):
-            if d.date.date() not in master_dates:
-                msg = "ERROR: {} date was not downloaded for {}".format(d.date.date(), tk)
-                err_log = err_logger(count, err_log, tk, d.date.date(), msg)
-                print(msg)
-                logging.warning(msg)
-                count+=1
+        master = _coverage(db, tickers, days_trade[0], days_trade[-1]) \
+            if len(days_trade) > 0 else set()
+        # checking if all dates downloaded for every ticker
+        for tk in tickers:
+            for d in days_trade:
+                if (tk, d) not in master:
+                    msg = "ERROR: {} date was not downloaded for {}".format(d, tk)
+                    err_log = err_logger(count, err_log, tk, d, msg)
+                    print(msg)
+                    logging.warning(msg)
+                    count+=1
     
         msg = "Finished bulk collection"
         print(msg)
         logging.info(msg)
         if deliver:
             sms.send(msg)
+        db.close()
             
     except Exception as ex:
+        db.close()
         msg = "Unexpected error: {}. Terminating".format(ex)
         print(msg)
         logging.critical(msg)
@@ -439,13 +808,12 @@ def batch_tickers_collector(tickers, start_date, end_date, acc_type, path,
             msg = "successfully recorded log"
             print(msg)
             logging.warning(msg)
-            sys.exit()
-        except Exception as ex:
+        except Exception as log_ex:
             msg = "ERROR: Failed to record error log: "+\
-            "{}".format(ex)
+            "{}".format(log_ex)
             print(msg)
             logging.warning(msg)
-            sys.exit()
+        raise
     
     # Successfull load        
     # recording error log
@@ -475,4 +843,35 @@ def batch_tickers_collector(tickers, start_date, end_date, acc_type, path,
         "{}".format(ex)
         print(msg)
         logging.warning(msg)
-        
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    import argparse
+    import datetime
+    parser = argparse.ArgumentParser(description="STRACK data collection")
+    sub = parser.add_subparsers(dest="cmd")
+    bat = sub.add_parser("batch", help="resumable batch collection of tickers history")
+    bat.add_argument("--tickers", required=True, help="comma separated tickers")
+    bat.add_argument("--start", required=True, help="yyyy-mm-dd")
+    bat.add_argument("--end", required=True, help="yyyy-mm-dd")
+    bat.add_argument("--acc-type", default="paper")
+    bat.add_argument("--path", required=True, help="folder containing strack_data/")
+    bat.add_argument("--db-path", required=True)
+    bat.add_argument("--trade-days", default=None,
+                     help="comma separated yyyy-mm-dd (default - broker calendar)")
+    bat.add_argument("--dry-run", action="store_true", help="only report remaining work")
+    bat.add_argument("--restart", action="store_true", help="ignore checkpoint")
+    bat.add_argument("--no-pause", action="store_true")
+    args = parser.parse_args()
+    if args.cmd == "batch":
+        parse = lambda d: datetime.datetime.strptime(d.strip(), "%Y-%m-%d")
+        trade_days = None
+        if args.trade_days != None:
+            trade_days = [parse(d).date() for d in args.trade_days.split(",")]
+        batch_tickers_collector([t.strip() for t in args.tickers.split(",")],
+                                parse(args.start), parse(args.end),
+                                args.acc_type, args.path, args.db_path,
+                                trade_days=trade_days, pause=not args.no_pause,
+                                resume=not args.restart, dry_run=args.dry_run)
+    else:
+        parser.print_help()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18, 2026
+
+Intraday storage backend selection
+
+Shared by collectors and analytics without importing collection stack:
+    "sqlite" - sql_utils, db_path is database file
+    "parquet" - parquet_store, db_path is store directory
+Current backend is set at runtime with set_storage_backend() or by
+STRACK_STORAGE environment variable (default "sqlite").
+
+@author: vyachez
+"""
+# Imports
+import os
+
+import sql_utils as stkl
+import parquet_store as pqs
+
+# None - STRACK_STORAGE environment variable (read at call time)
+STORAGE_BACKEND = None
+STORAGE_MODULES = {"sqlite": stkl, "parquet": pqs}
+
+def storage(backend=None):
+    '''returns storage module of backend ("sqlite" or "parquet",
+    None - current backend, read STORAGE_BACKEND)'''
+    if backend == None:
+        backend = STORAGE_BACKEND if STORAGE_BACKEND != None else \
+            os.environ.get("STRACK_STORAGE", "sqlite")
+    if backend not in STORAGE_MODULES:
+        raise ValueError("Unknown storage backend: {}".format(backend))
+    return STORAGE_MODULES[backend]
+
+def set_storage_backend(backend):
+    '''switches intraday storage of collectors and analytics at runtime
+    ("sqlite", "parquet" or None - STRACK_STORAGE environment variable)'''
+    global STORAGE_BACKEND
+    if backend != None:
+        storage(backend)
+    STORAGE_BACKEND = backend
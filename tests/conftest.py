@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of tests
+
+@author: vyachez
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader as dl
+import polygon_standin as st
+import retry_scheduler as rs
+
+
+def make_intraday_df(tickers, days, minutes=5, seed=0):
+    '''returns intraday dataframe in recording format: 'minutes' session
+    bars from 9:30 for every ticker and day'''
+    rng = np.random.default_rng(seed)
+    frames = []
+    for day in days:
+        index = pd.date_range(pd.Timestamp(day) + pd.Timedelta(hours=9, minutes=30),
+                              periods=minutes, freq='min', name='time')
+        for ticker in tickers:
+            close = 100 + rng.random(minutes)
+            frames.append(pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1,
+                                        'close': close, 'volume': rng.integers(1, 1000, minutes)
+                                        .astype(float), 'ticker': ticker}, index=index))
+    return pd.concat(frames)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    '''path of fresh database file'''
+    return str(tmp_path / "test.db")
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    '''starts stand-in Polygon server (start(**StandinConfig args)),
+    data_loader pointed at it'''
+    servers = []
+    def start(**kwargs):
+        srv = st.start_standin(st.StandinConfig(**kwargs))
+        servers.append(srv)
+        monkeypatch.setattr(dl, 'POLYGON_BASE_URL', srv.url)
+        monkeypatch.setattr(dl, 'POLYGON_API_KEY', 'x')
+        return srv
+    yield start
+    for srv in servers:
+        srv.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    '''circuit breakers of providers are not shared between tests'''
+    monkeypatch.setattr(rs, '_breakers', {})
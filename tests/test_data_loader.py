@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of data_loader
+
+@author: vyachez
+"""
+import datetime
+
+import pytest
+
+import data_loader as dl
+import polygon_standin as st
+import retry_scheduler as rs
+import sql_utils as stkl
+
+
+def test_universe_keeps_polygon_market(db_path, standin):
+    standin()
+    universe = dl.get_ticker_universe(db_path, market='stocks', refresh=True)
+    assert len(universe) == st.UNIVERSE_SIZE
+    assert set(universe['market']) == {'STOCKS'}
+    assert stkl.get_db_ticker_universe_date(db_path, 'stocks') == \
+        str(datetime.datetime.now().date())
+
+
+def test_universe_failure_keeps_previous_snapshot(db_path, standin, monkeypatch):
+    standin()
+    dl.get_ticker_universe(db_path, market='stocks', refresh=True)
+    conn = stkl._open(db_path)
+    conn.execute('UPDATE ticker_universe_snapshots SET snapshot_date = "2020-01-01"')
+    conn.commit()
+    conn.close()
+    # error status without count
+    monkeypatch.setattr(dl, '_get_json', lambda url: {'status': 'ERROR', 'error': 'x'})
+    universe = dl.get_ticker_universe(db_path, market='stocks', refresh=True)
+    assert len(universe) == st.UNIVERSE_SIZE
+    assert stkl.get_db_ticker_universe_date(db_path, 'stocks') == "2020-01-01"
+
+
+def test_rate_limit_per_account_type(monkeypatch):
+    monkeypatch.setattr(dl, 'POLYGON_RATE_LIMIT', 100.0)
+    monkeypatch.setattr(dl, 'POLYGON_RATE_LIMITS', {'paper': 5/60})
+    monkeypatch.setenv('POLYGON_RATE_LIMIT_MARKET', '20')
+    assert dl.polygon_rate_limit('paper') == 5/60
+    assert dl.polygon_rate_limit('market') == 20.0
+    assert dl.polygon_rate_limit('other') == 100.0
+    assert dl.polygon_rate_limit() == 100.0
+
+
+def test_iter_ticker_raises_on_error_status(standin, monkeypatch):
+    standin()
+    get_json = dl._get_json
+    def failing(url):
+        jsn = get_json(url)
+        if '2020-03-09' in url:
+            return {'status': 'ERROR', 'error': 'Internal error'}
+        return jsn
+    monkeypatch.setattr(dl, '_get_json', failing)
+    chunks = dl.iter_ticker_polygon('T000', 'paper', 1, '2020-03-02', '2020-03-13', 7)
+    first = next(chunks)
+    assert first.index.max().date() <= datetime.date(2020, 3, 8)
+    with pytest.raises(rs.ProviderUnavailable, match="ERROR"):
+        next(chunks)
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    backoff = rs.Backoff
+    monkeypatch.setattr(rs, 'Backoff', lambda: backoff(base=0.01))
+
+
+def test_many_retries_rate_limited_tickers(standin, fast_backoff, monkeypatch):
+    standin()
+    get_json, limited = dl._get_json, []
+    def rate_limited_once(url):
+        ticker = url.split('/ticker/')[1].split('/')[0]
+        if ticker in ('T001', 'T004') and ticker not in limited:
+            limited.append(ticker)
+            raise rs.RateLimited("429", retry_after=0)
+        return get_json(url)
+    monkeypatch.setattr(dl, '_get_json', rate_limited_once)
+    tickers = ['T{:03d}'.format(i) for i in range(6)]
+    frames = dl.get_tickers_polygon_many(tickers, 'paper', 1, '2020-03-05', '2020-03-05',
+                                         workers=3, rate=1000)
+    assert list(frames) == tickers
+    assert all(not frames[tk].empty for tk in tickers)
+    assert sorted(limited) == ['T001', 'T004']
+
+
+def test_many_leaves_out_tickers_given_up_on(standin, fast_backoff):
+    standin(p_429=1.0, retry_after=0)
+    frames = dl.get_tickers_polygon_many(['T000', 'T001'], 'paper', 1, '2020-03-05',
+                                         '2020-03-05', rate=1000, attempts=2)
+    assert frames == {}
+    assert rs.get_breaker("polygon").failures_in_row() == 4
+
+
+def _bar(minute, close):
+    '''aggregates result of minute (epoch ms) with close price'''
+    return {'t': 1583418600000 + minute*60000, 'o': close, 'h': close, 'l': close,
+            'c': close, 'v': 100}
+
+
+def test_minute_buffer_wraps_past_capacity():
+    buf = dl.MinuteBarBuffer('AAA', 'paper', capacity=3)
+    for minute in range(5):
+        bar = _bar(minute, 10.0 + minute)
+        buf.append(bar['t'], [bar['o'], bar['h'], bar['l'], bar['c'], bar['v']])
+    assert len(buf) == 3
+    assert [buf.get(i) for i in range(3)] == [12.0, 13.0, 14.0]
+    assert buf.get(-1) == 14.0 and buf.get(-3) == 12.0
+    assert buf.frame()['close'].tolist() == [12.0, 13.0, 14.0]
+    with pytest.raises(IndexError):
+        buf.get(-4)
+
+
+def test_minute_buffer_replaces_same_minute():
+    buf = dl.MinuteBarBuffer('AAA', 'paper', capacity=3)
+    for minute, close in [(0, 10.0), (1, 11.0), (1, 11.5), (0, 9.0)]:
+        bar = _bar(minute, close)
+        buf.append(bar['t'], [bar['o'], bar['h'], bar['l'], bar['c'], bar['v']])
+    # forming minute replaced, older minute ignored
+    assert len(buf) == 2
+    assert [buf.get(0), buf.get(1)] == [10.0, 11.5]
+
+
+def test_chg_price_reads_new_minutes_from_buffer(monkeypatch):
+    monkeypatch.setattr(dl, 'POLYGON_API_KEY', 'x')
+    monkeypatch.setattr(dl, '_live_buffers', {})
+    urls = []
+    answers = [[_bar(m, 100.0 + m) for m in range(5)], [_bar(4, 105.0), _bar(5, 110.0)]]
+    def fake_json(url):
+        urls.append(url)
+        return {'status': 'OK', 'results': answers[len(urls) - 1]}
+    monkeypatch.setattr(dl, '_get_json', fake_json)
+    assert dl.get_chg_price('AAA', 3, 'paper') == pytest.approx((102.0, 104.0, 2/102))
+    prev, cur, chg = dl.get_chg_price('AAA', 3, 'paper')
+    # second call requests from last cached minute only
+    assert "/{}/".format(_bar(4, 0)['t']) in urls[1]
+    assert (prev, cur) == (103.0, 110.0)
+    buf = dl.get_live_buffer('AAA', 'paper')
+    # re-requested forming minute replaced
+    assert len(buf) == 6 and buf.get(-2) == 105.0
+
+
+def test_last_trades_batched_and_cached(standin, monkeypatch):
+    srv = standin()
+    monkeypatch.setattr(dl, '_last_trades', {})
+    monkeypatch.setattr(dl, 'SNAPSHOT_BATCH', 2)
+    tickers = ['T000', 'T001', 'T002', 'T000']
+    prices = dl.get_last_trades_polygon(tickers, 'paper')
+    assert list(prices.index) == tickers and prices.notna().all()
+    assert prices['T000'].tolist() == [prices.iloc[0]] * 2
+    # duplicates requested once, SNAPSHOT_BATCH tickers per request
+    assert srv.stats['requests'] == 2
+    # fresh prices served from micro-cache, new ticker requested alone
+    again = dl.get_last_trades_polygon(['T001', 'T003'], 'paper')
+    assert again['T001'] == prices['T001'] and srv.stats['requests'] == 3
+    assert dl.get_last_trade_polygon('T002', 'paper', max_age=60) == prices['T002']
+    assert srv.stats['requests'] == 3
+
+
+def test_last_trades_expire_after_max_age(standin, monkeypatch):
+    srv = standin()
+    monkeypatch.setattr(dl, '_last_trades', {})
+    dl.get_last_trades_polygon(['T000'], 'paper', max_age=1.0)
+    monotonic = dl.time.monotonic
+    monkeypatch.setattr(dl.time, 'monotonic', lambda: monotonic() + 2)
+    dl.get_last_trades_polygon(['T000'], 'paper', max_age=1.0)
+    assert srv.stats['requests'] == 2
+    # single ticker lookup requests by default (max_age=0)
+    dl.get_last_trade_polygon('T000', 'paper')
+    assert srv.stats['requests'] == 3
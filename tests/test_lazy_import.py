@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of lazy_import
+
+@author: vyachez
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import lazy_import as li
+
+
+@pytest.fixture
+def probe(tmp_path, monkeypatch):
+    '''module 'lazy_probe' recording its imports to lazy_probe_log.loads'''
+    (tmp_path / "lazy_probe_log.py").write_text("loads = []\n")
+    (tmp_path / "lazy_probe.py").write_text("import lazy_probe_log\n"
+                                            "lazy_probe_log.loads.append(1)\n"
+                                            "value = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ("lazy_probe", "lazy_probe_log"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import lazy_probe_log
+    return lazy_probe_log.loads
+
+
+def test_module_imported_on_first_use_once(probe):
+    mod = li.lazy_module("lazy_probe")
+    assert probe == [] and "not loaded" in repr(mod)
+    assert mod.value == 42 and mod.value == 42
+    assert probe == [1] and "(loaded)" in repr(mod)
+
+
+def test_reload_mode_reloads_on_first_use(probe, monkeypatch):
+    import lazy_probe
+    monkeypatch.setattr(li, 'RELOAD', True)
+    mod = li.lazy_module("lazy_probe")
+    assert mod.value == 42 and mod.value == 42
+    # imported above, reloaded once on first use
+    assert probe == [1, 1]
+
+
+def test_missing_module_fails_on_use_only():
+    mod = li.lazy_module("strack_no_such_module")
+    with pytest.raises(ImportError):
+        mod.anything
+
+
+def test_analytics_import_skips_network_stack():
+    code = "import sys, basic_analytics; "+\
+        "print(sorted(m for m in ('requests', 'stock_collector', 'data_loader', "+\
+        "'strack_utils', 'strack_delivery') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(li.__file__)), check=True)
+    assert out.stdout.strip() == "[]"
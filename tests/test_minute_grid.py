@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of minute_grid cache
+
+@author: vyachez
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import basic_analytics as ba
+import minute_grid as mg
+import sql_utils as stkl
+from conftest import make_intraday_df
+
+DAYS = ['2024-01-02', '2024-01-03']
+
+
+@pytest.fixture
+def grid(tmp_path, db_path):
+    '''grid of full sessions of 'AAA' on both days, 'B/B' on first day only,
+    plus pre-market minute outside of grid'''
+    df = pd.concat([make_intraday_df(['AAA'], DAYS, minutes=390),
+                    make_intraday_df(['B/B'], DAYS[:1], minutes=390, seed=1)])
+    early = df.iloc[:1].copy()
+    early.index = pd.DatetimeIndex(['2024-01-02 08:00'], name='time')
+    stkl.rec_db_intraday_df(db_path, pd.concat([df, early]))
+    return mg.build_minute_grid(db_path, str(tmp_path / "grid")), df
+
+
+def test_grid_values_match_intraday_table(grid):
+    grid, df = grid
+    assert grid.tickers == ['AAA', 'B/B'] and 'B/B' in grid and 'CCC' not in grid
+    assert grid['AAA'].shape == (2, 390, 5)
+    expected = df[df['ticker'] == 'AAA'].loc['2024-01-03 15:59']
+    assert grid.value('AAA', '2024-01-03', '15:59', 'close') == expected['close']
+    assert grid['AAA'][grid.day_index(datetime.date(2024, 1, 3)),
+                       grid.minute_index(datetime.time(15, 59)), mg.CLOSE] == expected['close']
+    first = df[df['ticker'] == 'AAA'].loc['2024-01-02 09:30']
+    assert grid.day('AAA', '2024-01-02')[0].tolist() == \
+        first[mg.FIELDS].astype(float).tolist()
+
+
+def test_grid_missing_days_are_nan(grid):
+    grid, df = grid
+    assert np.isnan(grid.day('B/B', '2024-01-03')).all()
+    assert not np.isnan(grid.day('B/B', '2024-01-02')).any()
+
+
+def test_grid_lookup_bounds(grid):
+    grid, df = grid
+    assert mg.MinuteGrid.minute_index("09:30") == 0
+    assert mg.MinuteGrid.minute_index("15:59") == 389
+    for minute in ["08:00", "16:00"]:
+        with pytest.raises(KeyError):
+            mg.MinuteGrid.minute_index(minute)
+    with pytest.raises(KeyError):
+        grid.day_index('2024-01-04')
+
+
+def test_grid_reopened_and_used_by_analytics(grid, tmp_path):
+    grid, df = grid
+    reopened = mg.MinuteGrid(str(tmp_path / "grid"))
+    assert list(reopened.days) == list(grid.days)
+    day = datetime.date(2024, 1, 3)
+    assert ba.ohcl_day(reopened, 'AAA', day) == ba.ohcl_day(df, 'AAA', day)
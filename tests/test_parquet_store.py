@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of parquet_store backend selection and parity with sql_utils
+
+@author: vyachez
+"""
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+import basic_analytics as ba
+import parquet_store as pqs
+import sql_utils as stkl
+import storage_backend as sb
+from conftest import make_intraday_df
+
+DAY = datetime.date(2024, 1, 2)
+
+
+@pytest.fixture
+def session_df():
+    '''full 9:30 - 15:59 session of two tickers'''
+    return make_intraday_df(['AAA', 'BBB'], [str(DAY)], minutes=390)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    '''restores storage backend after test'''
+    monkeypatch.setattr(sb, 'STORAGE_BACKEND', None)
+    return sb.set_storage_backend
+
+
+def test_backend_switched_at_runtime(backend, monkeypatch):
+    monkeypatch.delenv('STRACK_STORAGE', raising=False)
+    assert sb.storage() is stkl
+    backend("parquet")
+    assert sb.storage() is pqs
+    backend(None)
+    monkeypatch.setenv('STRACK_STORAGE', 'parquet')
+    assert sb.storage() is pqs
+    with pytest.raises(ValueError):
+        backend("csv")
+
+
+def test_analytics_daily_lookups_use_backend(tmp_path, db_path, session_df, backend):
+    stkl.rec_db_intraday_df(db_path, session_df)
+    store = str(tmp_path / "store")
+    pqs.rec_db_intraday_df(store, session_df)
+    backend("sqlite")
+    expected = ba.ohcl_day(db_path, 'AAA', DAY), ba.avg_vol_day(db_path, 'AAA', DAY)
+    assert expected[0] == ba.ohcl_day(session_df, 'AAA', DAY)
+    backend("parquet")
+    assert (ba.ohcl_day(store, 'AAA', DAY), ba.avg_vol_day(store, 'AAA', DAY)) == expected
+    assert ba.ohcl_day(pqs.Database(store), 'AAA', DAY) == expected[0]
+
+
+def test_analytics_lookups_skip_collectors(db_path, session_df):
+    stkl.rec_db_intraday_df(db_path, session_df)
+    code = "import sys, datetime, basic_analytics as ba; "+\
+        "ba.ohcl_day({!r}, 'AAA', datetime.date(2024, 1, 2)); ".format(db_path)+\
+        "print(sorted(m for m in ('requests', 'stock_collector', 'data_loader') "+\
+        "if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(ba.__file__)), check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_summary_matches_sqlite(tmp_path, db_path, session_df):
+    stkl.rec_db_intraday_df(db_path, session_df)
+    store = str(tmp_path / "store")
+    pqs.rec_db_intraday_df(store, session_df)
+    assert pqs.get_db_daily_summary(store, 'BBB', DAY) == \
+        pytest.approx(stkl.get_db_daily_summary(db_path, 'BBB', DAY))
+    assert pqs.get_db_daily_summary(store, 'BBB', datetime.date(2024, 1, 3)) == None
+
+
+@pytest.fixture
+def stores(tmp_path, db_path):
+    '''sqlite database and Parquet store holding same three days of two tickers'''
+    df = make_intraday_df(['AAA', 'B/B'], ['2024-01-02', '2024-01-03', '2024-01-04'],
+                          minutes=30)
+    stkl.rec_db_intraday_df(db_path, df)
+    store = str(tmp_path / "store")
+    pqs.rec_db_intraday_df(store, df)
+    return db_path, store
+
+
+def assert_same_data(db_path, store):
+    expected = stkl.query_intraday(db_path)
+    actual = pqs.query_intraday(store)
+    assert list(actual.index) == list(expected.index)
+    assert list(actual['ticker']) == list(expected['ticker'])
+    assert actual['close'].tolist() == pytest.approx(expected['close'].tolist())
+
+
+@pytest.mark.parametrize('name, args', [
+    ('delete_db_intraday_date', [datetime.date(2024, 1, 3)]),
+    ('delete_db_intraday_date', [datetime.date(2024, 1, 5)]),
+    ('delete_db_intraday_range', ['2024-01-03', '2024-01-04 09:40']),
+    ('delete_db_intraday_range', [datetime.datetime(2024, 1, 2, 9, 45), None, ['AAA']]),
+    ('delete_db_intraday_ticker', ['B/B']),
+    ('delete_db_intraday_ticker', ['AAA', '2024-01-03', None]),
+    ('apply_intraday_retention', [1, datetime.date(2024, 1, 4)]),
+])
+def test_deletes_match_sqlite(stores, name, args):
+    db_path, store = stores
+    expected = getattr(stkl, name)(db_path, *args)
+    assert getattr(pqs, name)(store, *args) == expected
+    assert_same_data(db_path, store)
+    assert pqs.get_db_intraday_coverage(store).values.tolist() == \
+        stkl.get_db_intraday_coverage(db_path).values.tolist()
+
+
+def test_vacuum_is_noop(stores):
+    assert pqs.vacuum_db(stores[1]) == 0
+
+
+@pytest.mark.parametrize('name', ['query_daily_bars', 'rec_db_daily_bars_df',
+                                  'partition_intraday_monthly'])
+def test_missing_features_fail_clearly(tmp_path, name):
+    with pytest.raises(NotImplementedError, match="Parquet"):
+        getattr(pqs, name)(str(tmp_path))
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'tickers': 'B/B'},
+                                    {'start': '2024-01-03', 'end': datetime.date(2024, 1, 3)},
+                                    {'tickers': ['AAA', 'ZZZ'], 'end': '2024-01-02'}])
+def test_coverage_matches_sqlite(stores, kwargs):
+    db_path, store = stores
+    assert pqs.get_db_intraday_coverage(store, **kwargs).values.tolist() == \
+        stkl.get_db_intraday_coverage(db_path, **kwargs).values.tolist()
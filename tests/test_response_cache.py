@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of response_cache
+
+@author: vyachez
+"""
+import os
+import datetime
+
+import response_cache as rc
+
+JSN = {'ticker': 'AAA', 'results': [{'t': 1, 'c': 1.0}]}
+
+
+def _stored_at(cache, end_date, when):
+    '''puts entry and sets its store time to 'when' (epoch seconds)'''
+    cache.put('AAA', 1, '2024-01-02', end_date, JSN)
+    path = cache.path('AAA', 1, '2024-01-02', end_date)
+    os.utime(path, (when, when))
+
+
+def test_entry_stored_after_close_is_final(tmp_path):
+    cache = rc.ResponseCache(str(tmp_path), today_ttl=0)
+    _stored_at(cache, '2024-01-03', rc._session_close('2024-01-03') + 1)
+    assert cache.get('AAA', 1, '2024-01-02', '2024-01-03') == JSN
+
+
+def test_entry_stored_during_session_expires_at_close(tmp_path, monkeypatch):
+    cache = rc.ResponseCache(str(tmp_path), today_ttl=300)
+    close = rc._session_close('2024-01-03')
+    _stored_at(cache, '2024-01-03', close - 3600)
+    # within ttl before close
+    monkeypatch.setattr(rc.time, 'time', lambda: close - 3500)
+    assert cache.get('AAA', 1, '2024-01-02', '2024-01-03') == JSN
+    # past ttl
+    monkeypatch.setattr(rc.time, 'time', lambda: close - 3000)
+    assert cache.get('AAA', 1, '2024-01-02', '2024-01-03') == None
+    # session closed - partial day is never final
+    _stored_at(cache, '2024-01-03', close - 10)
+    monkeypatch.setattr(rc.time, 'time', lambda: close + 86400)
+    assert cache.get('AAA', 1, '2024-01-02', '2024-01-03') == None
+
+
+def test_session_close_is_new_york_time():
+    close = datetime.datetime.fromtimestamp(rc._session_close(datetime.date(2024, 7, 1)),
+                                            datetime.timezone.utc)
+    assert close == datetime.datetime(2024, 7, 2, 0, 0, tzinfo=datetime.timezone.utc)
+
+
+def test_size_tracked_without_rescans(tmp_path, monkeypatch):
+    cache = rc.ResponseCache(str(tmp_path))
+    cache.put('AAA', 1, '2024-01-02', '2024-01-03', JSN)
+    scans = []
+    scandir = rc.os.scandir
+    monkeypatch.setattr(rc.os, 'scandir', lambda p: scans.append(p) or scandir(p))
+    cache.put('BBB', 1, '2024-01-02', '2024-01-03', JSN)
+    cache.put('BBB', 1, '2024-01-02', '2024-01-03', JSN)
+    assert scans == []
+    assert cache._size == cache.size()
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = rc.ResponseCache(str(tmp_path))
+    for i, tk in enumerate(['AAA', 'BBB', 'CCC']):
+        cache.put(tk, 1, '2024-01-02', '2024-01-03', JSN)
+        os.utime(cache.path(tk, 1, '2024-01-02', '2024-01-03'), (1000 + i, 1000 + i))
+    cache.max_bytes = cache.size() - 1
+    cache.put('DDD', 1, '2024-01-02', '2024-01-03', JSN)
+    assert not os.path.exists(cache.path('AAA', 1, '2024-01-02', '2024-01-03'))
+    assert os.path.exists(cache.path('DDD', 1, '2024-01-02', '2024-01-03'))
+    assert cache._size == cache.size() <= cache.max_bytes
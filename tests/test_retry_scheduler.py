@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of retry_scheduler
+
+@author: vyachez
+"""
+import pytest
+
+import retry_scheduler as rs
+
+
+class Clock():
+    '''fake time.monotonic() / time.sleep() of retry_scheduler'''
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rs.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rs.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_backoff_grows_to_cap_within_jitter():
+    backoff = rs.Backoff(base=1.0, factor=2.0, max_wait=10.0, jitter=0.5)
+    for attempt, cap in [(0, 1.0), (1, 2.0), (3, 8.0), (10, 10.0)]:
+        for _ in range(50):
+            assert cap * 0.5 <= backoff.delay(attempt) <= cap
+
+
+def test_backoff_honours_retry_after():
+    backoff = rs.Backoff(base=1.0, jitter=0.0)
+    assert backoff.delay(0, retry_after=30) == 30
+    assert backoff.delay(3, retry_after=2) == 8.0
+
+
+def test_retry_after_header():
+    assert rs.retry_after_seconds({'Retry-After': '7'}) == 7.0
+    assert rs.retry_after_seconds({}) == None
+    assert rs.retry_after_seconds({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0.0
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = rs.CircuitBreaker("p", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.retry_in() == 60
+    clock.sleep(60)
+    assert breaker.state == "half-open"
+    # one trial call only
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures_in_row() == 0
+
+
+def test_failed_trial_opens_breaker_again(clock):
+    breaker = rs.CircuitBreaker("p", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.sleep(10)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.retry_in() == 10
+
+
+def test_failed_item_requeued_after_others(clock):
+    calls = []
+    def work(item, provider):
+        calls.append(item)
+        if item == "A" and calls.count("A") == 1:
+            raise rs.RateLimited("429", retry_after=0)
+        return item.lower()
+    scheduler = rs.RetryScheduler(backoff=rs.Backoff(base=0.0, jitter=0.0))
+    assert scheduler.run(["A", "B", "C"], work) == {"A": "a", "B": "b", "C": "c"}
+    assert calls == ["A", "B", "C", "A"]
+
+
+def test_not_due_item_waits_for_backoff(clock):
+    calls = []
+    def work(item, provider):
+        calls.append((item, clock.now))
+        if len(calls) == 1:
+            raise rs.ProviderUnavailable("500")
+        return item
+    scheduler = rs.RetryScheduler(backoff=rs.Backoff(base=5.0, jitter=0.0))
+    scheduler.run(["A"], work)
+    assert calls == [("A", 1000.0), ("A", 1005.0)]
+
+
+def test_gives_up_after_max_attempts(clock):
+    failed = []
+    def work(item, provider):
+        raise rs.BlankData("blank")
+    scheduler = rs.RetryScheduler(max_attempts=3, backoff=rs.Backoff(base=1.0, jitter=0.0))
+    assert scheduler.run(["A"], work, on_fail=lambda item, ex: failed.append(item)) == {}
+    assert failed == ["A"]
+
+
+def test_blank_data_does_not_open_breaker(clock):
+    def work(item, provider):
+        raise rs.BlankData("blank")
+    scheduler = rs.RetryScheduler(max_attempts=10, backoff=rs.Backoff(base=0.0, jitter=0.0))
+    scheduler.run(["A", "B"], work)
+    assert rs.get_breaker("polygon").state == "closed"
+    assert scheduler.pause("polygon") == 0.0
+
+
+def test_provider_errors_open_breaker_and_fail_over(clock):
+    used = []
+    def work(item, provider):
+        used.append(provider)
+        if provider == "polygon":
+            raise rs.ProviderUnavailable("500")
+        return provider
+    scheduler = rs.RetryScheduler(providers=("polygon", "yfinance"), failover_after=2,
+                                  backoff=rs.Backoff(base=0.0, jitter=0.0))
+    rs.get_breaker("polygon", failure_threshold=5)
+    assert scheduler.run(["A", "B", "C"], work) == {"A": "yfinance", "B": "yfinance",
+                                                    "C": "yfinance"}
+    assert rs.get_breaker("polygon").state == "open"
+    # degraded provider is skipped by new items
+    assert scheduler.provider(0) == ("yfinance", 0.0)
+    assert scheduler.pause("polygon") > 0
+
+
+def test_provider_waits_while_trial_in_flight(clock):
+    scheduler = rs.RetryScheduler(providers=("polygon",), poll=0.5)
+    breaker = rs.get_breaker("polygon", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    assert scheduler.provider(0) == ("polygon", 10.0)
+    clock.sleep(10)
+    assert scheduler.provider(0) == ("polygon", 0.0) # trial call
+    # trial in flight - positive wait instead of busy loop
+    assert scheduler.provider(0) == ("polygon", 0.5)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of sql_stats instrumentation
+
+@author: vyachez
+"""
+import pytest
+
+import sql_utils as stkl
+from conftest import make_intraday_df
+
+
+@pytest.fixture
+def stats(db_path):
+    '''database with two days of data, stats cleared'''
+    stkl.rec_db_intraday_df(db_path, make_intraday_df(['AAA', 'BBB'], ['2024-01-02', '2024-01-03']))
+    stkl.stats.reset()
+    yield stkl.stats
+    stkl.stats.reset()
+
+
+def test_nested_calls_not_recorded(db_path, stats):
+    assert len(stkl.get_db_intraday_all(db_path)) == 20
+    assert stkl.delete_db_intraday_ticker(db_path, 'AAA') == 10
+    summary = stats.summary()
+    assert sorted(summary.index) == ['delete_db_intraday_ticker', 'get_db_intraday_all']
+    assert summary.loc['get_db_intraday_all', 'rows'] == 20
+    assert summary.loc['delete_db_intraday_ticker', 'rows'] == 10
+
+
+def test_nested_generator_steps_not_recorded(db_path, stats):
+    frames = list(stkl.iter_db_intraday(db_path, by='day'))
+    assert stats.summary().loc['iter_db_intraday', 'rows'] == sum(len(f) for f in frames)
+
+
+def test_freed_pages_not_counted_as_rows(db_path, stats):
+    stkl.delete_db_intraday_range(db_path, end='2024-01-02', vacuum=False)
+    stats.reset()
+    stkl.vacuum_db(db_path)
+    assert stats.summary().loc['vacuum_db', 'rows'] == 0
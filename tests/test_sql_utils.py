@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of sql_utils
+
+@author: vyachez
+"""
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_utils as stkl
+from conftest import make_intraday_df
+
+
+def _count(db_path, table):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM {}'.format(table)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_partition_rerun_after_interrupted_copy(db_path, monkeypatch):
+    stkl.create_intraday_table(db_path)
+    df = make_intraday_df(['AAA', 'BBB'], ['2024-01-02', '2024-02-01', '2024-03-01'])
+    stkl.rec_db_intraday_df(db_path, df)
+    # crash while indexing second month
+    sql = stkl.CREATE_PARTITION_TIME_IDX_SQL
+    monkeypatch.setattr(stkl, 'CREATE_PARTITION_TIME_IDX_SQL',
+                        'CREATE INDEX {0}_time_idx ON no_such_table (time)')
+    with pytest.raises(sqlite3.OperationalError):
+        stkl.partition_intraday_monthly(db_path)
+    monkeypatch.setattr(stkl, 'CREATE_PARTITION_TIME_IDX_SQL', sql)
+    # nothing of failed month is left, intraday table is intact
+    assert stkl._partitions(sqlite3.connect(db_path)) == []
+    assert _count(db_path, 'intraday') == len(df)
+    parts = stkl.partition_intraday_monthly(db_path)
+    assert parts == ['intraday_202401', 'intraday_202402', 'intraday_202403']
+    assert _count(db_path, 'intraday') == len(df)
+    assert sum(_count(db_path, p) for p in parts) == len(df)
+
+
+def test_partition_recopies_incomplete_partition(db_path):
+    stkl.create_intraday_table(db_path)
+    df = make_intraday_df(['AAA'], ['2024-01-02', '2024-02-01'])
+    stkl.rec_db_intraday_df(db_path, df)
+    # partial partition left by earlier version of conversion
+    conn = sqlite3.connect(db_path)
+    conn.execute(stkl.CREATE_PARTITION_SQL.format('intraday_202402'))
+    conn.commit()
+    conn.close()
+    parts = stkl.partition_intraday_monthly(db_path)
+    assert _count(db_path, 'intraday_202402') == 5
+    assert sum(_count(db_path, p) for p in parts) == len(df)
+
+
+def _make_v1_db(db_path, df):
+    '''writes df to legacy v1 intraday table (text time and ticker)'''
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE intraday (time text, open real, high real, low real, '+\
+                 'close real, volume real, ticker text)')
+    df.to_sql('intraday', conn, if_exists='append')
+    conn.commit()
+    conn.close()
+
+
+def test_rec_intraday_creates_schema_of_new_db(db_path):
+    df = make_intraday_df(['AAA', 'BBB'], ['2024-01-02'])
+    counts = stkl.rec_db_intraday_df(db_path, df)
+    assert counts['inserted'] == len(df)
+    assert stkl.get_schema_version(db_path) == stkl.SCHEMA_VERSION
+
+
+def test_rec_intraday_refuses_v1_db(db_path):
+    _make_v1_db(db_path, make_intraday_df(['AAA'], ['2024-01-02']))
+    with pytest.raises(RuntimeError, match="migrate"):
+        stkl.rec_db_intraday_df(db_path, make_intraday_df(['AAA'], ['2024-01-03']))
+
+
+def test_migration_resumes_after_interruption(db_path, monkeypatch):
+    df = make_intraday_df(['AAA', 'BBB'], ['2024-01-02', '2024-01-03'])
+    _make_v1_db(db_path, df)
+    # crash after first committed chunk
+    ticker_ids, calls = stkl._ticker_ids, []
+    def crashing_ticker_ids(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise KeyboardInterrupt()
+        return ticker_ids(*args, **kwargs)
+    monkeypatch.setattr(stkl, '_ticker_ids', crashing_ticker_ids)
+    with pytest.raises(KeyboardInterrupt):
+        stkl.migrate_intraday_v1_to_v2(db_path, chunk_rows=7)
+    monkeypatch.setattr(stkl, '_ticker_ids', ticker_ids)
+    assert stkl.get_schema_version(db_path) == 0
+    assert stkl.migrate_intraday_v1_to_v2(db_path, chunk_rows=7) == len(df) - 7
+    assert stkl.get_schema_version(db_path) == stkl.SCHEMA_VERSION
+    assert _count(db_path, 'intraday') == len(df)
+    assert 'intraday_v1' not in [t[0] for t in stkl.get_tables(db_path)]
+
+
+def test_migration_without_progress_table(db_path):
+    df = make_intraday_df(['AAA'], ['2024-01-02'])
+    _make_v1_db(db_path, df)
+    # state of interrupted migration of earlier version: renamed, no progress mark
+    conn = sqlite3.connect(db_path)
+    conn.execute('ALTER TABLE intraday RENAME TO intraday_v1')
+    conn.commit()
+    conn.close()
+    assert stkl.migrate_intraday_v1_to_v2(db_path) == len(df)
+    assert _count(db_path, 'intraday') == len(df)
+
+
+def test_migration_finished_with_kept_v1(db_path):
+    df = make_intraday_df(['AAA'], ['2024-01-02'])
+    _make_v1_db(db_path, df)
+    assert stkl.migrate_intraday_v1_to_v2(db_path, keep_v1=True) == len(df)
+    assert stkl.migrate_intraday_v1_to_v2(db_path) == 0
+    assert _count(db_path, 'intraday') == len(df)
+
+
+@pytest.mark.parametrize('monthly', [False, True])
+def test_upsert_counts(db_path, monthly):
+    stkl.create_intraday_table(db_path, monthly=monthly)
+    df = make_intraday_df(['AAA', 'BBB'], ['2024-01-31', '2024-02-01'])
+    assert stkl.rec_db_intraday_df(db_path, df) == \
+        {'inserted': 20, 'updated': 0, 'unchanged': 0}
+    assert stkl.rec_db_intraday_df(db_path, df) == \
+        {'inserted': 0, 'updated': 0, 'unchanged': 20}
+    # 2 rows changed, 10 new minutes of stored tickers and days
+    more = make_intraday_df(['AAA', 'BBB'], ['2024-01-31', '2024-02-01'], minutes=10)
+    for i in range(4):
+        more.iloc[i*10:i*10+5] = df.iloc[i*5:i*5+5].values
+    more.iloc[0, 0] += 1
+    more.iloc[10, 0] += 1
+    counts = stkl.rec_db_intraday_df(db_path, more, batch_rows=7)
+    assert counts == {'inserted': 20, 'updated': 2, 'unchanged': 18}
+    assert len(stkl.query_intraday(db_path)) == 40
+
+
+def test_iter_intraday_keeps_float64_by_default(db_path):
+    df = make_intraday_df(['AAA', 'BBB'], ['2024-01-02'])
+    stkl.rec_db_intraday_df(db_path, df)
+    frame = next(stkl.iter_db_intraday(db_path, by='rows'))
+    assert (frame[['open', 'high', 'low', 'close']].dtypes == 'float64').all()
+    assert frame['close'].tolist() == stkl.query_intraday(db_path)['close'].tolist()
+    compact = next(stkl.iter_db_intraday(db_path, by='rows', compact=True))
+    assert (compact[['open', 'close']].dtypes == 'float32').all()
+    assert compact['ticker'].dtype == 'category'
+
+
+def test_delete_date_reports_once_without_vacuum(db_path, monkeypatch, capsys):
+    stkl.rec_db_intraday_df(db_path, make_intraday_df(['AAA', 'BBB'], ['2024-01-02', '2024-01-03']))
+    vacuums = []
+    monkeypatch.setattr(stkl, 'vacuum_db', lambda db: vacuums.append(db))
+    capsys.readouterr()
+    assert stkl.delete_db_intraday_date(db_path, '2024-01-02') == 10
+    assert capsys.readouterr().out.count("Deleted") == 1
+    assert vacuums == []
+    assert stkl.apply_intraday_retention(db_path, 0, today=stkl.datetime.date(2024, 1, 3)) == 10
+    assert len(vacuums) == 1
+
+
+def test_universe_unknown_status_is_not_active(db_path):
+    df = pd.DataFrame({'ticker': ['AAA', 'BBB', 'CCC'], 'name': ['a', 'b', 'c'],
+                       'market': 'STOCKS', 'locale': 'US', 'currency': 'USD',
+                       'active': [True, False, None], 'primaryExch': 'NYE',
+                       'updated': '2024-01-02', 'url': ''})
+    stkl.rec_db_ticker_universe(db_path, df, 'stocks', snapshot_date='2024-01-02')
+    universe = stkl.get_db_ticker_universe(db_path, 'stocks')
+    assert universe['active'].tolist() == [True, False, False]
+    assert set(universe['market']) == {'STOCKS'}
+
+
+@pytest.fixture
+def three_days(db_path):
+    '''10 session minutes of two tickers on three days'''
+    stkl.rec_db_intraday_df(db_path, make_intraday_df(
+        ['AAA', 'BBB'], ['2024-01-02', '2024-01-03', '2024-01-04'], minutes=10))
+    return db_path
+
+
+@pytest.mark.parametrize('start, end, first, last, minutes', [
+    # dates cover whole day
+    (datetime.date(2024, 1, 3), datetime.date(2024, 1, 3),
+     '2024-01-03 09:30', '2024-01-03 09:39', 10),
+    ('2024-01-03', '2024-01-04', '2024-01-03 09:30', '2024-01-04 09:39', 20),
+    # datetimes are exact inclusive minutes
+    (datetime.datetime(2024, 1, 3, 9, 35), datetime.datetime(2024, 1, 4, 9, 31),
+     '2024-01-03 09:35', '2024-01-04 09:31', 7),
+    ('2024-01-02 09:38', '2024-01-02 09:38', '2024-01-02 09:38', '2024-01-02 09:38', 1),
+    (pd.Timestamp('2024-01-04 09:37'), None, '2024-01-04 09:37', '2024-01-04 09:39', 3),
+    (None, '2024-01-02', '2024-01-02 09:30', '2024-01-02 09:39', 10),
+])
+def test_query_intraday_bounds(three_days, start, end, first, last, minutes):
+    df = stkl.query_intraday(three_days, start=start, end=end)
+    assert df.index[0] == pd.Timestamp(first) and df.index[-1] == pd.Timestamp(last)
+    # every minute of both tickers, sorted by time then ticker
+    assert len(df) == 2*minutes
+    assert df['ticker'].tolist()[:2] == ['AAA', 'BBB']
+    assert df.index.is_monotonic_increasing
+
+
+def test_query_intraday_filters(three_days):
+    df = stkl.query_intraday(three_days, tickers='BBB', start='2024-01-03',
+                             columns=['close'])
+    assert list(df.columns) == ['close'] and len(df) == 20
+    assert stkl.query_intraday(three_days, tickers=['ZZZ']).empty
+    assert stkl.query_intraday(three_days, start='2024-01-05').empty
+    with pytest.raises(ValueError):
+        stkl.query_intraday(three_days, columns=['price'])
+
+
+def test_query_intraday_session_only(db_path):
+    index = pd.DatetimeIndex(['2024-01-02 04:00', '2024-01-02 09:29', '2024-01-02 09:30',
+                              '2024-01-02 15:59', '2024-01-02 16:00'], name='time')
+    df = pd.DataFrame({'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 1.0,
+                       'ticker': 'AAA'}, index=index)
+    stkl.rec_db_intraday_df(db_path, df)
+    assert list(stkl.query_intraday(db_path, session_only=True).index) == list(index[2:4])
+    assert len(stkl.query_intraday(db_path)) == 5
+
+
+@pytest.mark.parametrize('monthly', [False, True])
+def test_coverage_counts_minutes_per_ticker_day(db_path, monthly):
+    stkl.create_intraday_table(db_path, monthly=monthly)
+    stkl.rec_db_intraday_df(db_path, pd.concat([
+        make_intraday_df(['AAA', 'BBB'], ['2024-01-31'], minutes=5),
+        make_intraday_df(['AAA'], ['2024-02-01'], minutes=3)]))
+    cov = stkl.get_db_intraday_coverage(db_path)
+    assert cov.values.tolist() == [['AAA', datetime.date(2024, 1, 31), 5],
+                                   ['BBB', datetime.date(2024, 1, 31), 5],
+                                   ['AAA', datetime.date(2024, 2, 1), 3]]
+    cov = stkl.get_db_intraday_coverage(db_path, tickers='AAA', start='2024-02-01')
+    assert cov.values.tolist() == [['AAA', datetime.date(2024, 2, 1), 3]]
+    cov = stkl.get_db_intraday_coverage(db_path, tickers=['BBB'], end=datetime.date(2024, 1, 31))
+    assert cov['minutes'].tolist() == [5]
+    assert stkl.get_db_intraday_coverage(db_path, tickers='ZZZ').empty
+
+
+def test_database_handle_shared_by_calls(db_path, monkeypatch):
+    opened = []
+    open_ = stkl._open
+    monkeypatch.setattr(stkl, '_open', lambda *args: opened.append(args) or open_(*args))
+    with stkl.Database(db_path) as db:
+        stkl.rec_db_intraday_df(db, make_intraday_df(['AAA'], ['2024-01-02']))
+        assert len(stkl.get_db_intraday_ticker(db, 'AAA')) == 5
+        stkl.delete_db_intraday_date(db, datetime.date(2024, 1, 2))
+        # calls keep handle connection open
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert len(opened) == 1 and db.conn == None
+    db.close()
+
+
+def test_database_handle_commits_or_rolls_back(db_path):
+    stkl.create_intraday_table(db_path)
+    with stkl.Database(db_path) as db:
+        db.execute('INSERT INTO tickers (ticker) VALUES (?)', ('AAA',))
+    with pytest.raises(ZeroDivisionError):
+        with stkl.Database(db_path) as db:
+            db.execute('INSERT INTO tickers (ticker) VALUES (?)', ('BBB',))
+            1 / 0
+    conn = sqlite3.connect(db_path)
+    try:
+        assert [r[0] for r in conn.execute('SELECT ticker FROM tickers')] == ['AAA']
+    finally:
+        conn.close()
+
+
+def _summaries(db_path):
+    return stkl.query_daily_summary(db_path).reset_index().values.tolist()
+
+
+def assert_summaries_match_rebuild(db_path):
+    '''stored summaries are same as recalculated from intraday table'''
+    summaries = _summaries(db_path)
+    stkl.rebuild_daily_summary(db_path)
+    rebuilt = _summaries(db_path)
+    assert len(summaries) == len(rebuilt)
+    for row, expected in zip(summaries, rebuilt):
+        assert row[:2] == expected[:2]
+        assert row[2:] == pytest.approx(expected[2:], nan_ok=True)
+
+
+@pytest.mark.parametrize('monthly', [False, True])
+def test_summary_of_new_days_matches_rebuild(db_path, monthly):
+    stkl.create_intraday_table(db_path, monthly=monthly)
+    df = make_intraday_df(['AAA', 'BBB'], ['2024-01-31', '2024-02-01'], minutes=390)
+    df.iloc[3, df.columns.get_loc('volume')] = np.nan
+    early = df.iloc[:2].copy()
+    early.index = pd.DatetimeIndex(['2024-01-31 08:00', '2024-01-31 16:30'], name='time')
+    # ticker-day split between batches
+    stkl.rec_db_intraday_df(db_path, pd.concat([df, early]), batch_rows=500)
+    assert len(_summaries(db_path)) == 4
+    assert_summaries_match_rebuild(db_path)
+
+
+def test_summary_updated_after_overwrite_and_delete(db_path):
+    df = make_intraday_df(['AAA', 'BBB'], ['2024-01-02', '2024-01-03'], minutes=390)
+    stkl.rec_db_intraday_df(db_path, df)
+    # overwrite raises one high of AAA on 2024-01-03, adds pre-market minute
+    changed = df[(df['ticker'] == 'AAA') & (df.index >= '2024-01-03')].copy()
+    changed.iloc[100, changed.columns.get_loc('high')] = 500.0
+    extra = changed.iloc[:1].copy()
+    extra.index = pd.DatetimeIndex(['2024-01-03 09:00'], name='time')
+    counts = stkl.rec_db_intraday_df(db_path, pd.concat([changed, extra]))
+    assert counts == {'inserted': 1, 'updated': 1, 'unchanged': 389}
+    summary = stkl.get_db_daily_summary(db_path, 'AAA', datetime.date(2024, 1, 3))
+    assert summary['high'] == 500.0 and summary['minutes'] == 390
+    # delete of session part recalculates day, whole day delete drops it
+    stkl.delete_db_intraday_range(db_path, '2024-01-03 15:00', '2024-01-03 15:59', 'AAA')
+    summary = stkl.get_db_daily_summary(db_path, 'AAA', datetime.date(2024, 1, 3))
+    assert summary['minutes'] == 330 and summary['close'] == None
+    stkl.delete_db_intraday_date(db_path, datetime.date(2024, 1, 2))
+    assert stkl.get_db_daily_summary(db_path, 'BBB', datetime.date(2024, 1, 2)) == None
+    assert_summaries_match_rebuild(db_path)
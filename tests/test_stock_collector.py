@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of stock_collector
+
+@author: vyachez
+"""
+import datetime
+import json
+import threading
+
+import pytest
+
+import sql_utils as stkl
+import stock_collector as sc
+from conftest import make_intraday_df
+
+DAYS = [datetime.date(2024, 1, 2), datetime.date(2024, 1, 3)]
+
+
+@pytest.fixture
+def bulk_calls(db_path, monkeypatch):
+    '''replaces ticker range download with recorder writing data of
+    tickers in 'complete' (other tickers get first day only)'''
+    calls = []
+    complete = set()
+    def fake_range(unit, ticker, provider):
+        calls.append(ticker)
+        days = DAYS if ticker in complete else DAYS[:1]
+        stkl.rec_db_intraday_df(unit.db_path,
+                                make_intraday_df([ticker], [str(d) for d in days]))
+    monkeypatch.setattr(sc._BulkRange, '__call__', fake_range)
+    stkl.create_intraday_table(db_path)
+    return calls, complete
+
+
+def _collect(tmp_path, db_path, tickers=('AAA', 'BBB')):
+    sc.batch_tickers_collector(list(tickers), None, None, 'paper', str(tmp_path), db_path,
+                               trade_days=DAYS, pause=False)
+    with open(str(tmp_path / 'strack_data' / 'tick_batch_checkpoint.json')) as f:
+        return json.load(f)['units']
+
+
+def test_checkpoint_skips_complete_units_only(tmp_path, db_path, bulk_calls):
+    calls, complete = bulk_calls
+    complete.add('AAA')
+    units = _collect(tmp_path, db_path)
+    assert calls == ['AAA', 'BBB']
+    assert list(units) == [sc._unit_key('AAA', DAYS)]
+    # rerun collects only unit with missing dates
+    complete.add('BBB')
+    units = _collect(tmp_path, db_path)
+    assert calls == ['AAA', 'BBB', 'BBB']
+    assert sorted(units) == [sc._unit_key('AAA', DAYS), sc._unit_key('BBB', DAYS)]
+
+
+def test_checkpoint_with_missing_dates_is_pending(tmp_path, db_path, bulk_calls):
+    calls, complete = bulk_calls
+    complete.update(['AAA', 'BBB'])
+    # checkpoint of earlier version - incomplete unit recorded as done
+    sc._save_checkpoint(str(tmp_path / 'strack_data' / 'tick_batch_checkpoint.json'),
+                        {'db_path': db_path,
+                         'units': {sc._unit_key('AAA', DAYS): {'missing': []},
+                                   sc._unit_key('BBB', DAYS): {'missing': [str(DAYS[1])]}}})
+    _collect(tmp_path, db_path)
+    assert calls == ['BBB']
+
+
+def test_batch_failed_ticker_moves_to_end(tmp_path, db_path, bulk_calls, monkeypatch):
+    calls, complete = bulk_calls
+    complete.update(['AAA', 'BBB', 'CCC'])
+    fake_range = sc._BulkRange.__call__
+    def rate_limited_once(unit, ticker, provider):
+        if ticker == 'AAA' and 'AAA' not in calls:
+            calls.append('AAA')
+            raise sc.rs.RateLimited("429", retry_after=0)
+        return fake_range(unit, ticker, provider)
+    monkeypatch.setattr(sc._BulkRange, '__call__', rate_limited_once)
+    backoff = sc.rs.Backoff
+    monkeypatch.setattr(sc.rs, 'Backoff', lambda: backoff(base=0.01))
+    units = _collect(tmp_path, db_path, ['AAA', 'BBB', 'CCC'])
+    assert calls == ['AAA', 'BBB', 'CCC', 'AAA']
+    assert len(units) == 3
+
+
+def test_batch_unexpected_error_raises(tmp_path, db_path, bulk_calls, monkeypatch):
+    coverage = sc._coverage
+    calls = []
+    def broken_after_resume(*args):
+        calls.append(args)
+        if len(calls) > 1:
+            raise OSError("disk full")
+        return coverage(*args)
+    monkeypatch.setattr(sc, '_coverage', broken_after_resume)
+    with pytest.raises(OSError, match="disk full"):
+        _collect(tmp_path, db_path)
+    assert (tmp_path / 'strack_data' / 'tick_batch_load_log.csv').exists()
+
+
+def test_async_engine_writes_tickers_as_they_complete(db_path, standin, capsys):
+    standin(p_empty=0.3, seed=3)
+    tickers = ['T{:03d}'.format(i) for i in range(20)]
+    day = datetime.date(2020, 3, 5)
+    assert sc.get_stock(tickers, day, wait=0, db_path=db_path, acc_type='paper',
+                        engine='async', rate=1000) == None
+    out = capsys.readouterr().out
+    empty = [tk for tk in tickers if "No {} ticker data".format(tk) in out]
+    written = set(stkl.query_intraday(db_path)['ticker'])
+    assert 0 < len(empty) < len(tickers)
+    assert written == set(tickers) - set(empty)
+
+
+def test_strict_blanks_do_not_open_breaker(db_path, standin, monkeypatch):
+    standin(p_empty=1.0)
+    backoff = sc.rs.Backoff
+    monkeypatch.setattr(sc.rs, 'Backoff', lambda: backoff(base=0.01))
+    tickers = ['T{:03d}'.format(i) for i in range(6)]
+    sc.get_stock(tickers, datetime.date(2020, 3, 5), wait=0, db_path=db_path,
+                 acc_type='paper', strict=True, attempts=3, engine='async', rate=1000)
+    assert sc.rs.get_breaker("polygon").state == "closed"
+    assert sc.rs.get_breaker("polygon").failures_in_row() == 0
+
+
+def test_async_engine_inside_running_loop(db_path, standin):
+    standin()
+    async def notebook_cell():
+        return sc.get_stock(['T000', 'T001'], datetime.date(2020, 3, 5), wait=0,
+                            acc_type='paper', engine='async', rate=1000)
+    df = sc.asyncio.run(notebook_cell())
+    assert set(df['ticker']) == {'T000', 'T001'}
+
+
+def test_async_engine_without_account_raises():
+    with pytest.raises(ValueError):
+        sc.get_stock(['T000'], datetime.date(2020, 3, 5), engine='async')
+
+
+def test_bulk_retries_failed_sub_range(db_path, standin, monkeypatch):
+    standin()
+    get_json, failed = sc.dl._get_json, []
+    def failing_once(url):
+        if '2020-03-09' in url and len(failed) == 0:
+            failed.append(url)
+            return {'status': 'ERROR', 'error': 'Internal error'}
+        return get_json(url)
+    monkeypatch.setattr(sc.dl, '_get_json', failing_once)
+    monkeypatch.setattr(sc.rs.time, 'sleep', lambda s: None)
+    df = sc.get_stock_bulk('T000', datetime.date(2020, 3, 2), datetime.date(2020, 3, 13),
+                           acc_type='paper', chunk_days=7)
+    assert len(failed) == 1
+    assert sorted(set(df.index.date)) == [datetime.date(2020, 3, d)
+                                          for d in (2, 3, 4, 5, 6, 9, 10, 11, 12, 13)]
+
+
+def test_daily_non_trading_day_not_retried(db_path, standin, capsys):
+    srv = standin(p_empty=1.0)
+    sc.get_stock_daily([datetime.date(2020, 3, 5)], 'paper', db_path=db_path, wait=0.01)
+    out = capsys.readouterr().out
+    assert "non-trading day" in out and "Retrying" not in out
+    assert "I could not" not in out and "No daily bars for 2020-03-05\n" not in out
+
+
+def test_daily_collects_bars(db_path, standin):
+    standin()
+    sc.get_stock_daily([datetime.date(2020, 3, 5)], 'paper', tickers=['T0000', 'T0001'],
+                       db_path=db_path)
+    assert sorted(stkl.query_daily_bars(db_path)['ticker']) == ['T0000', 'T0001']
+
+
+def test_daily_rejects_non_sqlite_db_path(tmp_path):
+    with pytest.raises(ValueError, match="sqlite"):
+        sc.get_stock_daily([datetime.date(2020, 3, 5)], 'paper', db_path=str(tmp_path))
+    store = tmp_path / "bars.parquet"
+    store.write_bytes(b"PAR1")
+    with pytest.raises(ValueError, match="sqlite"):
+        sc.get_stock_daily([datetime.date(2020, 3, 5)], 'paper', db_path=str(store))
+
+
+def test_sync_engine_paced_by_rate_not_fixed_sleeps(db_path, standin, monkeypatch):
+    standin()
+    sleeps = []
+    monkeypatch.setattr(sc.time, 'sleep', lambda s: sleeps.append(s))
+    tickers = ['T{:03d}'.format(i) for i in range(4)]
+    sc.get_stock(tickers, datetime.date(2020, 3, 5), db_path=db_path, acc_type='paper',
+                 rate=2)
+    assert set(stkl.query_intraday(db_path)['ticker']) == set(tickers)
+    # token bucket of 2 requests per second (sleeps are not waited here,
+    # so pacing delays add up) - no 10 second sleeps before requests
+    assert len(sleeps) == 3 and 0 < max(sleeps) <= 1.5
+
+
+def test_sync_engine_retries_without_fixed_sleep(db_path, standin, monkeypatch):
+    standin()
+    get_json, limited = sc.dl._get_json, []
+    def rate_limited_once(url):
+        if len(limited) == 0:
+            limited.append(url)
+            raise sc.rs.RateLimited("429", retry_after=0)
+        return get_json(url)
+    monkeypatch.setattr(sc.dl, '_get_json', rate_limited_once)
+    backoff = sc.rs.Backoff
+    monkeypatch.setattr(sc.rs, 'Backoff', lambda: backoff(base=0.01))
+    st = sc.time.perf_counter()
+    sc.get_stock(['T000', 'T001'], datetime.date(2020, 3, 5), db_path=db_path,
+                 acc_type='paper', rate=1000)
+    assert sc.time.perf_counter() - st < 2
+    assert set(stkl.query_intraday(db_path)['ticker']) == {'T000', 'T001'}
+
+
+def test_async_engine_writes_off_event_loop(db_path, standin, monkeypatch):
+    standin()
+    flush, threads = sc._DayWriter.flush, []
+    def recording_flush(writer):
+        threads.append(threading.get_ident())
+        return flush(writer)
+    monkeypatch.setattr(sc._DayWriter, 'flush', recording_flush)
+    tickers = ['T{:03d}'.format(i) for i in range(6)]
+    sc.get_stock(tickers, datetime.date(2020, 3, 5), db_path=db_path, acc_type='paper',
+                 engine='async', rate=1000)
+    # one writer thread, not the thread running event loop
+    assert len(threads) == len(tickers) + 1
+    assert len(set(threads)) == 1 and threads[0] != threading.get_ident()
+    assert set(stkl.query_intraday(db_path)['ticker']) == set(tickers)